@@ -23,6 +23,7 @@
 import os
 import sys
 
+from maya.OpenMaya import MGlobal
 from maya.OpenMayaMPx import *
 import maya.mel as mel
 
@@ -47,12 +48,26 @@ def initializePlugin(oPlugin):
 	os.environ["NIMBLE_TOOLS_INSTALL"] = installPath
 	
 	import ns.maya.uninstancer.UninstancerCmd as UninstancerCmd
+	import ns.maya.uninstancer.PointCacheNode as PointCacheNode
+	
+	try:
+		fPlugin.registerNode( PointCacheNode.kPluginNodeName,
+							  PointCacheNode.kPluginNodeId,
+							  PointCacheNode.nodeCreator,
+							  PointCacheNode.nodeInitializer,
+							  MPxNode.kDeformerNode )
+	except:
+		sys.stderr.write( "Failed to register node: %s\n" % PointCacheNode.kPluginNodeName )
+		raise
 	
 	try:
 		fPlugin.registerCommand( UninstancerCmd.kPluginCmdName,
 								 UninstancerCmd.cmdCreator,
 								 UninstancerCmd.syntaxCreator )
-		mel.eval("nsNimbleToolsCreateUI")
+		# mayapy and batch Maya have no UI to add to.
+		#
+		if MGlobal.mayaState() == MGlobal.kInteractive:
+			mel.eval("nsNimbleToolsCreateUI")
 	except:
 		sys.stderr.write( "Failed to register command: %s\n" % UninstancerCmd.kPluginCmdName )
 		raise
@@ -60,9 +75,20 @@ def initializePlugin(oPlugin):
 # Uninitialize the script plug-in
 def uninitializePlugin(oPlugin):
 	fPlugin = MFnPlugin(oPlugin)
+	
+	import ns.maya.uninstancer.UninstancerCmd as UninstancerCmd
+	import ns.maya.uninstancer.PointCacheNode as PointCacheNode
+	
+	try:
+		fPlugin.deregisterNode( PointCacheNode.kPluginNodeId )
+	except:
+		sys.stderr.write( "Failed to unregister node: %s\n" % PointCacheNode.kPluginNodeName )
+		raise
+	
 	try:
 		fPlugin.deregisterCommand( UninstancerCmd.kPluginCmdName )
-		mel.eval("nsNimbleToolsDeleteUI")
+		if MGlobal.mayaState() == MGlobal.kInteractive:
+			mel.eval("nsNimbleToolsDeleteUI")
 	except:
 		sys.stderr.write( "Failed to unregister command: %s\n" % UninstancerCmd.kPluginCmdName )
 		raise
\ No newline at end of file
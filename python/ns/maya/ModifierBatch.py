@@ -0,0 +1,119 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import sys
+
+from maya.OpenMaya import *
+from maya.OpenMayaAnim import *
+
+import ns.maya as nsm
+
+
+# Number of operations queued before the batch commits itself.
+#
+kDefaultBatchSize = 1000
+
+class ModifierBatch:
+	'''Queues DAG/DG modifications made over a whole bake and commits them
+	   in groups through a single MDagModifier. Committing one modifier per
+	   node triggers DG bookkeeping for every duplicate; grouping them lets
+	   Maya do that work once per batch.
+	   
+	   Nodes queued on the batch don't exist in their final state until the
+	   batch is committed - MDagPaths to reparented nodes are refreshed and
+	   transform values are set at that point. Anything that needs the
+	   queued nodes to be complete (e.g. adding keys to a queued anim
+	   curve) should call commit() first.'''
+	
+	def __init__( self, batchSize=kDefaultBatchSize ):
+		# A batchSize of 0 or less commits only when asked to.
+		#
+		self._batchSize = batchSize
+		self._modifier = MDagModifier()
+		self._numOps = 0
+		self._numCommits = 0
+		self._reparented = []
+		self._transforms = []
+	
+	def isEmpty( self ):
+		return 0 == self._numOps
+	
+	def numCommits( self ):
+		'''The number of times the batch has been committed. An operation
+		   queued when this was n has been done once it is more than n.'''
+		return self._numCommits
+	
+	def reparentToWorld( self, dpNode ):
+		'''Reparent the transform at dpNode to world. dpNode is updated
+		   in place to the node's new path when the batch is committed.'''
+		oNode = dpNode.transform()
+		self._modifier.reparentNode( oNode )
+		self._reparented.append( (oNode, dpNode) )
+		self._added()
+	
+	def rename( self, oNode, name ):
+		'''Rename the node when the batch is committed, after any
+		   reparent queued before it.'''
+		self._modifier.renameNode( oNode, name )
+		self._added()
+	
+	def createAnimCurve( self, plug ):
+		'''Create an anim curve connected to plug. The connection is made
+		   when the batch is committed. Returns the curve's MObject.'''
+		fGenerator = MFnAnimCurve()
+		oAnim = fGenerator.create( plug, self._modifier )
+		self._added()
+		return oAnim
+	
+	def setTransformation( self, oTransform, matrix ):
+		'''Set the transform's local matrix when the batch is committed.'''
+		self._transforms.append( (oTransform, MTransformationMatrix( matrix )) )
+		self._added()
+	
+	def commit( self ):
+		'''Perform all the queued operations.'''
+		if self.isEmpty():
+			return
+		
+		self._modifier.doIt()
+		for (oNode, dpNode) in self._reparented:
+			MDagPath.getAPathTo( oNode, dpNode )
+		
+		fTransform = MFnTransform()
+		for (oTransform, tm) in self._transforms:
+			fTransform.setObject( oTransform )
+			fTransform.set( tm )
+		
+		# The ops have been done, start a new modifier rather than
+		# holding on to them. The command undoes the bake by deleting
+		# the duplicates, not by undoing the modifiers.
+		#
+		self._modifier = MDagModifier()
+		self._numOps = 0
+		self._numCommits += 1
+		self._reparented = []
+		self._transforms = []
+	
+	def _added( self ):
+		self._numOps += 1
+		if self._batchSize > 0 and self._numOps >= self._batchSize:
+			self.commit()
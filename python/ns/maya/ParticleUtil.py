@@ -20,6 +20,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.	
 
+import array
+import bisect
 import sys
 
 from maya.OpenMaya import *
@@ -28,9 +30,13 @@ from maya.OpenMayaFX import *
 import ns.py as nspy
 import ns.py.Errors
 import ns.py.Const
+import ns.py.Timer
 
 import ns.maya as nsm
 import ns.maya.DG
+import ns.maya.Errors
+import ns.maya.Progress
+import ns.maya.RunUpCache
 
 def instancer( dpParticle ):
 	fParticle = MFnParticleSystem( dpParticle )
@@ -61,10 +67,69 @@ def instancer( dpParticle ):
 
 	return oInstancer
 
-def runUpTo( dpParticle, time ):
-	timeUnit = MTime( time - 1, MTime.uiUnit() )
+def instancers( dpParticle ):
+	'''Returns every instancer connected to the particle system, in
+	   instanceData order.'''
+	fParticle = MFnParticleSystem( dpParticle )
+	pInstanceData = MPlug( dpParticle.node(), fParticle.attribute("instanceData") )
+	aInstancePointData = fParticle.attribute("instancePointData")
+
+	oInstancers = []
+	for i in range( pInstanceData.numElements() ):
+		pInstancePointData = pInstanceData.elementByPhysicalIndex( i ).child( aInstancePointData )
+		destinations = MPlugArray()
+		pInstancePointData.connectedTo( destinations, False, True )
+		for j in range( destinations.length() ):
+			oInstancer = destinations[j].node()
+			if oInstancer.hasFn( MFn.kInstancer ):
+				oInstancers.append( oInstancer )
+
+	if not oInstancers:
+		raise nspy.Errors.Error( "%s is not associated with an instancer." % fParticle.name() )
+	return oInstancers
+
+def runUpTo( dpParticle, time, cache=None, stateFile=None ):
+	'''Evaluate the particle system up to the frame before time. If a
+	   RunUpCache is given, the state is restored from it when it holds
+	   a valid one and stored in it otherwise. A stateFile does the same
+	   on disk, so that other processes can start from the state.
+	   Returns an InitialStateSwap that has to be restore()d once the
+	   particle system is no longer needed if the state was restored,
+	   None otherwise. Particle systems that can't be restored exactly
+	   (see RunUpCache.isRestorable()) are always run up.'''
+	frame = time - 1
+	key = None
+	if (cache is not None or stateFile) and not nsm.RunUpCache.isRestorable( dpParticle ):
+		nsm.Progress.setProgressStatus( "%s has emitters or solver state, running it up without the cache." % dpParticle.partialPathName() )
+		cache = None
+		stateFile = None
+	if cache is not None or stateFile:
+		nspy.Timer.start( "runUpFingerprint" )
+		key = nsm.RunUpCache.fingerprint( dpParticle, frame )
+		nsm.Progress.setProgressStatus( "Fingerprinted %s's run up in %.3fs" %
+										(dpParticle.partialPathName(), nspy.Timer.stop( "runUpFingerprint" )) )
+		nspy.Timer.delete( "runUpFingerprint" )
+	if cache is not None:
+		state = cache.get( key )
+		if state is not None:
+			return nsm.RunUpCache.InitialStateSwap( dpParticle, state, frame )
+	if stateFile:
+		state = nsm.RunUpCache.loadState( stateFile, key )
+		if state is not None:
+			if cache is not None:
+				cache.put( key, dpParticle.fullPathName(), state )
+			return nsm.RunUpCache.InitialStateSwap( dpParticle, state, frame )
+	
+	timeUnit = MTime( frame, MTime.uiUnit() )
 	fParticle = MFnParticleSystem( dpParticle )
 	fParticle.evaluateDynamics( timeUnit, True )
+	if key is not None:
+		state = nsm.RunUpCache.ParticleState( dpParticle )
+		if cache is not None:
+			cache.put( key, dpParticle.fullPathName(), state )
+		if stateFile:
+			state.save( stateFile, key )
+	return None
 
 def count( dpParticle ):
 	fParticle = MFnParticleSystem( dpParticle )
@@ -77,7 +142,7 @@ def count( dpParticle ):
 		# also useless during file load) and get the
 		# number of elements.
 		#
-		pId0 = NSmayaDG.getPlug( dpParticle.node(), "id0" )
+		pId0 = nsm.DG.getPlug( node=dpParticle.node(), attrName="id0" )
 		oId0 = pId0.asMObject()
 		fId0 = MFnDoubleArrayData( oId0 )
 		numParticles = fId0.length()
@@ -86,7 +151,7 @@ def count( dpParticle ):
 
 def _getPerParticleIntData( dpParticle, attrName, value ):
 	if MFileIO.isReadingFile():
-		plug = NSmayaDG.getPlug( dpParticle.node(), attrName )
+		plug = nsm.DG.getPlug( node=dpParticle.node(), attrName=attrName )
 		oData = plug.asMObject()
 		fData = MFnIntArrayData( oData )
 		fData.copyTo( value )
@@ -96,7 +161,7 @@ def _getPerParticleIntData( dpParticle, attrName, value ):
 
 def _getPerParticleVectorData( dpParticle, attrName, value ):
 	if MFileIO.isReadingFile():
-		plug = NSmayaDG.getPlug( dpParticle.node(), attrName )
+		plug = nsm.DG.getPlug( node=dpParticle.node(), attrName=attrName )
 		oData = plug.asMObject()
 		fData = MFnVectorArrayData( oData )
 		fData.copyTo( value )
@@ -106,7 +171,7 @@ def _getPerParticleVectorData( dpParticle, attrName, value ):
 
 def _getPerParticleDoubleData( dpParticle, attrName, value ):
 	if MFileIO.isReadingFile():
-		plug = NSmayaDG.getPlug( dpParticle.node(), attrName )
+		plug = nsm.DG.getPlug( node=dpParticle.node(), attrName=attrName )
 		oData = plug.asMObject()
 		fData = MFnDoubleArrayData( oData )
 		fData.copyTo( value )
@@ -118,7 +183,7 @@ def getPerParticleVectorData( dpParticle, attrName, value ):
 	fParticle = MFnParticleSystem( dpParticle )
 	if fParticle.isPerParticleVectorAttribute( attrName ):
 		try:
-			_getPerParticleVectorData( dpParticle.node(), attrName, value )
+			_getPerParticleVectorData( dpParticle, attrName, value )
 		except:
 			raise nspy.Errors.Error( "Unable to query per-particle data from %s.%s" % (fParticle.name(), attrName) )
 	else:
@@ -133,7 +198,7 @@ def getPerParticleIntData( dpParticle, attrName, value ):
 		except:
 			raise nsm.Errors.MayaError( "Unable to query per-particle data from %s.%s" % (fParticle.name(), attrName) )
 	elif fParticle.isPerParticleDoubleAttribute( attrName ):
-		# Manually convert the double data to ints.
+		# Convert the double data to ints.
 		#
 		temp = MDoubleArray()
 		try:
@@ -141,9 +206,7 @@ def getPerParticleIntData( dpParticle, attrName, value ):
 		except:
 			raise nsm.Errors.MayaError( "Unable to query per-particle data from %s.%s" % (fParticle.name(), attrName) )
 		
-		value.setLength( temp.length() )
-		for i in range( 0, temp.length() ):
-			value[i] = temp[i]
+		_castIntData( temp, value )
 	else:
 		raise nspy.Errors.Error( "%s.%s is not a valid per-particle vector attribute." % (fParticle.name(), attrName) )
 
@@ -156,7 +219,7 @@ def getPerParticleDoubleData( dpParticle, attrName, value ):
 		except:
 			raise nsm.Errors.MayaError( "Unable to query per-particle data from %s.%s" % (fParticle.name(), attrName) )
 	elif fParticle.isPerParticleIntAttribute( attrName ):
-		# Manually convert the double data to ints.
+		# Convert the int data to doubles.
 		#
 		temp = MIntArray()
 		try:
@@ -164,12 +227,51 @@ def getPerParticleDoubleData( dpParticle, attrName, value ):
 		except:
 			raise nsm.Errors.MayaError( "Unable to query per-particle data from %s.%s" % (fParticle.name(), attrName) )
 		
-		value.setLength( temp.length() )
-		for i in range( 0, temp.length() ):
-			value[i] = temp[i]
+		_castDoubleData( temp, value )
 	else:
 		raise nspy.Errors.Error( "%s.%s is not a valid per-particle vector attribute." % (fParticle.name(), attrName) )
 
+def _castIntData( source, value ):
+	# Convert the whole array into a Python list in one pass and hand
+	# it to Maya in a single call rather than setting each element
+	# through the API. Both steps copy the values.
+	#
+	values = [ int( source[i] ) for i in range( source.length() ) ]
+	MScriptUtil.createIntArrayFromList( values, value )
+
+def _castDoubleData( source, value ):
+	numValues = source.length()
+	if not numValues:
+		value.clear()
+		return
+	values = [ float( source[i] ) for i in range( numValues ) ]
+	util = MScriptUtil()
+	util.createFromList( values, numValues )
+	value.copy( MDoubleArray( util.asDoublePtr(), numValues ) )
+
+def getPerParticleArray( dpParticle, attrName ):
+#
+# Description:
+#		Returns (oData, array) where oData is the per-particle
+#		attribute's data, copied from its plug, and array refers into
+#		oData without copying it again. array is an MDoubleArray,
+#		MIntArray or MVectorArray depending on the attribute's type
+#		and is only valid for as long as oData is kept alive.
+#
+	plug = nsm.DG.getPlug( node=dpParticle.node(), attrName=attrName )
+	try:
+		oData = plug.asMObject()
+	except:
+		raise nsm.Errors.MayaError( "Unable to query per-particle data from %s" % plug.name() )
+	
+	if oData.hasFn( MFn.kDoubleArrayData ):
+		return oData, MFnDoubleArrayData( oData ).array()
+	elif oData.hasFn( MFn.kIntArrayData ):
+		return oData, MFnIntArrayData( oData ).array()
+	elif oData.hasFn( MFn.kVectorArrayData ):
+		return oData, MFnVectorArrayData( oData ).array()
+	raise nspy.Errors.Error( "%s is not a valid per-particle attribute." % plug.name() )
+
 def mappedAttribute( dpParticle, particleOption, instancerIndex ) :
 #
 # Description:
@@ -193,12 +295,142 @@ def mappedAttribute( dpParticle, particleOption, instancerIndex ) :
 
 	return ""
 
+class ParticleSnapshot:
+	'''A cache of a particle system's per-particle attribute arrays for
+	   the current frame. Each attribute is copied from its plug at most
+	   once per frame, the first time it is asked for after update(), and
+	   is read in place after that.'''
+	
+	def __init__( self, dpParticle ):
+		self._dpParticle = dpParticle
+		self._arrays = {}
+	
+	def update( self ):
+		'''Forget the previous frame's arrays. Call this whenever the
+		   current time changes.'''
+		self._arrays = {}
+	
+	def array( self, attrName ):
+		'''Returns the attribute's per-particle array, or None if attrName
+		   is empty. Values are returned with the attribute's own type and
+		   should be cast by the caller as they are read.'''
+		if not attrName:
+			return None
+		try:
+			return self._arrays[attrName][1]
+		except KeyError, e:
+			# Keep the data object alive along with the array that refers
+			# to it.
+			#
+			data = getPerParticleArray( self._dpParticle, attrName )
+			self._arrays[attrName] = data
+			return data[1]
+	
+	def ids( self ):
+		return self.array( "particleId" )
+	
+	def count( self ):
+		return self.ids().length()
+
+class SampleSnapshot:
+	'''ParticleSnapshot look-alike for a frame read from a particle cache
+	   (an ns.py.ParticleCache.ParticleSample). Arrays are flat array('d')s,
+	   vector attributes hold xyz triples.'''
+	
+	def __init__( self, sample ):
+		self._sample = sample
+	
+	def update( self ):
+		pass
+	
+	def array( self, attrName ):
+		if not attrName:
+			return None
+		if "particleId" == attrName:
+			# Caches store the particle ID as "id".
+			#
+			return self.ids()
+		values = self._sample.array( attrName )
+		if values is None:
+			raise nspy.Errors.Error( "The particle cache has no %s attribute." % attrName )
+		return values
+	
+	def ids( self ):
+		return self._sample.ids()
+	
+	def count( self ):
+		return self._sample.count()
+
+class IdEvents:
+	'''The particles born and the particles that died between two
+	   frames, found by diffing the frames' sorted particle IDs.'''
+	
+	def __init__( self ):
+		self._previousIds = array.array( 'i' )
+		self.born = []
+		self.died = []
+	
+	def update( self, sortedIds ):
+		'''Compare sortedIds against the IDs passed to the previous
+		   update() and fill born and died.'''
+		previousIds = self._previousIds
+		numPrevious = len( previousIds )
+		numIds = sortedIds.length()
+		
+		# IDs are handed out in increasing order so the particles born
+		# since the last update are exactly those whose IDs are greater
+		# than any seen before.
+		#
+		firstBorn = 0
+		if numPrevious:
+			firstBorn = bisect.bisect_right( sortedIds, previousIds[-1] )
+		self.born = [ sortedIds[i] for i in range( firstBorn, numIds ) ]
+		
+		# Every previous ID that is missing from the surviving IDs has
+		# died. Only walk the two arrays if the counts show that there
+		# is something to find.
+		#
+		self.died = []
+		if numPrevious > firstBorn:
+			j = 0
+			for previousId in previousIds:
+				while j < firstBorn and sortedIds[j] < previousId:
+					j += 1
+				if j == firstBorn or sortedIds[j] != previousId:
+					self.died.append( previousId )
+		
+		# sortedIds may refer to the particle system's internal data so
+		# keep a copy of it.
+		#
+		self._previousIds = array.array( 'i', [ sortedIds[i] for i in range( numIds ) ] )
+
+class _Sequence:
+	'''Gives a Python sequence the length() of a Maya array.'''
+	
+	def __init__( self, values ):
+		self._values = values
+	
+	def __getitem__( self, i ):
+		return self._values[i]
+	
+	def length( self ):
+		return len( self._values )
+
 class IdMapper:
+	'''Maps between particle IDs and indices into the per-particle arrays.
+	   IDs are looked up with a binary search over the particle's sorted
+	   IDs or, once update() has been called for the current frame,
+	   through a table from ID to index. The table is only rebuilt if
+	   particles have died since it was last updated, otherwise just the
+	   newly born IDs are added.'''
 	
 	def __init__( self ):
 		self._sortedIds = MIntArray()
 		self._idIndices = MIntArray()
 		self._unsortedIds = MDoubleArray()
+		self._data = ()
+		self._indices = {}
+		self._indicesCurrent = False
 			
 	def fromParticle( self, oParticle, deepCopy=False ):
 		fParticle = MFnParticleSystem( oParticle )
@@ -207,20 +439,41 @@ class IdMapper:
 		pIdIndex = pIdMapping.child( fParticle.attribute( "idIndex" ) )
 		pParticleId = nsm.DG.getPlug( node=oParticle, attrName="particleId" )
 
-		fSortedId = MFnIntArrayData( pSortedId.asMObject() )
-		fIdIndex = MFnIntArrayData( pIdIndex.asMObject() )
-		fParticleId =MFnDoubleArrayData( pParticleId.asMObject() )
+		# The arrays below refer to the data objects' internal data so
+		# the data objects have to be kept alive along with them.
+		#
+		self._data = ( pSortedId.asMObject(),
+					   pIdIndex.asMObject(),
+					   pParticleId.asMObject() )
+		fSortedId = MFnIntArrayData( self._data[0] )
+		fIdIndex = MFnIntArrayData( self._data[1] )
+		fParticleId = MFnDoubleArrayData( self._data[2] )
 	
 		self.set( fSortedId.array(),
 				  fIdIndex.array(),
 				  fParticleId.array(),
 				  deepCopy )
-
+	
+	def fromIds( self, ids ):
+		'''Build the mapping from a sequence of the particle ID at each
+		   index, e.g. read from a particle cache.'''
+		numIds = len( ids )
+		order = range( numIds )
+		order.sort( key=lambda i: ids[i] )
+		sortedIds = MIntArray()
+		MScriptUtil.createIntArrayFromList( [ int( ids[i] ) for i in order ], sortedIds )
+		idIndices = MIntArray()
+		MScriptUtil.createIntArrayFromList( order, idIndices )
+		unsortedIds = MDoubleArray()
+		_castDoubleData( _Sequence( ids ), unsortedIds )
+		self._data = ()
+		self.set( sortedIds, idIndices, unsortedIds )
+	
 	def set( self, sortedIds, idIndices, unsortedIds, deepCopy=False ):
 		if deepCopy:
-			self._sortedIds.copy(sortedIds)
-			self._idIndices.copy(idIndices)
-			self._unsortedIds.copy(unsortedIds)
+			self._sortedIds = MIntArray( sortedIds )
+			self._idIndices = MIntArray( idIndices )
+			self._unsortedIds = MDoubleArray( unsortedIds )
 		else:
 			# Presumably sortedIds and idIndices were queried from the particle's
 			# idMapping attribute. Assigning them to the member variables, therefore,
@@ -230,18 +483,60 @@ class IdMapper:
 			self._sortedIds = sortedIds
 			self._idIndices = idIndices
 			self._unsortedIds = unsortedIds
+		# The table refers to the previous arrays until update().
+		#
+		self._indicesCurrent = False
+	
+	def update( self, born, died ):
+		'''Bring the ID to index table up to date with the arrays last set.
+		   born and died are the IDs born and died since the previous
+		   update(), as found by IdEvents.'''
+		ids = self._unsortedIds
+		numIds = ids.length()
+		indices = self._indices
+		
+		# Maya appends newly born particles to the end of the
+		# per-particle arrays, so as long as no particle has died the
+		# existing particles keep their indices and only the born IDs,
+		# at the end of the arrays, have to be added.
+		#
+		first = numIds - len( born )
+		if (died or first != len( indices ) or
+			sorted( [ int( ids[i] ) for i in range( first, numIds ) ] ) != list( born )):
+			indices = {}
+			first = 0
+		for i in range( first, numIds ):
+			indices[int( ids[i] )] = i
+		self._indices = indices
+		self._indicesCurrent = True
+	
+	def sortedIds( self ):
+		return self._sortedIds
 
 	def idToIndex( self, particleId ):
-		# TODO: take advantage of the fact that mSortedIds is sorted and
-		#		 do a binary search
-		#
-		for i in range(self._sortedIds.length()):
-			if self._sortedIds[i] == particleId:
-				return self._idIndices[i]
+		if self._indicesCurrent:
+			return self._indices.get( particleId, nspy.Const.kInvalidIndex )
+		i = bisect.bisect_left( self._sortedIds, particleId )
+		if i < self._sortedIds.length() and self._sortedIds[i] == particleId:
+			return self._idIndices[i]
 		return nspy.Const.kInvalidIndex
 	
+	def idsToIndices( self, particleIds ):
+		if self._indicesCurrent:
+			get = self._indices.get
+			return [ get( particleId, nspy.Const.kInvalidIndex ) for particleId in particleIds ]
+		idToIndex = self.idToIndex
+		return [ idToIndex( particleId ) for particleId in particleIds ]
+	
 	def indexToId( self, particleIndex ):
 		if particleIndex < self._unsortedIds.length():
 			return int(self._unsortedIds[ particleIndex ])
 		return nspy.Const.kInvalidIndex
-
+	
+	def indicesToIds( self, particleIndices ):
+		indexToId = self.indexToId
+		return [ indexToId( particleIndices[i] ) for i in range( len( particleIndices ) ) ]
+	
+	def ids( self ):
+		'''The particle ID at each index of the per-particle arrays.'''
+		return self._unsortedIds
@@ -0,0 +1,331 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import array
+import hashlib
+import os
+import struct
+
+from maya.OpenMaya import *
+from maya.OpenMayaFX import *
+
+import ns.py as nspy
+import ns.py.Errors
+
+import ns.maya as nsm
+import ns.maya.DG
+
+
+# Cached states are kept until their per-particle arrays add up to more
+# than this many bytes, then the least recently used ones are dropped.
+#
+kDefaultMaxBytes = 512 * 1024 * 1024
+
+# Upstream node types whose state isn't in a ParticleState.
+#
+kStatefulNodeTypes = ( "nucleus", "nParticle", "nRigid" )
+
+# State files: magic, version, key length and number of arrays, then the
+# key and, per array, its name length, kind ("d" or "v"), number of
+# doubles, name and doubles.
+#
+kStateMagic = "NSPS"
+kStateVersion = 1
+_stateHeader = struct.Struct( "<4siii" )
+_arrayHeader = struct.Struct( "<icq" )
+
+def stateAttributes( oParticle ):
+	'''The names of the particle system's per-particle arrays that have
+	   an initial state ("position" has "position0" and so on).'''
+	fParticle = MFnDependencyNode( oParticle )
+	names = []
+	for i in range( fParticle.attributeCount() ):
+		oAttr = fParticle.attribute( i )
+		if not oAttr.hasFn( MFn.kTypedAttribute ):
+			continue
+		dataType = MFnTypedAttribute( oAttr ).attrType()
+		if dataType not in ( MFnData.kDoubleArray, MFnData.kVectorArray ):
+			continue
+		name = MFnAttribute( oAttr ).name()
+		if fParticle.hasAttribute( name + "0" ):
+			names.append( name )
+	return names
+
+def isRestorable( dpParticle ):
+	'''Whether a ParticleState restores the particle system exactly. Only
+	   the per-particle arrays are saved, not the emitters' emission
+	   accumulators and random state, the particle's next ID or a solver's
+	   history, so systems with any of those upstream are simulated
+	   differently after a restore and must not be cached.'''
+	oParticle = dpParticle.node()
+	if MFnDependencyNode( oParticle ).typeName() == "nParticle":
+		return False
+	itGraph = MItDependencyGraph( oParticle,
+								  MFn.kInvalid,
+								  MItDependencyGraph.kUpstream,
+								  MItDependencyGraph.kDepthFirst,
+								  MItDependencyGraph.kNodeLevel )
+	while not itGraph.isDone():
+		oNode = itGraph.currentItem()
+		itGraph.next()
+		if oNode.hasFn( MFn.kEmitter ):
+			return False
+		if MFnDependencyNode( oNode ).typeName() in kStatefulNodeTypes:
+			return False
+	return True
+
+def fingerprint( dpParticle, frame ):
+	'''A key for the particle system's state at frame. It covers the
+	   particle node's initial state and settings and the settings of
+	   every node upstream of it (emitters, fields, etc.). Anything it
+	   misses has to be dealt with by invalidating the cache.'''
+	return frameKey( sceneDigest( dpParticle ), frame )
+
+def frameKey( digest, frame ):
+	'''The fingerprint() at frame of the scene that digest (from
+	   sceneDigest()) was taken of.'''
+	digest = digest.copy()
+	digest.update( str( frame ) )
+	return digest.hexdigest()
+
+def sceneDigest( dpParticle ):
+	'''The part of fingerprint() that doesn't depend on the frame, as an
+	   md5 object. Taking it once lets the key of a later frame be found
+	   even after an InitialStateSwap has changed the initial state.'''
+	oParticle = dpParticle.node()
+	skip = set( stateAttributes( oParticle ) )
+	digest = hashlib.md5()
+	
+	itGraph = MItDependencyGraph( oParticle,
+								  MFn.kInvalid,
+								  MItDependencyGraph.kUpstream,
+								  MItDependencyGraph.kDepthFirst,
+								  MItDependencyGraph.kNodeLevel )
+	while not itGraph.isDone():
+		oNode = itGraph.currentItem()
+		itGraph.next()
+		if oNode.hasFn( MFn.kTime ):
+			# Changes every frame and the frame is already in the key.
+			#
+			continue
+		fNode = MFnDependencyNode( oNode )
+		digest.update( fNode.name() )
+		digest.update( fNode.typeName() )
+		isParticle = ( oNode == oParticle )
+		for i in range( fNode.attributeCount() ):
+			fAttr = MFnAttribute( fNode.attribute( i ) )
+			if not fAttr.parent().isNull() or not fAttr.isStorable():
+				continue
+			if isParticle and fAttr.name() in skip:
+				# The particle's current state changes every frame.
+				#
+				continue
+			commands = MStringArray()
+			MPlug( oNode, fAttr.object() ).getSetAttrCmds( commands )
+			for j in range( commands.length() ):
+				digest.update( commands[j] )
+	return digest
+
+class ParticleState:
+	'''Copies of a particle system's per-particle state arrays.'''
+	
+	def __init__( self, dpParticle=None ):
+		self.numBytes = 0
+		self._data = {}
+		if dpParticle is None:
+			return
+		oParticle = dpParticle.node()
+		for name in stateAttributes( oParticle ):
+			oData = nsm.DG.getPlug( node=oParticle, attrName=name ).asMObject()
+			if oData.hasFn( MFn.kVectorArrayData ):
+				values = MVectorArray( MFnVectorArrayData( oData ).array() )
+				self._data[name] = MFnVectorArrayData().create( values )
+				self.numBytes += 24 * values.length()
+			else:
+				values = MDoubleArray( MFnDoubleArrayData( oData ).array() )
+				self._data[name] = MFnDoubleArrayData().create( values )
+				self.numBytes += 8 * values.length()
+	
+	def setInitialState( self, oParticle ):
+		'''Make the state the particle system's initial state.'''
+		for (name, oData) in self._data.items():
+			nsm.DG.getPlug( node=oParticle, attrName=name + "0" ).setMObject( oData )
+	
+	def save( self, path, key ):
+		'''Write the state to path, tagged with its fingerprint() so that
+		   loadState() can tell when it no longer matches the scene.'''
+		tmpPath = path + ".tmp"
+		file = open( tmpPath, "wb" )
+		try:
+			file.write( _stateHeader.pack( kStateMagic, kStateVersion, len( key ), len( self._data ) ) )
+			file.write( key )
+			for (name, oData) in sorted( self._data.items() ):
+				values = array.array( "d" )
+				if oData.hasFn( MFn.kVectorArrayData ):
+					kind = "v"
+					vectors = MFnVectorArrayData( oData ).array()
+					for i in range( vectors.length() ):
+						values.extend( ( vectors[i].x, vectors[i].y, vectors[i].z ) )
+				else:
+					kind = "d"
+					doubles = MFnDoubleArrayData( oData ).array()
+					for i in range( doubles.length() ):
+						values.append( doubles[i] )
+				file.write( _arrayHeader.pack( len( name ), kind, len( values ) ) )
+				file.write( name )
+				values.tofile( file )
+			file.flush()
+			os.fsync( file.fileno() )
+		finally:
+			file.close()
+		# Only ever replace a complete state file. rename() does that
+		# atomically except on Windows, where it can't replace a file.
+		#
+		if os.name == "nt" and os.path.exists( path ):
+			os.remove( path )
+		os.rename( tmpPath, path )
+
+def loadState( path, key ):
+	'''Read a state written by ParticleState.save(). Returns None if
+	   there is no file or it was saved for a different fingerprint().'''
+	if not os.path.exists( path ):
+		return None
+	file = open( path, "rb" )
+	try:
+		(magic, version, keyLength, numArrays) = _stateHeader.unpack( file.read( _stateHeader.size ) )
+		if magic != kStateMagic:
+			raise nspy.Errors.BadArgumentError( "%s is not a particle state file." % path )
+		if version != kStateVersion:
+			raise nspy.Errors.UnsupportedError( "Particle state file version %d is not supported." % version )
+		if file.read( keyLength ) != key:
+			return None
+		state = ParticleState()
+		for i in range( numArrays ):
+			(nameLength, kind, count) = _arrayHeader.unpack( file.read( _arrayHeader.size ) )
+			name = file.read( nameLength )
+			values = array.array( "d" )
+			values.fromfile( file, count )
+			if kind == "v":
+				vectors = MVectorArray()
+				for j in range( 0, count, 3 ):
+					vectors.append( MVector( values[j], values[j + 1], values[j + 2] ) )
+				state._data[name] = MFnVectorArrayData().create( vectors )
+			else:
+				doubles = MDoubleArray()
+				for value in values:
+					doubles.append( value )
+				state._data[name] = MFnDoubleArrayData().create( doubles )
+			state.numBytes += 8 * count
+		return state
+	finally:
+		file.close()
+
+class InitialStateSwap:
+	'''Starts a particle system from a cached state by temporarily
+	   replacing its initial state and start frame. restore() puts the
+	   original ones back.'''
+	
+	def __init__( self, dpParticle, state, frame ):
+		self._oParticle = dpParticle.node()
+		self._original = {}
+		for name in stateAttributes( self._oParticle ):
+			plug = nsm.DG.getPlug( node=self._oParticle, attrName=name + "0" )
+			self._original[name] = plug.asMObject()
+		pStartFrame = nsm.DG.getPlug( node=self._oParticle, attrName="startFrame" )
+		self._startFrame = pStartFrame.asDouble()
+		
+		state.setInitialState( self._oParticle )
+		pStartFrame.setDouble( frame )
+		MFnParticleSystem( dpParticle ).evaluateDynamics( MTime( frame, MTime.uiUnit() ), True )
+	
+	def restore( self ):
+		for (name, oData) in self._original.items():
+			nsm.DG.getPlug( node=self._oParticle, attrName=name + "0" ).setMObject( oData )
+		nsm.DG.getPlug( node=self._oParticle, attrName="startFrame" ).setDouble( self._startFrame )
+		self._original = {}
+
+class RunUpCache:
+	'''Particle system states after a run up, keyed by fingerprint().
+	   Least recently used states are evicted once the cached arrays add
+	   up to more than maxBytes.'''
+	
+	def __init__( self, maxBytes=kDefaultMaxBytes ):
+		self._maxBytes = maxBytes
+		self._numBytes = 0
+		self._states = {}
+		# Keys from least to most recently used.
+		#
+		self._order = []
+		# Keys by particle node name, for invalidate().
+		#
+		self._keysByParticle = {}
+	
+	def get( self, key ):
+		'''Returns the cached ParticleState, or None.'''
+		state = self._states.get( key )
+		if state is not None:
+			self._order.remove( key )
+			self._order.append( key )
+		return state
+	
+	def put( self, key, particleName, state ):
+		if self._states.has_key( key ):
+			self._remove( key )
+		if state.numBytes > self._maxBytes:
+			return
+		self._states[key] = state
+		self._order.append( key )
+		self._keysByParticle.setdefault( particleName, [] ).append( key )
+		self._numBytes += state.numBytes
+		while self._numBytes > self._maxBytes:
+			self._remove( self._order[0] )
+	
+	def invalidate( self, particleName=None ):
+		'''Forget the states cached for the named particle system, or
+		   every state if no name is given.'''
+		if particleName is None:
+			keys = list( self._order )
+		else:
+			keys = list( self._keysByParticle.get( particleName, [] ) )
+		for key in keys:
+			self._remove( key )
+	
+	def numBytes( self ):
+		return self._numBytes
+	
+	def _remove( self, key ):
+		state = self._states.pop( key )
+		self._order.remove( key )
+		for keys in self._keysByParticle.values():
+			if key in keys:
+				keys.remove( key )
+		self._numBytes -= state.numBytes
+
+# Shared by every bake in the Maya session.
+#
+_sessionCache = None
+
+def sessionCache():
+	global _sessionCache
+	if _sessionCache is None:
+		_sessionCache = RunUpCache()
+	return _sessionCache
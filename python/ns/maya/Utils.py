@@ -20,16 +20,51 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.	
 
-
-from maya.OpenMaya import *
-import ns.maya as nsm
-import ns.maya.Errors
-
-def framesPerSecond():
-	timestep = MTime( 1, MTime.kSeconds )
-	return timestep.asUnits( MTime.uiUnit() )
-
-def secondsPerFrame():
-	timestep = MTime( 1, MTime.uiUnit() )
-	return timestep.asUnits( MTime.kSeconds )
-
+
+from maya.OpenMaya import *
+import ns.maya as nsm
+import ns.maya.Errors
+
+def framesPerSecond():
+	timestep = MTime( 1, MTime.kSeconds )
+	return timestep.asUnits( MTime.uiUnit() )
+
+def secondsPerFrame():
+	timestep = MTime( 1, MTime.uiUnit() )
+	return timestep.asUnits( MTime.kSeconds )
+
+
+def pointArray( points ):
+	'''Returns an MPointArray of the points in a flat sequence of xyz
+	   values, built with a single call rather than point by point.'''
+	numPoints = len( points ) / 3
+	if not numPoints:
+		return MPointArray()
+	# MPointArray wants homogeneous points.
+	#
+	values = [ 1.0 ] * (numPoints * 4)
+	values[0::4] = points[0::3]
+	values[1::4] = points[1::3]
+	values[2::4] = points[2::3]
+	util = MScriptUtil()
+	util.createFromList( values, len( values ) )
+	return MPointArray( util.asDouble4Ptr(), numPoints )
+
+def pointValues( points ):
+	'''The xyz values of an MPointArray as a flat list, the inverse of
+	   pointArray().'''
+	values = [ 0.0 ] * (points.length() * 3)
+	for i in range( points.length() ):
+		point = points[i]
+		values[i*3:i*3+3] = [ point.x, point.y, point.z ]
+	return values
+
+def intArray( values ):
+	result = MIntArray()
+	MScriptUtil.createIntArrayFromList( list( values ), result )
+	return result
+
+def floatArray( values ):
+	result = MFloatArray()
+	MScriptUtil.createFloatArrayFromList( list( values ), result )
+	return result
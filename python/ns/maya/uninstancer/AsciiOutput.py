@@ -0,0 +1,364 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import math
+
+from maya.OpenMaya import *
+from maya.OpenMayaAnim import *
+import maya.cmds as mc
+
+import ns.py as nspy
+import ns.py.Errors
+import ns.py.MayaAscii
+
+import ns.maya as nsm
+import ns.maya.uninstancer.KeyBuffer
+from ns.maya.uninstancer.Geometry import *
+
+
+class eLoad:
+	none, importFile, numValues = range(3)
+
+# Maya ASCII names of the time units.
+#
+_timeUnitNames = { MTime.kHours : "hour",
+				   MTime.kMinutes : "min",
+				   MTime.kSeconds : "sec",
+				   MTime.kMilliseconds : "millisec",
+				   MTime.kGames : "game",
+				   MTime.kFilm : "film",
+				   MTime.kPALFrame : "pal",
+				   MTime.kNTSCFrame : "ntsc",
+				   MTime.kShowScan : "show",
+				   MTime.kPALField : "palf",
+				   MTime.kNTSCField : "ntscf" }
+
+# The duplicates are made and named, and their blendShape networks built,
+# by these procs when the file is loaded since the names Maya gives the
+# duplicated nodes aren't known when the file is written. Duplicates are
+# named once they are parented to world, where their names were
+# allocated. The nodes of a duplicate and its instanced objects are
+# matched up by their order under the root. Nodes are renamed deepest
+# first so that the paths of the nodes still to be renamed stay valid.
+#
+_procs = '''global proc nsUninstancerDuplicate( string $original, int $instance, string $name )
+{
+	string $duplicates[];
+	if ( $instance )
+		$duplicates = `instance $original`;
+	else
+		$duplicates = `duplicate -rr $original`;
+	string $root = $duplicates[0];
+	if ( size( `listRelatives -p $root` ) )
+	{
+		string $parented[] = `parent -w $root`;
+		$root = $parented[0];
+	}
+	rename $root $name;
+}
+global proc nsUninstancerBlendShape( string $root, string $name, string $weightCurve )
+{
+	string $shapes[] = `listRelatives -ad -f -ni -type "controlPoint" $root`;
+	for ( $i = 0; $i < size( $shapes ); $i++ )
+	{
+		string $blendShape = ( $name + "_" + $i );
+		blendShape -origin "local" -n $blendShape $shapes[$i];
+		connectAttr ( $weightCurve + ".o" ) ( $blendShape + ".w[0]" );
+	}
+}
+global proc nsUninstancerBlendShapeTarget( string $root, string $name, string $target, float $weight )
+{
+	string $shapes[] = `listRelatives -ad -f -ni -type "controlPoint" $root`;
+	string $targets[] = `listRelatives -ad -f -ni -type "controlPoint" $target`;
+	for ( $i = 0; $i < size( $shapes ) && $i < size( $targets ); $i++ )
+		blendShape -e -ib -t $shapes[$i] 0 $targets[$i] $weight ( $name + "_" + $i );
+}
+global proc nsUninstancerRename( string $root, string $names[] )
+{
+	string $nodes[] = `listRelatives -ad -f $root`;
+	string $buffer[];
+	int $depth = 0;
+	for ( $i = 0; $i < size( $nodes ); $i++ )
+		$depth = max( $depth, tokenize( $nodes[$i], "|", $buffer ) );
+	for ( ; $depth > 0; $depth-- )
+	{
+		for ( $i = 0; $i < size( $nodes ) && $i < size( $names ); $i++ )
+		{
+			if ( $names[$i] != "" && tokenize( $nodes[$i], "|", $buffer ) == $depth )
+				rename $nodes[$i] $names[$i];
+		}
+	}
+}'''
+
+class AsciiOutput:
+	'''Streams a bake to a Maya ASCII file rather than creating the
+	   duplicates and their curves through the API, which is much slower
+	   than Maya loading the same nodes from a file. The file can then be
+	   imported in one step.
+	   
+	   Duplicates are still made from the scene's instanced objects (by
+	   duplicate and instance statements in the file) so the file must be
+	   imported into the scene it was baked from. It isn't self-contained
+	   and can't be referenced: removing the reference wouldn't remove
+	   the duplicates.'''
+	
+	def __init__( self, path, names, keyBufferSize=nsm.uninstancer.KeyBuffer.kDefaultMaxFrames ):
+		self._path = path
+		self._names = names
+		self._roots = []
+		self._file = open( path, "w" )
+		self.writer = nspy.MayaAscii.Writer( self._file )
+		# Keys are written out in chunks of the key buffer size.
+		#
+		chunkSize = keyBufferSize
+		if chunkSize <= 0:
+			chunkSize = nspy.MayaAscii.kKeysPerStatement
+		self.keys = nspy.MayaAscii.KeyStream( self.writer, chunkSize )
+		
+		uiUnit = MTime.uiUnit()
+		self._timeUnit = uiUnit
+		if not _timeUnitNames.has_key( uiUnit ):
+			# Write times in film units if the file format has no name
+			# for the UI unit.
+			#
+			self._timeUnit = MTime.kFilm
+		self.writer.header( path, timeUnit=_timeUnitNames[self._timeUnit] )
+		self.writer.command( _procs )
+	
+	def path( self ):
+		return self._path
+	
+	def roots( self ):
+		'''Names of the root transforms of the duplicates written so far.'''
+		return self._roots
+	
+	def fileTime( self, time ):
+		'''Converts a time in UI units to the file's time unit.'''
+		if self._timeUnit == MTime.uiUnit():
+			return time
+		return MTime( time, MTime.uiUnit() ).asUnits( self._timeUnit )
+	
+	def duplicate( self, geometry, copyAsInstance ):
+		'''Write a duplicate of geometry, parented to world, and return the
+		   full path to its root.'''
+		dpRoot = MDagPath()
+		MDagPath.getAPathTo( geometry.root.transform(), dpRoot )
+		originalPath = dpRoot.fullPathName()
+		originalName = originalPath.split( "|" )[-1]
+		# Like Geometry.duplicate(), name every node of the duplicate
+		# after its original unless it is an instance, whose nodes
+		# below the root are shared with the original.
+		#
+		children = []
+		if not copyAsInstance and not self._names.useDefaultNames():
+			children = mc.listRelatives( originalPath, allDescendents=True, fullPath=True ) or []
+		newNames = self._names.names( [ originalName ] + [ child.split( "|" )[-1] for child in children ] )
+		name = newNames[0]
+		
+		self.writer.command( "nsUninstancerDuplicate %s %d %s" % (nspy.MayaAscii.quote( originalPath ),
+																  bool( copyAsInstance ),
+																  nspy.MayaAscii.quote( name )) )
+		if children:
+			self.writer.command( "nsUninstancerRename %s { %s }" %
+								 (nspy.MayaAscii.quote( "|" + name ),
+								  ", ".join( [ nspy.MayaAscii.quote( childName ) for childName in newNames[1:] ] )) )
+		
+		self._roots.append( name )
+		return "|" + name
+	
+	def close( self ):
+		if self._file.closed:
+			return
+		self.keys.flush()
+		self.writer.end( self._path )
+		self._file.close()
+	
+	def load( self, mode ):
+		'''Import the closed file, unless mode is eLoad.none. Returns the
+		   paths to the duplicates' roots if they were imported.'''
+		paths = []
+		if eLoad.importFile == mode:
+			mc.file( self._path, i=True, type="mayaAscii", ignoreVersion=True )
+			for name in self._roots:
+				selection = MSelectionList()
+				MGlobal.getSelectionListByName( "|" + name, selection )
+				dpRoot = MDagPath()
+				selection.getDagPath( 0, dpRoot )
+				paths.append( dpRoot )
+		return paths
+
+class AsciiStaticUninstance(Uninstance):
+	'''Writes a duplicate per baked frame, like StaticUninstance.'''
+	
+	def __init__(self, instancer, output):
+		Uninstance.__init__( self, instancer )
+		self._output = output
+	
+	def bake(self, particleIndex):
+		objectIndex = self._instancer.getObjectIndex( particleIndex )
+		
+		# The particle's transformation was decomposed for the whole
+		# frame by Instancer.decompose()
+		#
+		(tx, ty, tz, rx, ry, rz, sx, sy, sz) = self._instancer.getTransformation( particleIndex )
+		
+		writer = self._output.writer
+		root = self._output.duplicate( self._instancer.getInstance( objectIndex ),
+									   self._instancer.copyAsInstance() )
+		writer.select( root )
+		writer.setAttr( ".t", (tx, ty, tz), attrType="double3" )
+		writer.setAttr( ".r", (math.degrees( rx ), math.degrees( ry ), math.degrees( rz )), attrType="double3" )
+		writer.setAttr( ".s", (sx, sy, sz), attrType="double3" )
+
+class AsciiAnimatedUninstance(Uninstance):
+	'''Writes an animated duplicate, like AnimatedUninstance. Keys are
+	   streamed to the file through the output's KeyStream.'''
+	
+	def __init__(self, instancer, output):
+		Uninstance.__init__( self, instancer )
+		self._output = output
+		self._initialized = False
+		self._objectIndex = -1
+		self._root = ""
+		# Curves in KeyBuffer.eChannel order.
+		#
+		self._transformCurves = []
+		self._visibilityCurve = ""
+		self._weightCurve = ""
+		self._blendShapeName = ""
+		self._targets = {}
+	
+	def bake(self, particleIndex):
+		objectIndex = self._instancer.getObjectIndex( particleIndex )
+		
+		if not self._initialized:
+			self._initialize( objectIndex )
+		
+		(tx, ty, tz, rx, ry, rz, sx, sy, sz) = self._instancer.getTransformation( particleIndex )
+		values = (tx, ty, tz,
+				  math.degrees( rx ), math.degrees( ry ), math.degrees( rz ),
+				  sx, sy, sz)
+		
+		time = self._instancer.time().value()
+		fileTime = self._output.fileTime( time )
+		keys = self._output.keys
+		for i in range( nsm.uninstancer.KeyBuffer.eChannel.numValues ):
+			keys.add( self._transformCurves[i], fileTime, values[i] )
+		
+		if objectIndex != self._objectIndex:
+			# See AnimatedUninstance.bake()
+			#
+			if self._instancer.copyAsInstance():
+				raise nspy.Errors.BadArgumentError("Instancer Cycle must be 'Sequential' when using 'Copy as Instance' to bake Animation. Please uncheck 'Copy as Instance'.")
+			
+			if not self._blendShapeName:
+				self._createBlendShape( time )
+			if not self._targets.has_key( objectIndex ):
+				target = MDagPath()
+				MDagPath.getAPathTo( self._instancer.getInstance( objectIndex ).root.transform(), target )
+				self._output.writer.command( "nsUninstancerBlendShapeTarget %s %s %s %s" %
+											 (nspy.MayaAscii.quote( self._root ),
+											  nspy.MayaAscii.quote( self._blendShapeName ),
+											  nspy.MayaAscii.quote( target.fullPathName() ),
+											  nspy.MayaAscii.formatValue( self._weight( objectIndex ) )) )
+				self._targets[objectIndex] = True
+		
+		if self._blendShapeName:
+			keys.add( self._weightCurve, fileTime, self._weight( objectIndex ) )
+		
+		self._objectIndex = objectIndex
+	
+	def retire(self):
+		if self._initialized:
+			self._output.keys.add( self._visibilityCurve,
+								   self._output.fileTime( self._instancer.time().value() ),
+								   0.0 )
+		self.finalize()
+	
+	def finalize(self):
+		if not self._initialized:
+			return
+		keys = self._output.keys
+		for curve in self._curves():
+			keys.finishCurve( curve )
+	
+	def _curves(self):
+		curves = self._transformCurves + [ self._visibilityCurve ]
+		if self._weightCurve:
+			curves.append( self._weightCurve )
+		return curves
+	
+	def _weight(self, objectIndex):
+		return blendShapeWeight( objectIndex, self._instancer.numInstances() )
+	
+	def _initialize(self, objectIndex):
+		writer = self._output.writer
+		keys = self._output.keys
+		self._root = self._output.duplicate( self._instancer.getInstance( objectIndex ),
+											 self._instancer.copyAsInstance() )
+		rootName = self._root.split( "|" )[-1]
+		
+		self._transformCurves = []
+		for attrName in kTransformAttrs:
+			curve = "%s_%s" % (rootName, attrName)
+			self._createCurve( curve, attrName )
+			keys.addCurve( curve )
+			self._transformCurves.append( curve )
+		
+		self._visibilityCurve = "%s_visibility" % rootName
+		self._createCurve( self._visibilityCurve, "visibility" )
+		keys.addCurve( self._visibilityCurve, nspy.MayaAscii.eTangent.step )
+		
+		birthFrame = self._instancer.time().value()
+		startFrame = self._instancer.startFrame()
+		if startFrame < birthFrame:
+			keys.add( self._visibilityCurve, self._output.fileTime( startFrame ), 0.0 )
+		keys.add( self._visibilityCurve, self._output.fileTime( birthFrame ), 1.0 )
+		
+		self._objectIndex = objectIndex
+		self._initialized = True
+	
+	def _createCurve(self, curve, attrName):
+		nodeType = "animCurveTU"
+		if attrName.startswith( "translate" ):
+			nodeType = "animCurveTL"
+		elif attrName.startswith( "rotate" ):
+			nodeType = "animCurveTA"
+		writer = self._output.writer
+		writer.createNode( nodeType, curve )
+		writer.connectAttr( curve + ".o", "%s.%s" % (self._root, attrName) )
+	
+	def _createBlendShape(self, time):
+		rootName = self._root.split( "|" )[-1]
+		self._blendShapeName = "%s_blendShape" % rootName
+		self._weightCurve = "%s_weight" % rootName
+		
+		writer = self._output.writer
+		writer.createNode( "animCurveTU", self._weightCurve )
+		self._output.keys.addCurve( self._weightCurve )
+		writer.command( "nsUninstancerBlendShape %s %s %s" %
+						(nspy.MayaAscii.quote( self._root ),
+						 nspy.MayaAscii.quote( self._blendShapeName ),
+						 nspy.MayaAscii.quote( self._weightCurve )) )
+		# The base shape is shown up until this frame.
+		#
+		self._output.keys.add( self._weightCurve, self._output.fileTime( time - 1 ), self._weight( -1 ) )
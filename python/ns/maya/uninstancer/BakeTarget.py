@@ -0,0 +1,231 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+from maya.OpenMaya import *
+from maya.OpenMayaAnim import *
+
+import ns.py as nspy
+import ns.py.Errors
+
+import ns.maya as nsm
+import ns.maya.uninstancer.AsciiOutput
+import ns.maya.uninstancer.KeyBuffer
+import ns.maya.uninstancer.Merged
+from ns.maya.uninstancer.Geometry import *
+from ns.maya.uninstancer.Instancer import *
+
+
+class eBake:
+	geometry, curves, animation, blendShapes, mergedGeometry, mergedAnimation, numValues = range(7)
+
+class BakeSettings:
+	'''The options shared by every instancer baked together.'''
+	
+	def __init__(self):
+		self.bakeType = eBake.geometry
+		self.copyAsInstance = False
+		self.keyBufferSize = nsm.uninstancer.KeyBuffer.kDefaultMaxFrames
+		# The KeyBuffer.KeyReduction to reduce animated duplicates' keys
+		# with, if any.
+		#
+		self.keyReduction = None
+		self.recycle = False
+		self.names = None
+		self.batch = None
+		# The AsciiOutput to write to instead of creating nodes, if any.
+		#
+		self.output = None
+		self.cacheDirectory = ""
+		self.startFrame = 0
+		self.frameStep = 1
+	
+	def isMerged(self):
+		return self.bakeType in ( eBake.mergedGeometry, eBake.mergedAnimation )
+
+class BakeTarget:
+	'''Bakes the particles of one instancer. Stepping the particle system
+	   and updating the instancer are left to the caller so that several
+	   instancers can share them. particleData is the ParticleSnapshot to
+	   read the particles from, which may be shared by every instancer of
+	   the particle system.'''
+	
+	def __init__(self, dpParticle, dpInstancer, settings, particleData=None):
+		self._settings = settings
+		self._instancer = Instancer( dpParticle, dpInstancer, particleData )
+		self._instancer.reset( settings.copyAsInstance,
+							   eBake.animation == settings.bakeType,
+							   settings.names,
+							   settings.batch )
+		# Uninstances of the particles that are alive, by particle id.
+		# Uninstances are retired as soon as their particle dies and
+		# only their paths are kept.
+		#
+		self._uninstances = {}
+		self._paths = []
+		# The MergedUninstance shared by every particle when baking
+		# merged geometry, or the MergedAnimation when baking merged
+		# animation.
+		#
+		self._merged = None
+		self._pool = None
+		
+		if self._instancer.numInstances() <= 0:
+			raise nspy.Errors.Error( "No shape associated with %s." % self._instancer.fInstancer.name() )
+		
+		if settings.recycle:
+			self._pool = NodePool()
+		
+		if settings.isMerged():
+			if settings.copyAsInstance:
+				raise nspy.Errors.BadArgumentError( "'Copy as Instance' can not be used with merged bake types." )
+			if settings.output:
+				raise nspy.Errors.BadArgumentError( "-outputFile can not be used with merged bake types." )
+			if self._pool is not None:
+				raise nspy.Errors.BadArgumentError( "-recycle can not be used with merged bake types." )
+			
+			if eBake.mergedGeometry == settings.bakeType:
+				self._merged = nsm.uninstancer.Merged.MergedUninstance( self._instancer, settings.names )
+			else:
+				self._merged = nsm.uninstancer.Merged.MergedAnimation( self._instancer,
+																	   settings.names,
+																	   settings.cacheDirectory,
+																	   settings.startFrame,
+																	   settings.frameStep )
+		
+		if settings.output:
+			if self._pool is not None:
+				raise nspy.Errors.BadArgumentError( "-recycle can not be used with -outputFile." )
+			if self._instancer.hasBlendShapes():
+				raise nspy.Errors.BadArgumentError( "Baking Animation with 'Copy as Instance' and a 'Sequential' instancer cycle can not be written to -outputFile." )
+		
+		# When baking animation the instanced object itself
+		# can't be animated - although its children can be so long
+		# as we aren't baking to blendshapes (i.e. the objectIndex
+		# associated with a given particleId never changes.
+		#
+		if eBake.animation == settings.bakeType:
+			for i in range( self._instancer.numInstances() ):
+				if MAnimUtil.isAnimated( self._instancer.getInstance(i).root.transform() ):
+					raise nspy.Errors.Error( "Instanced object " + self._instancer.getInstance(i).root.partialPathName() + " is animated. Bake type 'Animation' is unsupported." )
+	
+	def instancer(self):
+		return self._instancer
+	
+	def bake(self, idMapper, died, particleIndices):
+		'''Bake the current frame. The instancer has to have been updated
+		   to it already. died holds the IDs of the particles that have
+		   died since the last baked frame and particleIndices the indices
+		   of the particles to bake.'''
+		instancer = self._instancer
+		bakeType = self._settings.bakeType
+		output = self._settings.output
+		
+		# Retire the particles that have died since the last baked
+		# frame so that only live particles are tracked. The batch is
+		# committed at most once for all of them.
+		#
+		retired = []
+		for particleId in died:
+			if self._uninstances.has_key( particleId ):
+				retired.append( self._uninstances.pop( particleId ) )
+		if [ uninstance for uninstance in retired if uninstance.needsCommit() ]:
+			instancer.batch().commit()
+		for uninstance in retired:
+			uninstance.retire()
+			self._paths.extend( uninstance.getPaths() )
+		
+		ids = idMapper.ids()
+		targets = []
+		for particleIndex in particleIndices:
+			particleId = int( ids[particleIndex] )
+			
+			objectIndex = instancer.getObjectIndex(particleIndex)
+			if not instancer.getInstance( objectIndex ).root.isValid():
+				# This shouldn't happen, but we should carry on
+				# regardless.
+				#
+				assert 0
+				continue
+			
+			targets.append( (particleId, particleIndex) )
+		
+		if eBake.animation == bakeType or output:
+			# Decompose the transformations of every particle to
+			# be baked this frame in one pass.
+			#
+			instancer.decompose( [ particleIndex for (particleId, particleIndex) in targets ] )
+		
+		if (self._pool is None and
+			not output and
+			not self._settings.isMerged()):
+			# Make this frame's duplicates together, per instanced
+			# object. Static bakes duplicate every target, animated
+			# bakes only the particles baked for the first time.
+			#
+			counts = {}
+			for (particleId, particleIndex) in targets:
+				if eBake.geometry == bakeType or not self._uninstances.has_key( particleId ):
+					objectIndex = instancer.getObjectIndex( particleIndex )
+					counts[objectIndex] = counts.get( objectIndex, 0 ) + 1
+			instancer.prepareDuplicates( counts )
+		
+		for (particleId, particleIndex) in targets:
+			uninstance = self._getUninstance( particleId )
+			uninstance.bake( particleIndex )
+	
+	def finalize(self):
+		'''Finish every uninstance still alive. The settings' batch has to
+		   have been committed first.'''
+		for uninstance in self._uninstances.values():
+			uninstance.finalize()
+			self._paths.extend( uninstance.getPaths() )
+		self._uninstances = {}
+		if self._merged:
+			self._merged.finalize()
+			self._paths.extend( self._merged.getPaths() )
+	
+	def getPaths(self):
+		return self._paths
+	
+	def _getUninstance( self, particleId ):
+		settings = self._settings
+		if eBake.mergedGeometry == settings.bakeType:
+			return self._merged
+		
+		uninstance = None
+		try:
+			uninstance = self._uninstances[particleId]
+		except KeyError, e:
+			if settings.output:
+				if eBake.geometry == settings.bakeType:
+					uninstance = nsm.uninstancer.AsciiOutput.AsciiStaticUninstance( self._instancer, settings.output )
+				elif eBake.animation == settings.bakeType:
+					uninstance = nsm.uninstancer.AsciiOutput.AsciiAnimatedUninstance( self._instancer, settings.output )
+			elif eBake.geometry == settings.bakeType:
+				uninstance = StaticUninstance( self._instancer )
+			elif eBake.animation == settings.bakeType:
+				uninstance = AnimatedUninstance( self._instancer, settings.keyBufferSize, self._pool, settings.keyReduction )
+			elif eBake.mergedAnimation == settings.bakeType:
+				uninstance = nsm.uninstancer.Merged.SlotUninstance( self._instancer, self._merged )
+			self._uninstances[particleId] = uninstance
+		return uninstance
+
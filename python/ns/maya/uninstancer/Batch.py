@@ -0,0 +1,209 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+#
+# Runs a queue of bakes in one mayapy process, so that Maya only starts
+# once, and reports how each went. Run with mayapy, not from inside Maya:
+#
+#   mayapy Batch.py [--plugin NimbleTools.py] [--status status.json] jobs.json
+#
+# jobs.json holds a job or a list of jobs. A job is an object with:
+#
+#   scene       the scene to open (required)
+#   targets     the instancers or particle systems to bake
+#   plugins     plug-ins to load besides NimbleTools and the ones the
+#               scene itself requires
+#   bakeType, startFrame, endFrame, frameStep
+#               as for nsUninstancer
+#   outputFile  write the bake to this Maya ASCII file
+#   saveAs      save the scene with the bake in it to this file
+#   flags       any other nsUninstancer flags by long name, e.g.
+#               { "recycle": true, "shard": [ 0, 4 ] }
+#   name        a name for the job in the status report
+#
+# The status report (--status, or stdout) lists every job's name,
+# status ("succeeded" or "failed"), error, result and time taken. The
+# exit code is one of the kExit codes below.
+#
+
+import optparse
+import os
+import sys
+import time
+
+try:
+	import json
+except ImportError:
+	# Python 2.5 (Maya 2008 and 2009).
+	#
+	import simplejson as json
+
+
+kExitSucceeded = 0
+kExitJobFailed = 1
+kExitBadJobs = 2
+kExitMayaFailed = 3
+
+# Job keys that are passed straight on to nsUninstancer.
+#
+kFlagKeys = ( "bakeType", "startFrame", "endFrame", "frameStep" )
+
+def defaultPlugin():
+	'''NimbleTools.py in the plug-ins directory next to the python one.'''
+	return os.path.join( os.path.dirname( os.path.dirname( os.path.dirname( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) ) ) ),
+						 "plug-ins", "NimbleTools.py" )
+
+def readJobs( path ):
+	'''Returns the list of jobs in a job file.'''
+	stream = open( path, "r" )
+	try:
+		jobs = json.load( stream )
+	finally:
+		stream.close()
+	if isinstance( jobs, dict ):
+		jobs = [ jobs ]
+	if not isinstance( jobs, list ):
+		raise ValueError( "%s does not hold a job or a list of jobs." % path )
+	for i in range( len( jobs ) ):
+		if not isinstance( jobs[i], dict ) or not jobs[i].get( "scene" ):
+			raise ValueError( "Job %d in %s has no scene." % (i, path) )
+	return jobs
+
+def commandFlags( job ):
+	'''The nsUninstancer flags for a job, as maya.cmds keyword arguments.'''
+	flags = {}
+	for key in kFlagKeys:
+		if job.has_key( key ):
+			flags[key] = job[key]
+	for (key, value) in job.get( "flags", {} ).items():
+		if isinstance( value, list ):
+			value = tuple( value )
+		flags[str( key )] = value
+	if job.get( "outputFile" ):
+		flags["outputFile"] = job["outputFile"]
+		flags["loadOutput"] = "none"
+	return flags
+
+def runJob( job ):
+	'''Bake one job and return the nsUninstancer result. Maya has to
+	   have been initialized and NimbleTools loaded.'''
+	import maya.cmds as mc
+	import ns.maya.RunUpCache
+	
+	mc.file( new=True, force=True )
+	# States from the last scene are of no use in this one.
+	#
+	ns.maya.RunUpCache.sessionCache().invalidate()
+	for plugin in job.get( "plugins", [] ):
+		if not mc.pluginInfo( plugin, query=True, loaded=True ):
+			mc.loadPlugin( plugin )
+	mc.file( job["scene"], open=True, force=True )
+	
+	targets = [ str( target ) for target in job.get( "targets", [] ) ]
+	result = mc.nsUninstancer( *targets, **commandFlags( job ) )
+	
+	if job.get( "saveAs" ):
+		fileType = "mayaBinary"
+		if os.path.splitext( job["saveAs"] )[1].lower() == ".ma":
+			fileType = "mayaAscii"
+		mc.file( rename=job["saveAs"] )
+		mc.file( save=True, force=True, type=fileType )
+	return result
+
+def runJobs( jobs ):
+	'''Run every job, whether or not the ones before it failed, and
+	   return their statuses.'''
+	statuses = []
+	for i in range( len( jobs ) ):
+		job = jobs[i]
+		status = { "name" : job.get( "name", "%d: %s" % (i, job["scene"]) ),
+				   "status" : "succeeded",
+				   "error" : None,
+				   "result" : None }
+		start = time.time()
+		try:
+			status["result"] = runJob( job )
+		except Exception, e:
+			status["status"] = "failed"
+			status["error"] = str( e ).strip()
+		status["seconds"] = time.time() - start
+		statuses.append( status )
+	return statuses
+
+def writeStatus( statuses, exitCode, path=None ):
+	report = json.dumps( { "exitCode" : exitCode, "jobs" : statuses }, indent=4 )
+	if not path:
+		sys.stdout.write( report + "\n" )
+		return
+	# Write the whole report or nothing, the farm may be watching for it.
+	#
+	stream = open( path + ".tmp", "w" )
+	try:
+		stream.write( report + "\n" )
+	finally:
+		stream.close()
+	# rename() replaces the old report atomically, except on Windows
+	# where it can't replace an existing file.
+	#
+	if os.name == "nt" and os.path.exists( path ):
+		os.remove( path )
+	os.rename( path + ".tmp", path )
+
+def main( argv ):
+	parser = optparse.OptionParser( usage="mayapy Batch.py [options] jobs.json" )
+	parser.add_option( "--plugin", default=defaultPlugin() )
+	parser.add_option( "--status" )
+	(options, args) = parser.parse_args( argv )
+	if len( args ) != 1:
+		parser.error( "Exactly one job file is needed." )
+	
+	try:
+		jobs = readJobs( args[0] )
+	except Exception, e:
+		writeStatus( [], kExitBadJobs, options.status )
+		sys.stderr.write( "Unable to read the jobs: %s\n" % e )
+		return kExitBadJobs
+	
+	try:
+		import maya.standalone
+		maya.standalone.initialize( name="python" )
+		import maya.cmds as mc
+		mc.loadPlugin( options.plugin )
+	except Exception, e:
+		writeStatus( [], kExitMayaFailed, options.status )
+		sys.stderr.write( "Unable to start Maya: %s\n" % e )
+		return kExitMayaFailed
+	
+	statuses = runJobs( jobs )
+	exitCode = kExitSucceeded
+	for status in statuses:
+		if status["status"] != "succeeded":
+			exitCode = kExitJobFailed
+	writeStatus( statuses, exitCode, options.status )
+	return exitCode
+
+if __name__ == "__main__":
+	# Make the ns package importable. It lives in the python directory
+	# three levels above this one.
+	#
+	sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) ) ) )
+	sys.exit( main( sys.argv[1:] ) )
@@ -20,6 +20,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.	
 
+import collections
 import sys
 
 from maya.OpenMaya import *
@@ -32,15 +33,21 @@ import ns.py.Timer
 
 import ns.maya as nsm
 import ns.maya.InstancerUtil
+import ns.maya.uninstancer.KeyBuffer
 
 
-class eLife:
-	aliveLastFrame, aliveThisFrame, dead, numValues = range(4)
+# Transform attributes keyed by AnimatedUninstance, in KeyBuffer.eChannel
+# order.
+#
+kTransformAttrs = ( "translateX", "translateY", "translateZ",
+					"rotateX", "rotateY", "rotateZ",
+					"scaleX", "scaleY", "scaleZ" )
 
 class Geometry:
 	def __init__(self):
 		self.root = MDagPath()
 		self.shapes = []
+		self._template = None
 		
 	def fromInstancer(self, dpInstancer, index):
 		MDagPath.getAPathTo( nsm.InstancerUtil.getInstance( dpInstancer, index ),
@@ -51,11 +58,32 @@ class Geometry:
 		self.root = dpTransform
 		self._fillShapes()
 		
-	def duplicate(self, copyAsInstance, suffix):
-		dpDuplicate = self._duplicate( self.root, copyAsInstance, suffix )
-		dup = Geometry()
-		dup.fromTransform(dpDuplicate)
-		return dup
+	def fromClone(self, dpRoot, shapes):
+		'''Initialize from a copy whose shapes are already known.'''
+		self.root = dpRoot
+		self.shapes = shapes
+	
+	def duplicate(self, copyAsInstance, names, batch):
+		'''Duplicate the geometry and parent the duplicate to world. names
+		   is the NameAllocator used to name the duplicate's nodes. The
+		   reparent is queued on batch (a ModifierBatch), the duplicate's
+		   root path is updated when the batch is committed.'''
+		return self.duplicates( 1, copyAsInstance, names, batch )[0]
+	
+	def duplicates(self, count, copyAsInstance, names, batch):
+		'''Returns count duplicates of the geometry. See duplicate().'''
+		if not self._template:
+			self._template = PrototypeTemplate( self.root )
+		if self._template.isSupported():
+			return self._template.clone( count, copyAsInstance, names, batch )
+		
+		dups = []
+		for i in range( count ):
+			dpDuplicate = self._duplicate( self.root, copyAsInstance, names, batch )
+			dup = Geometry()
+			dup.fromTransform(dpDuplicate)
+			dups.append( dup )
+		return dups
 		
 	def _fillShapes(self):
 		'''Get all the shapes that are descendants of the root transform.'''
@@ -68,7 +96,7 @@ class Geometry:
 				self.shapes.append( it.item() )
 			it.next()
 
-	def _duplicate( self, dpOriginal, copyAsInstance, suffix ):
+	def _duplicate( self, dpOriginal, copyAsInstance, names, batch ):
 		fInstanced = MFnDependencyNode( dpOriginal.transform() )
 		
 		# We need the full path to the instanced object, but if that
@@ -94,29 +122,31 @@ class Geometry:
 		dpDuplicate = MDagPath()
 		duplicateList.getDagPath( 0, dpDuplicate )
 		
-		self._renameHierarchy( dpDuplicate, dpOriginal, suffix )
-		
 		if not dpDuplicate.node().hasFn( MFn.kTransform ):
 			raise ns.Errors.UnsupportedError( "Currently only instanced transforms are supported." )
 			
 		fDuplicate = MFnTransform( dpDuplicate.transform() )
 		if not fDuplicate.parent(0).hasFn( MFn.kWorld ):
-			oDuplicate = dpDuplicate.transform()
-			modifier = MDagModifier()
-			modifier.reparentNode( oDuplicate )
-			modifier.doIt()
-			MDagPath.getAPathTo( oDuplicate, dpDuplicate )
+			batch.reparentToWorld( dpDuplicate )
+		
+		# Renamed after the reparent, as in PrototypeTemplate.clone()
+		#
+		if not names.useDefaultNames():
+			self._renameHierarchy( dpDuplicate, dpOriginal, names, batch )
 		
 		return dpDuplicate
 				
-	def _renameHierarchy( self, dpDuplicate, dpInstance, suffix ):
+	def _renameHierarchy( self, dpDuplicate, dpInstance, names, batch ):
 		itDup = MItDag()
 		itInst = MItDag()
 		itDup.reset( dpDuplicate )
 		itInst.reset( dpInstance )
 		
-		dupRootName = ""
-		
+		# Gather the nodes to rename first so that the names for the
+		# whole duplicate can be allocated at once.
+		#
+		nodes = []
+		originalNames = []
 		while not itDup.isDone():
 			# Always skip instanced nodes. If we are copying as instance
 			# then we want to make sure we don't rename the original
@@ -128,26 +158,181 @@ class Geometry:
 			# uninstances stuff as it goes)
 			#
 			if itDup.instanceCount( True ) <= 1:
-				fInst = MFnDependencyNode( itInst.item() )
-				dupName = fInst.name() + suffix
-				
-				dpDup = MDagPath()
-				itDup.getPath( dpDup )
-				
-				name = ""
-				if itDup.item().hasFn( MFn.kShape ):
-					name = mc.rename( dpDup.fullPathName(), dupName )
-				else:
-					name = mc.rename( dpDup.fullPathName(), dupName, ignoreShape=True )
-
-				if not dupRootName:
-					dupRootName = name
+				nodes.append( itDup.item() )
+				originalNames.append( MFnDependencyNode( itInst.item() ).name() )
 
 			itInst.next()
 			itDup.next()
 		
-		return dupRootName
+		if not nodes:
+			return
+		
+		# Setting the names through the API avoids the scene-wide search
+		# for a free "#" number that renaming with a "_#" suffix triggers.
+		#
+		newNames = names.names( originalNames )
+		for i in range( len( nodes ) ):
+			batch.rename( nodes[i], newNames[i] )
+			
+def blendShapeWeight( index, maxTargets ):
+	'''The in-between weight that shows the index'th instanced object. The
+	   base shape is index -1.'''
+	weightIncrement = 1.0 / float( maxTargets )
+	weight = float( index + 1 ) * weightIncrement
+	return round( weight, 3 )
+
+class PrototypeTemplate:
+	'''The layout of an instanced object's hierarchy, gathered once so that
+	   copies can be made through the API. The copies' nodes are found by
+	   their child index path from the copy's root rather than by name, and
+	   their shapes are known without walking the copy.
+	   
+	   Hierarchies the API can't copy faithfully (shapes with per-component
+	   shading) are flagged as unsupported and should be copied with the
+	   duplicate command instead.'''
+	
+	def __init__(self, dpRoot):
+		# Like the duplicate command, copy the shape's transform if a
+		# shape was instanced.
+		#
+		self.root = MDagPath()
+		MDagPath.getAPathTo( dpRoot.transform(), self.root )
+		
+		# Per node, in depth first order: the child indices leading to
+		# the node from the root, and the node's name.
+		#
+		self._slots = []
+		self._names = []
+		# Nodes that only have one path are renamed, nodes instanced
+		# within the hierarchy keep the names Maya gives them.
+		#
+		self._renamedSlots = []
+		self._shapeSlots = []
+		# The shading engines each shape is a member of.
+		#
+		self._shadingEngines = []
+		self._supported = True
+		
+		self._walk( MDagPath( self.root ), [] )
+	
+	def isSupported(self):
+		return self._supported
+	
+	def clone(self, count, copyAsInstance, names, batch):
+		'''Returns count Geometry copies of the template's hierarchy, parented
+		   to world through batch.'''
+		fRoot = MFnDagNode( self.root )
+		if copyAsInstance:
+			# Only the root transform is new, the rest is shared with
+			# the original.
+			#
+			renamedSlots = [ 0 ]
+		else:
+			renamedSlots = self._renamedSlots
+		originalNames = [ self._names[slot] for slot in renamedSlots ]
+		
+		clones = []
+		for i in range( count ):
+			oClone = fRoot.duplicate( copyAsInstance, False )
+			dpClone = MDagPath()
+			MDagPath.getAPathTo( oClone, dpClone )
+			
+			shapes = [ self._node( oClone, slot ) for slot in self._shapeSlots ]
 			
+			if not MFnDagNode( dpClone ).parent(0).hasFn( MFn.kWorld ):
+				batch.reparentToWorld( dpClone )
+			
+			# Renamed after the reparent so that the names are only
+			# checked against the world's children they were
+			# allocated among.
+			#
+			if not names.useDefaultNames():
+				newNames = names.names( originalNames )
+				for j in range( len( renamedSlots ) ):
+					batch.rename( self._node( oClone, renamedSlots[j] ), newNames[j] )
+			
+			clone = Geometry()
+			clone.fromClone( dpClone, shapes )
+			clones.append( clone )
+		
+		if not copyAsInstance:
+			self._assignShading( clones )
+		return clones
+	
+	def _node(self, oClone, slot):
+		oNode = oClone
+		for index in self._slots[slot]:
+			oNode = MFnDagNode( oNode ).child( index )
+		return oNode
+	
+	def _walk(self, dpNode, indices):
+		slot = len( self._slots )
+		self._slots.append( tuple( indices ) )
+		fNode = MFnDagNode( dpNode )
+		self._names.append( fNode.name() )
+		if fNode.instanceCount( True ) <= 1:
+			self._renamedSlots.append( slot )
+		if dpNode.node().hasFn( MFn.kShape ):
+			self._shapeSlots.append( slot )
+			self._shadingEngines.append( self._shapeShadingEngines( dpNode ) )
+		
+		for i in range( dpNode.childCount() ):
+			dpChild = MDagPath( dpNode )
+			dpChild.push( dpNode.child( i ) )
+			self._walk( dpChild, indices + [ i ] )
+	
+	def _shapeShadingEngines(self, dpShape):
+		fShape = MFnDagNode( dpShape )
+		try:
+			pInstObjGroups = fShape.findPlug( "instObjGroups", False )
+		except RuntimeError, e:
+			# Not a renderable shape.
+			#
+			return []
+		pInstObjGroup = pInstObjGroups.elementByLogicalIndex( dpShape.instanceNumber() )
+		
+		pObjectGroups = pInstObjGroup.child( 0 )
+		if pObjectGroups.numConnectedElements():
+			# Per-component shading - the API won't set up the copies'
+			# object groups.
+			#
+			self._supported = False
+			return []
+		
+		destinations = MPlugArray()
+		pInstObjGroup.connectedTo( destinations, False, True )
+		shadingEngines = []
+		for i in range( destinations.length() ):
+			oSet = destinations[i].node()
+			if oSet.hasFn( MFn.kShadingEngine ):
+				shadingEngines.append( oSet )
+		return shadingEngines
+	
+	def _assignShading(self, clones):
+		'''Add the copies' shapes to their originals' shading engines, one
+		   set edit per shading engine for the whole group of copies.'''
+		if not clones:
+			return
+		for i in range( len( self._shapeSlots ) ):
+			for oSet in self._shadingEngines[i]:
+				fSet = MFnSet( oSet )
+				members = MSelectionList()
+				for clone in clones:
+					members.add( self._shapePath( clone, i ) )
+				# Depending on the Maya version the copies may already
+				# have been assigned.
+				#
+				dpFirst = MDagPath()
+				members.getDagPath( 0, dpFirst )
+				if not fSet.isMember( dpFirst ):
+					fSet.addMembers( members )
+	
+	def _shapePath(self, clone, shapeIndex):
+		dpShape = MDagPath( clone.root )
+		for index in self._slots[self._shapeSlots[shapeIndex]]:
+			dpShape.push( MFnDagNode( dpShape.node() ).child( index ) )
+		return dpShape
+	
 class BlendShape(Geometry):
 	def __init__(self, maxTargets):
 		Geometry.__init__( self )
@@ -187,9 +372,7 @@ class BlendShape(Geometry):
 			fWeightAnim.addKeyframe( time, weight )
 
 	def _blendShapeWeight( self, index ):
-		weightIncrement = 1.0 / float( self._maxTargets )
-		weight = float( index + 1 ) * weightIncrement
-		return round( weight, 3 )
+		return blendShapeWeight( index, self._maxTargets )
 					
 	def _createBlendShape( self ):
 		numShapes = len( self.shapes )
@@ -213,12 +396,19 @@ class Uninstance:
 	def bake(self, particleIndex):
 		pass
 	
-	def endFrame(self):
-		pass
+	def retire(self):
+		'''Called when the uninstance's particle dies. Nothing more will be
+		   baked to the uninstance.'''
+		self.finalize()
 	
 	def finalize(self):
 		pass
 	
+	def needsCommit(self):
+		'''Whether retire() or finalize() would have to commit the
+		   instancer's batch first.'''
+		return False
+	
 class StaticUninstance(Uninstance):
 	def __init__(self, instancer):
 		Uninstance.__init__( self, instancer )
@@ -234,107 +424,80 @@ class StaticUninstance(Uninstance):
 		
 		# Transform its base matrix by the particle transformation
 		#
-		paths = MDagPathArray()
-		matrix = MMatrix()
-		self._instancer.fInstancer.instancesForParticle( particleIndex, paths, matrix )
-	 
-		newMatrix = MMatrix()
-		newMatrix.setToProduct( self._instancer.getMatrix( objectIndex ), matrix )
+		newMatrix = self._instancer.getInstanceMatrix( particleIndex, objectIndex )
 		
 		# Duplicate the appropriate instanced object.
 		#
 		dup = self._instancer.duplicateInstance( objectIndex )
 		self._paths.append( dup.root )
 		
-		fNewTransform = MFnTransform( dup.root.transform() )
-		fNewTransform.set( MTransformationMatrix( newMatrix ) )
+		self._instancer.batch().setTransformation( dup.root.transform(), newMatrix )
 		
 
 	
+class NodePool:
+	'''Animated duplicates whose particles have died, by object index.
+	   A particle born after a duplicate's particle died can take the
+	   duplicate over instead of creating a new one, so the number of
+	   duplicates grows with the peak number of live particles rather
+	   than the total number born.'''
+	
+	def __init__(self):
+		self._free = {}
+	
+	def release(self, objectIndex, uninstance, time):
+		'''uninstance's particle died at time (in UI units).'''
+		try:
+			free = self._free[objectIndex]
+		except KeyError, e:
+			free = collections.deque()
+			self._free[objectIndex] = free
+		free.append( (time, uninstance) )
+	
+	def acquire(self, objectIndex, time):
+		'''Returns a free uninstance for the objectIndex whose particle died
+		   before time, or None if there isn't one.'''
+		try:
+			free = self._free[objectIndex]
+		except KeyError, e:
+			return None
+		# Duplicates are released in time order so the oldest is first.
+		#
+		if free and free[0][0] < time:
+			return free.popleft()[1]
+		return None
+
 class AnimatedUninstance(Uninstance):
-	def __init__(self, instancer):
+	def __init__(self, instancer, keyBufferSize=nsm.uninstancer.KeyBuffer.kDefaultMaxFrames, pool=None, reduction=None):
 		Uninstance.__init__( self, instancer )
+		self._pool = pool
 		self._initialized = False
 		self._geometry = Geometry()
 		self._objectIndex = -1
-		self._life = eLife.numValues
-		
-		self._fTxAnim = MFnAnimCurve()
-		self._fTyAnim = MFnAnimCurve()
-		self._fTzAnim = MFnAnimCurve()
-		
-		self._fRxAnim = MFnAnimCurve()
-		self._fRyAnim = MFnAnimCurve()
-		self._fRzAnim = MFnAnimCurve()
-		
-		self._fSxAnim = MFnAnimCurve()
-		self._fSyAnim = MFnAnimCurve()
-		self._fSzAnim = MFnAnimCurve()
 		
+		# Curves in KeyBuffer.eChannel order.
+		#
+		self._fTransformAnims = []
 		self._fVAnim = MFnAnimCurve()
-		
-#		self._times = MTimeArray()
-#		self._txKeys = MDoubleArray()
-#		self._tyKeys = MDoubleArray()
-#		self._tzKeys = MDoubleArray()
-#		self._rxKeys = MDoubleArray()
-#		self._ryKeys = MDoubleArray()
-#		self._rzKeys = MDoubleArray()
-#		self._sxKeys = MDoubleArray()
-#		self._syKeys = MDoubleArray()
-#		self._szKeys = MDoubleArray()
+		self._keys = nsm.uninstancer.KeyBuffer.KeyBuffer( keyBufferSize, reduction )
+		# The batch's numCommits() when the curves were queued on it.
+		#
+		self._curvesQueued = -1
 		
 	def bake(self, particleIndex):
 		objectIndex = self._instancer.getObjectIndex( particleIndex )
 		
 		if not self._initialized:
 			self._initialize( objectIndex )
-			
-		self._life = eLife.aliveThisFrame
 
-		# Transform its base matrix by the particle transformation
+		# The particle's transformation was decomposed for the whole
+		# frame by Instancer.decompose()
 		#
-		paths = MDagPathArray()
-		matrix = MMatrix()
-		self._instancer.fInstancer.instancesForParticle( particleIndex, paths, matrix )
-	 
-		newMatrix = MMatrix()
-		newMatrix.setToProduct( self._instancer.getMatrix( objectIndex ), matrix )
-
-		transformation = MTransformationMatrix( newMatrix )
-		translation = transformation.getTranslation( MSpace.kTransform )
-		rotation = transformation.eulerRotation()
-		scaleUtil = MScriptUtil()
-		scaleUtil.createFromDouble( 0.0, 0.0, 0.0 );
-		scalePtr = scaleUtil.asDoublePtr()
-		transformation.getScale( scalePtr, MSpace.kTransform )
-
-		time = MAnimControl.currentTime()
-		self._fTxAnim.addKeyframe( time, translation.x )
-		self._fTyAnim.addKeyframe( time, translation.y )
-		self._fTzAnim.addKeyframe( time, translation.z )
-
-		self._fRxAnim.addKeyframe( time, rotation.x )
-		self._fRyAnim.addKeyframe( time, rotation.y )
-		self._fRzAnim.addKeyframe( time, rotation.z )
-		
-		self._fSxAnim.addKeyframe( time, MScriptUtil.getDoubleArrayItem( scalePtr, 0 ) )
-		self._fSyAnim.addKeyframe( time, MScriptUtil.getDoubleArrayItem( scalePtr, 1 ) )
-		self._fSzAnim.addKeyframe( time, MScriptUtil.getDoubleArrayItem( scalePtr, 2 ) )
-
-#		Once MFnAnimCurve.setKeys(...) is fixed, we can set all the keys
-#		at once for a noticeable speed up.
-#		self._times.append( time )
-#		self._txKeys.append( translation.x )
-#		self._tyKeys.append( translation.y )
-#		self._tzKeys.append( translation.z )
-#		self._rxKeys.append( rotation.x )
-#		self._ryKeys.append( rotation.y )
-#		self._rzKeys.append( rotation.z )
-#		self._sxKeys.append( MScriptUtil.getDoubleArrayItem( scalePtr, 0 ) )
-#		self._syKeys.append( MScriptUtil.getDoubleArrayItem( scalePtr, 1 ) )
-#		self._szKeys.append( MScriptUtil.getDoubleArrayItem( scalePtr, 2 ) )
+		(tx, ty, tz, rx, ry, rz, sx, sy, sz) = self._instancer.getTransformation( particleIndex )
 
+		time = self._instancer.time()
+		if self._keys.add( time.value(), (tx, ty, tz, rx, ry, rz, sx, sy, sz) ):
+			self._flushKeys()
 		
 		if objectIndex != self._objectIndex:
 			# This particle's objectIndex has changed - we may
@@ -378,60 +541,85 @@ class AnimatedUninstance(Uninstance):
 		
 		self._objectIndex = objectIndex
 		
-	def endFrame(self):
-		if eLife.aliveThisFrame == self._life:
-			self._life = eLife.aliveLastFrame
-		elif eLife.aliveLastFrame == self._life:
-			self._life = eLife.dead
-			self._fVAnim.addKeyframe( MAnimControl.currentTime(), 0.0,
-								 	   MFnAnimCurve.kTangentStep,
-								 	   MFnAnimCurve.kTangentStep )
+	def retire(self):
+		# The particle died after the last baked frame so hide the
+		# duplicate from this frame on.
+		#
+		if self._initialized:
+			self._keys.addVisibility( self._instancer.time().value(), 0.0 )
+		self.finalize()
+		
+		# A duplicate can only be recycled if it has only ever shown
+		# one instanced object.
+		#
+		if (self._pool is not None and
+			self._initialized and
+			not self._instancer.hasBlendShapes() and
+			not isinstance( self._geometry, BlendShape )):
+			# Hold the last key of each curve until the duplicate's next
+			# particle is born rather than interpolating towards it.
+			#
+			for fAnim in self._fTransformAnims:
+				numKeys = fAnim.numKeys()
+				if numKeys:
+					fAnim.setOutTangentType( numKeys - 1, MFnAnimCurve.kTangentStep )
+			self._pool.release( self._objectIndex,
+								self,
+								self._instancer.time().value() )
 		
 	def finalize(self):
-		pass
-#		This optimization should work, but the API is being flaky when
-#		setting all these keys at once
-#		self._fTxAnim.addKeys( self._times, self._txKeys )
-#		self._fTyAnim.addKeys( self._times, self._tyKeys )
-#		self._fTzAnim.addKeys( self._times, self._tzKeys )
-#		
-#		self._fRxAnim.addKeys( self._times, self._rxKeys )
-#		self._fRyAnim.addKeys( self._times, self._ryKeys )
-#		self._fRzAnim.addKeys( self._times, self._rzKeys )
-#		
-#		self._fSxAnim.addKeys( self._times, self._sxKeys )
-#		self._fSyAnim.addKeys( self._times, self._syKeys )
-#		self._fSzAnim.addKeys( self._times, self._szKeys )
+		self._flushKeys()
 		
+	def needsCommit(self):
+		return self._initialized and self._instancer.batch().numCommits() == self._curvesQueued
 	
-		
+	def _flushKeys(self):
+		if self._initialized:
+			# Only commit if this uninstance's curves are still waiting
+			# to be created.
+			#
+			if self.needsCommit():
+				self._instancer.batch().commit()
+			self._keys.flush( self._fTransformAnims, self._fVAnim )
 		
 	def _initialize(self, objectIndex):
+		birthFrame = self._instancer.time().value()
+		if self._pool is not None:
+			recycled = self._pool.acquire( objectIndex, birthFrame )
+			if recycled:
+				# Take over a duplicate whose particle has died. Its path
+				# has already been reported by that uninstance and it is
+				# hidden until this particle is born.
+				#
+				self._geometry = recycled._geometry
+				self._fTransformAnims = recycled._fTransformAnims
+				self._fVAnim = recycled._fVAnim
+				self._curvesQueued = recycled._curvesQueued
+				self._keys.addVisibility( birthFrame, 1.0 )
+				self._objectIndex = objectIndex
+				self._initialized = True
+				return
+		
 		self._geometry = self._instancer.duplicateInstance( objectIndex )
 		self._paths.append( self._geometry.root )
 				
+		# The curves are created and connected with the rest of the
+		# batch. Keys are buffered until then.
+		#
+		batch = self._instancer.batch()
 		fNode = MFnTransform( self._geometry.root.transform() )
-		fGenerator = MFnAnimCurve()
 		
-		self._fTxAnim = MFnAnimCurve( fGenerator.create( fNode.findPlug( "translateX", True ) ) )
-		self._fTyAnim = MFnAnimCurve( fGenerator.create( fNode.findPlug( "translateY", True ) ) )
-		self._fTzAnim = MFnAnimCurve( fGenerator.create( fNode.findPlug( "translateZ", True ) ) )
-		
-		self._fRxAnim = MFnAnimCurve( fGenerator.create( fNode.findPlug( "rotateX", True ) ) )
-		self._fRyAnim = MFnAnimCurve( fGenerator.create( fNode.findPlug( "rotateY", True ) ) )
-		self._fRzAnim = MFnAnimCurve( fGenerator.create( fNode.findPlug( "rotateZ", True ) ) )
-
-		self._fSxAnim = MFnAnimCurve( fGenerator.create( fNode.findPlug( "scaleX", True ) ) )
-		self._fSyAnim = MFnAnimCurve( fGenerator.create( fNode.findPlug( "scaleY", True ) ) )
-		self._fSzAnim = MFnAnimCurve( fGenerator.create( fNode.findPlug( "scaleZ", True ) ) )
-		
-		self._fVAnim = MFnAnimCurve( fGenerator.create( fNode.findPlug( "visibility", True ) ) )
-		self._fVAnim.addKeyframe( MTime( self._instancer.startFrame(), MTime.uiUnit() ), 0.0,
-							 	  MFnAnimCurve.kTangentStep,
-							 	  MFnAnimCurve.kTangentStep )
-		self._fVAnim.addKeyframe( MAnimControl.currentTime(), 1.0,
-							 	  MFnAnimCurve.kTangentStep,
-							 	  MFnAnimCurve.kTangentStep )
+		self._fTransformAnims = []
+		for attrName in kTransformAttrs:
+			oAnim = batch.createAnimCurve( fNode.findPlug( attrName, True ) )
+			self._fTransformAnims.append( MFnAnimCurve( oAnim ) )
+		
+		self._fVAnim = MFnAnimCurve( batch.createAnimCurve( fNode.findPlug( "visibility", True ) ) )
+		self._curvesQueued = batch.numCommits()
+		startFrame = self._instancer.startFrame()
+		if startFrame < birthFrame:
+			self._keys.addVisibility( startFrame, 0.0 )
+		self._keys.addVisibility( birthFrame, 1.0 )
 		
 		self._objectIndex = objectIndex
 		self._initialized = True
@@ -20,19 +20,36 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.	
 
+import array
+import math
+
 from maya.OpenMaya import *
 from maya.OpenMayaFX import *
 
 
 import ns.py as nspy
 import ns.py.Const
+import ns.py.Cycle
+import ns.py.Errors
+import ns.py.Transform
 
 import ns
 import ns.maya as nsm
 import ns.maya.uninstancer
+import ns.maya.uninstancer.Names
+import ns.maya.DG
+import ns.maya.ModifierBatch
 import ns.maya.ParticleUtil
 from ns.maya.uninstancer.Geometry import *
 
+# NumPy is optional, without it decompose() uses MTransformationMatrix for
+# every particle.
+#
+try:
+	import numpy
+except ImportError, e:
+	numpy = None
+
 				
 	
 class eInstancerCycle:
@@ -43,18 +60,49 @@ class eInstancerCycleUnit:
 					
 class Instancer:
 	
-	def __init__(self, dpParticle, dpInstancer):
+	def __init__(self, dpParticle, dpInstancer, particleData=None):
 		self._cycleType = eInstancerCycle.noCycle
 		self._numInstances = 0
 		self._instances = []
 		self._matrices = []
-		self._objectIndices = MIntArray()
+		self._rotateOrders = []
+		self._objectIndices = []
+		self._mappedAttributes = {}
 		self._blendShapes = []
+		# Per-frame snapshot of every particle's instancer matrix and
+		# instanced paths. Filled in bulk by update().
+		#
+		self._particleMatrices = MMatrixArray()
+		self._particlePaths = MDagPathArray()
+		self._pathStartIndices = MIntArray()
+		self._pathIndices = MIntArray()
+		# The snapshot's matrices as one flat array('d') of 16 row-major
+		# values per particle. Extracted at most once per frame, when
+		# first needed, and shared by decompose(), capture() and the
+		# frame hash.
+		#
+		self._particleMatrixValues = array.array( 'd' )
+		# Translate, rotate and scale values decomposed from the
+		# snapshot by decompose(), by particle index.
+		#
+		self._transforms = {}
 		self._copyAsInstance = False
+		self._names = None
+		self._batch = None
+		self._time = MTime()
+		self._startFrame = 0
+		# Duplicates made ahead of time by prepareDuplicates(), by
+		# object index.
+		#
+		self._spares = {}
 		
 		self._fParticle = MFnParticleSystem( dpParticle )
 		self.fInstancer = MFnInstancer( dpInstancer )
 		(oParticle, self._instancerIndex) = nsm.InstancerUtil.particle( dpInstancer )
+		# The snapshot can be shared by every instancer of the particle
+		# system.
+		#
+		self._particleData = particleData or nsm.ParticleUtil.ParticleSnapshot( dpParticle )
 
 	def numInstances(self):
 		return self._numInstances
@@ -71,30 +119,97 @@ class Instancer:
 	def getMatrix(self, index):
 		return self._matrices[index]
 	
+	def names(self):
+		'''The NameAllocator that duplicates are named with.'''
+		return self._names
+	
+	def batch(self):
+		'''The ModifierBatch that duplicates are created through.'''
+		return self._batch
+	
+	def particleData(self):
+		return self._particleData
+	
+	def mappedData(self, option, default=""):
+		'''Returns the current frame's per-particle array for the attribute
+		   mapped to the given instancer option (e.g. "age"), or for default
+		   if nothing is mapped. Returns None if there is neither.'''
+		try:
+			attrName = self._mappedAttributes[option]
+		except KeyError, e:
+			attrName = nsm.ParticleUtil.mappedAttribute( self._fParticle.dagPath(),
+														 option,
+														 self._instancerIndex )
+			self._mappedAttributes[option] = attrName
+		return self._particleData.array( attrName or default )
+	
+	def particleCount(self):
+		return self._particleMatrices.length()
+	
+	def getParticleMatrix(self, particleIndex):
+		return self._particleMatrices[particleIndex]
+	
+	def particleMatrixValues(self):
+		'''Every particle's instancer matrix for the current frame as a
+		   flat array('d') of 16 row-major values per particle.'''
+		if self._particleMatrixValues is None:
+			self._particleMatrixValues = nspy.Transform.matrixArrayValues( self._particleMatrices )
+		return self._particleMatrixValues
+	
+	def getInstanceMatrix(self, particleIndex, objectIndex):
+		'''The instanced object's base matrix transformed by the
+		   particle's instancer matrix for the current frame.'''
+		return self._matrices[objectIndex] * self._particleMatrices[particleIndex]
+	
+	def getTransformation(self, particleIndex):
+		'''Returns the (tx, ty, tz, rx, ry, rz, sx, sy, sz) values computed
+		   for the particle by the last call to decompose().'''
+		return self._transforms[particleIndex]
+	
 	def startFrame(self):
-		aStartFrame = self._fParticle.attribute( "startFrame" )
-		return MPlug( self._fParticle.object(), aStartFrame ).asInt()
+		'''The particle system's start frame when reset() was called. A
+		   cached run up changes it for the length of the bake.'''
+		return self._startFrame
 	
 	def duplicateInstance(self, index):
 		if self._blendShapes:
 			if self._blendShapes[index]:
-				return self._blendShapes[index].duplicate( self._copyAsInstance, "" )
+				return self._blendShapes[index].duplicate( self._copyAsInstance, self._names, self._batch )
 			else:
 				blendShape = BlendShape( self._numInstances )
-				blendShape.setBaseShape( self._instances[index].duplicate( False, "_#" ) )
+				blendShape.setBaseShape( self._instances[index].duplicate( False, self._names, self._batch ) )
 				for i in range( self._numInstances ):
 					blendShape.addBlendShapeTarget( self._instances[i], i )
-				blendShape.keyWeight( MAnimControl.currentTime(), -1 )
+				blendShape.keyWeight( self._time, -1 )
 				self._blendShapes[index] = blendShape
 				return blendShape
 		else:
-			return self._instances[index].duplicate( self._copyAsInstance, "_#" )
+			spares = self._spares.get( index )
+			if spares:
+				return spares.pop()
+			return self._instances[index].duplicate( self._copyAsInstance, self._names, self._batch )
+	
+	def prepareDuplicates(self, counts):
+		'''Make the duplicates that the next duplicateInstance() calls will
+		   need in one go. counts maps object index to number of duplicates.
+		   Every duplicate prepared must be taken by duplicateInstance().'''
+		if self._blendShapes:
+			# Blend shape duplicates are copies of the blend shapes,
+			# which change from frame to frame.
+			#
+			return
+		for (index, count) in counts.items():
+			dups = self._instances[index].duplicates( count, self._copyAsInstance, self._names, self._batch )
+			# duplicateInstance() pops from the end.
+			#
+			dups.reverse()
+			self._spares[index] = dups + self._spares.get( index, [] )
 	
 	def getObjectIndex(self, particleIndex):
 		objectIndex = 0
 		if self._objectIndices:
 			assert particleIndex < len( self._objectIndices )
-			objectIndex = self._objectIndices[ particleIndex ]
+			objectIndex = int( self._objectIndices[ particleIndex ] )
 			
 			if objectIndex >= self._numInstances:
 				# It seems that when an index is used that is greater
@@ -106,8 +221,13 @@ class Instancer:
 		assert self._instances[ objectIndex ].root.isValid()
 		return objectIndex
 	
-	def reset(self, copyAsInstance, bakeAnimation):
+	def reset(self, copyAsInstance, bakeAnimation, names=None, batch=None):
 		self._copyAsInstance = copyAsInstance
+		self._names = names or nsm.uninstancer.Names.NameAllocator()
+		self._batch = batch or nsm.ModifierBatch.ModifierBatch()
+		self._mappedAttributes = {}
+		aStartFrame = self._fParticle.attribute( "startFrame" )
+		self._startFrame = MPlug( self._fParticle.object(), aStartFrame ).asInt()
 		aCycle = self.fInstancer.attribute( "cycle" )
 		self._cycleType = MPlug( self.fInstancer.object(), aCycle ).asInt()
 	
@@ -123,17 +243,72 @@ class Instancer:
 		self._instances = [ Geometry() for i in range(self._numInstances) ]
 		for i in range( self._numInstances ):
 			self._instances[i].fromInstancer( self.fInstancer.dagPath(), i )
+		
+		# The duplicates keep their instanced object's rotate order so
+		# their rotations have to be decomposed in that order.
+		#
+		self._rotateOrders = []
+		for instance in self._instances:
+			pRotateOrder = nsm.DG.getPlug( node=instance.root.transform(), attrName="rotateOrder" )
+			self._rotateOrders.append( pRotateOrder.asInt() )
+	
+	def time(self):
+		'''The time of the frame the instancer was last updated to.'''
+		return self._time
 	
-	def update(self):	
+	def update(self, updateParticleData=True):	
 		# Per-particle indices to consider. Find all of the instanced
 		# objects' base matrices and determine the per-particle index
-		# values.
+		# values. A shared particle snapshot is updated once by its
+		# owner rather than by every instancer.
 		#
+		self._time = MAnimControl.currentTime()
+		if updateParticleData:
+			self._particleData.update()
 		self._fillMatrices()
+		self._fillSnapshot()
 		self._fillObjectIndices()
-		
+		self._updateBlendShapes()
+	
+	def updateFromSample(self, sample, time):
+		'''Update to a frame read from a particle cache (a ParticleSample)
+		   rather than to the particle system's current state. The
+		   instance matrices are composed from the sample the way the
+		   instancer would compose them.'''
+		self._time = time
+		self._particleData = nsm.ParticleUtil.SampleSnapshot( sample )
+		self._fillMatrices()
+		self._composeMatrices()
+		self._fillObjectIndices()
+		self._updateBlendShapes()
+	
+	def updateFromCapture(self, frame, time):
+		'''Update to a frame recorded by a capture (an
+		   ns.py.CaptureStore.CaptureFrame) rather than to the particle
+		   system's current state.'''
+		self._time = time
+		self._fillMatrices()
+		matrices = frame.matrices
+		numParticles = frame.count()
+		self._particleMatrices.setLength( numParticles )
+		for i in range( numParticles ):
+			matrix = MMatrix()
+			MScriptUtil.createMatrixFromList( matrices[16*i:16*(i+1)].tolist(), matrix )
+			self._particleMatrices.set( matrix, i )
+		self._particleMatrixValues = matrices
+		self._objectIndices = frame.objectIndices
+		self._updateBlendShapes()
+	
+	def capture(self):
+		'''Returns the current frame's object index of every particle and
+		   its instancer matrix as 16 row-major values, for
+		   ns.py.CaptureStore.CaptureWriter.addFrame().'''
+		objectIndices = self._objectIndicesOf( range( self.particleCount() ) )
+		return (objectIndices, self.particleMatrixValues())
+	
+	def _updateBlendShapes(self):
 		if self._blendShapes and self._numInstances:
-			time = MAnimControl.currentTime()
+			time = self._time
 			for i in range( self._numInstances ):
 				if self._blendShapes[i]:
 					self._blendShapes[i].keyWeight( time, (i+1) % self._numInstances )
@@ -163,8 +338,130 @@ class Instancer:
 			
 			self._matrices.append( matrix )
 			
+	def decompose(self, particleIndices):
+		'''Decompose the current frame's instance matrices of the given
+		   particles into translate, rotate and scale values. Rotations
+		   are in radians and in the rotate order of each particle's
+		   instanced object. With NumPy the particles are decomposed
+		   together, falling back to MTransformationMatrix for those
+		   ns.py.Transform.decompose() doesn't handle.'''
+		self._transforms = {}
+		if numpy is not None and particleIndices:
+			particleIndices = self._decomposeArrays( particleIndices )
+		
+		# Reuse the same scale buffer for every particle rather than
+		# allocating one per particle.
+		#
+		scaleUtil = MScriptUtil()
+		scaleUtil.createFromDouble( 0.0, 0.0, 0.0 )
+		scalePtr = scaleUtil.asDoublePtr()
+		getScale = MScriptUtil.getDoubleArrayItem
+		
+		baseMatrices = self._matrices
+		particleMatrices = self._particleMatrices
+		rotateOrders = self._rotateOrders
+		transforms = self._transforms
+		
+		for particleIndex in particleIndices:
+			objectIndex = self.getObjectIndex( particleIndex )
+			transformation = MTransformationMatrix( baseMatrices[objectIndex] * particleMatrices[particleIndex] )
+			
+			translation = transformation.getTranslation( MSpace.kTransform )
+			rotation = transformation.eulerRotation()
+			rotation.reorderIt( rotateOrders[objectIndex] )
+			transformation.getScale( scalePtr, MSpace.kTransform )
+			
+			transforms[particleIndex] = ( translation.x, translation.y, translation.z,
+										  rotation.x, rotation.y, rotation.z,
+										  getScale( scalePtr, 0 ),
+										  getScale( scalePtr, 1 ),
+										  getScale( scalePtr, 2 ) )
+	
+	def _decomposeArrays(self, particleIndices):
+		'''Decompose the given particles' instance matrices with NumPy.
+		   Returns the particles that have to be decomposed by
+		   MTransformationMatrix instead.'''
+		objectIndices = numpy.array( self._objectIndicesOf( particleIndices ), dtype=int )
+		particleMatrices = numpy.frombuffer( self.particleMatrixValues(), dtype=numpy.float64 ).reshape( (-1, 4, 4) )
+		baseMatrices = numpy.array( [ nspy.Transform.matrixValues( matrix ) for matrix in self._matrices ] ).reshape( (-1, 4, 4) )
+		matrices = numpy.matmul( baseMatrices[objectIndices], particleMatrices[particleIndices] )
+		rotateOrders = numpy.array( self._rotateOrders, dtype=int )[objectIndices]
+		(result, valid) = nspy.Transform.decompose( matrices, rotateOrders )
+		
+		transforms = self._transforms
+		if valid.all():
+			transforms.update( zip( particleIndices, map( tuple, result.tolist() ) ) )
+			return []
+		remaining = []
+		for (particleIndex, values, isValid) in zip( particleIndices, result.tolist(), valid.tolist() ):
+			if isValid:
+				transforms[particleIndex] = tuple( values )
+			else:
+				remaining.append( particleIndex )
+		return remaining
+	
+	def _objectIndicesOf(self, particleIndices):
+		'''getObjectIndex() of each of the particles, as a list.'''
+		if not self._objectIndices:
+			return [ 0 ] * len( particleIndices )
+		objectIndices = self._objectIndices
+		lastInstance = self._numInstances - 1
+		return [ min( int( objectIndices[i] ), lastInstance ) for i in particleIndices ]
+		
+	def _fillSnapshot( self ):
+		'''Fetch every particle's instancer matrix in a single call rather
+		   than querying the instancer once per particle.'''
+		self.fInstancer.allInstances( self._particlePaths,
+									  self._particleMatrices,
+									  self._pathStartIndices,
+									  self._pathIndices )
+		self._particleMatrixValues = None
+		
+	def _composeMatrices( self ):
+		'''Compose every particle's instance matrix (scale, then rotation,
+		   then translation by its position) from the mapped per-particle
+		   attributes.'''
+		for option in kUnsupportedSampleOptions:
+			if self.mappedData( option ) is not None:
+				raise nspy.Errors.UnsupportedError( "The instancer's %s option is not supported when baking from a particle cache." % option )
+		
+		positions = self.mappedData( "position", "position" )
+		rotations = self.mappedData( "rotation" )
+		scales = self.mappedData( "scale" )
+		
+		oInstancer = self.fInstancer.object()
+		rotationOrder = _eulerOrders[ _enumName( oInstancer, "rotationOrder" ).upper() ]
+		rotationScale = 1.0
+		if nsm.DG.getPlug( node=oInstancer, attrName="rotationAngleUnits" ).asInt() == 0:
+			# Degrees
+			#
+			rotationScale = math.pi / 180.0
+		
+		numParticles = self._particleData.count()
+		self._particleMatrices.setLength( numParticles )
+		for i in range( numParticles ):
+			j = i * 3
+			matrix = MMatrix()
+			if scales is not None:
+				scaleUtil = MScriptUtil()
+				scaleUtil.createFromList( [ scales[j], scales[j+1], scales[j+2] ], 3 )
+				transformation = MTransformationMatrix()
+				transformation.setScale( scaleUtil.asDoublePtr(), MSpace.kTransform )
+				matrix = transformation.asMatrix()
+			if rotations is not None:
+				rotation = MEulerRotation( rotations[j] * rotationScale,
+										   rotations[j+1] * rotationScale,
+										   rotations[j+2] * rotationScale,
+										   rotationOrder )
+				matrix *= rotation.asMatrix()
+			transformation = MTransformationMatrix( matrix )
+			transformation.setTranslation( MVector( positions[j], positions[j+1], positions[j+2] ),
+										   MSpace.kTransform )
+			self._particleMatrices.set( transformation.asMatrix(), i )
+		self._particleMatrixValues = None
+	
 	def _fillObjectIndices( self ):
-		self._objectIndices.clear()
+		self._objectIndices = []
 		
 		if ( self._numInstances > 1 ):
 			# If there are more than one instanced object then we have
@@ -174,39 +471,18 @@ class Instancer:
 			#    option.
 			# 2. By enabling automatice object cycling.
 			#
-			aIndex = nsm.ParticleUtil.mappedAttribute( self._fParticle.dagPath(),
-													   "objectIndex",
-													   self._instancerIndex )
-			if aIndex:
-				nsm.ParticleUtil.getPerParticleIntData( self._fParticle.dagPath(),
-														aIndex,
-														self._objectIndices )
+			objectIndices = self.mappedData( "objectIndex" )
+			if objectIndices is not None:
+				self._objectIndices = objectIndices
 			elif eInstancerCycle.sequential == self._cycleType:
 				self._sequentialObjectIndices()
 					
 	def _sequentialObjectIndices( self ):
-		# Get per-particle age
-		#
-		aAge = nsm.ParticleUtil.mappedAttribute( self._fParticle.dagPath(),
-												 "age",
-												 self._instancerIndex ) or "age"
-		ageData = MDoubleArray()
-		nsm.ParticleUtil.getPerParticleDoubleData( self._fParticle.dagPath(),
-												   aAge,
-												   ageData )
-		
-		# What object index does a given particle start on?
+		# Get per-particle age and the object index each particle
+		# starts on.
 		#
-		aCycleStart = nsm.ParticleUtil.mappedAttribute( self._fParticle.dagPath(),
-														"cycleStartObject",
-														self._instancerIndex )
-		cycleStartData = MIntArray()
-		if aCycleStart:
-			nsm.ParticleUtil.getPerParticleIntData( self._fParticle.dagPath(),
-													aCycleStart,
-													cycleStartData )
-		else:
-			cycleStartData = MIntArray( ageData.length(), 0 )
+		ageData = self.mappedData( "age", "age" )
+		cycleStartData = self.mappedData( "cycleStartObject" )
 		
 		# The number of steps to take (in either frames or seconds)
 		#
@@ -222,18 +498,24 @@ class Instancer:
 			#
 			step *= nsm.Utils.secondsPerFrame()
 		
-		numParticles = self.fInstancer.particleCount()
-		self._objectIndices.setLength( numParticles )
-		
-		for i in range( numParticles ):
-			# Calculate the current instanced object index by dividing the
-			# particle's age (in seconds) by the step size (in seconds).
-			# The cycle start object defines which index we should start
-			# counting from.
-			#
-			# It looks like Maya rounds the index result to 3 decimal places
-			# before truncating it to an int.
-			#
-			index = int( round( ageData[i] / step, 3 ) )
-			index = (cycleStartData[i] + index) % self._numInstances
-			self._objectIndices[i] = index
+		numParticles = self.particleCount()
+		self._objectIndices = nspy.Cycle.sequentialObjectIndices( ageData,
+																  cycleStartData,
+																  step,
+																  self._numInstances,
+																  numParticles )
+
+# Instancer options that _composeMatrices() can't reproduce.
+#
+kUnsupportedSampleOptions = ( "shear", "aimDirection", "aimPosition", "aimAxis", "aimUpAxis", "aimWorldUp" )
+
+_eulerOrders = { "XYZ" : MEulerRotation.kXYZ,
+				 "YZX" : MEulerRotation.kYZX,
+				 "ZXY" : MEulerRotation.kZXY,
+				 "XZY" : MEulerRotation.kXZY,
+				 "YXZ" : MEulerRotation.kYXZ,
+				 "ZYX" : MEulerRotation.kZYX }
+
+def _enumName( oNode, attrName ):
+	plug = nsm.DG.getPlug( node=oNode, attrName=attrName )
+	return MFnEnumAttribute( plug.attribute() ).fieldName( plug.asShort() )
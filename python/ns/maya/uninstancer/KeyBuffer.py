@@ -0,0 +1,302 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+
+import array
+import math
+
+from maya.OpenMaya import *
+from maya.OpenMayaAnim import *
+
+import ns.maya as nsm
+import ns.maya.Utils
+
+# NumPy isn't part of every Maya install. When it's missing the keys
+# are reduced with pure Python loops.
+#
+try:
+	import numpy
+except ImportError, e:
+	numpy = None
+
+
+# Number of frames of keys an animated particle buffers before they
+# are written to its curves.
+#
+kDefaultMaxFrames = 250
+
+# MFnAnimCurve.addKeys was unreliable in Maya 2008 so keys are only
+# inserted in bulk from this API version on. If bulk insertion ever
+# misbehaves the buffers fall back to adding keys one at a time for
+# the rest of the session.
+#
+kBulkKeysApiVersion = 200900
+
+_bulkKeys = None
+
+def bulkKeysEnabled():
+	global _bulkKeys
+	if _bulkKeys is None:
+		_bulkKeys = MGlobal.apiVersion() >= kBulkKeysApiVersion
+	return _bulkKeys
+
+def setBulkKeysEnabled( enabled ):
+	global _bulkKeys
+	_bulkKeys = enabled
+
+class eChannel:
+	tx, ty, tz, rx, ry, rz, sx, sy, sz, numValues = range(10)
+
+class KeyReduction:
+	'''How to reduce the transform keys of a KeyBuffer before they are
+	   written. A key is dropped if the curve through the keys that are
+	   kept passes within the tolerance of its channel type (scene units
+	   for translate and scale, radians for rotate) of it.
+	   
+	   With quantize the values are first rounded to multiples of half
+	   the tolerance and the keys then reduced within the other half, so
+	   the curves still stay within the tolerance. With fitTangents each
+	   kept key's tangents follow the slope of the original keys around
+	   it, which tracks curved motion more closely with the same keys
+	   but no longer strictly bounds the error. Otherwise the tangents
+	   are linear.'''
+	
+	def __init__( self, translate=0.0, rotate=0.0, scale=0.0, quantize=False, fitTangents=False ):
+		self.translate = translate
+		self.rotate = rotate
+		self.scale = scale
+		self.quantize = quantize
+		self.fitTangents = fitTangents
+	
+	def tolerance( self, channel ):
+		if channel < eChannel.rx:
+			return self.translate
+		elif channel < eChannel.sx:
+			return self.rotate
+		return self.scale
+
+class KeyBuffer:
+	'''Buffers the keys of a particle's nine transform channels and its
+	   visibility so that each curve is written with a single addKeys
+	   call. All transform channels share one array of times. Times are
+	   stored in UI units. If a KeyReduction is given the transform keys
+	   are reduced as they are flushed. A buffer is always flushed when
+	   its particle dies, so keys are only ever reduced within one
+	   particle's lifetime and its first and last keys are kept. Each
+	   flush is reduced on its own, so the first and last keys of every
+	   flush are kept too: with maxFrames of 0 the whole lifetime is
+	   reduced at once.'''
+	
+	def __init__( self, maxFrames=kDefaultMaxFrames, reduction=None ):
+		self._maxFrames = maxFrames
+		self._reduction = reduction
+		self.times = array.array( 'd' )
+		self.columns = [ array.array( 'd' ) for i in range(eChannel.numValues) ]
+		self.visibilityTimes = array.array( 'd' )
+		self.visibilityValues = array.array( 'd' )
+		
+	def add( self, time, values ):
+		'''Buffer one key for each of the transform channels. Returns
+		   True if the buffer has reached its size limit and should be
+		   flushed.'''
+		self.times.append( time )
+		for i in range(eChannel.numValues):
+			self.columns[i].append( values[i] )
+		return self.isFull()
+	
+	def addVisibility( self, time, value ):
+		self.visibilityTimes.append( time )
+		self.visibilityValues.append( value )
+	
+	def isFull( self ):
+		return self._maxFrames > 0 and len( self.times ) >= self._maxFrames
+	
+	def isEmpty( self ):
+		return not self.times and not self.visibilityTimes
+	
+	def clear( self ):
+		self.times = array.array( 'd' )
+		self.columns = [ array.array( 'd' ) for i in range(eChannel.numValues) ]
+		self.visibilityTimes = array.array( 'd' )
+		self.visibilityValues = array.array( 'd' )
+	
+	def flush( self, fTransformAnims, fVisibilityAnim ):
+		'''Write all buffered keys to the given curves and empty the
+		   buffer. fTransformAnims holds the nine transform curves in
+		   eChannel order.'''
+		assert len( fTransformAnims ) == eChannel.numValues
+		
+		if self.times and self._reduction:
+			self._flushReduced( fTransformAnims )
+		elif self.times:
+			mTimes = _timeArray( self.times )
+			for i in range(eChannel.numValues):
+				addKeys( fTransformAnims[i], self.times, self.columns[i], mTimes )
+		if self.visibilityTimes:
+			addKeys( fVisibilityAnim,
+					 self.visibilityTimes,
+					 self.visibilityValues,
+					 tangentType=MFnAnimCurve.kTangentStep )
+		self.clear()
+	
+	def _flushReduced( self, fTransformAnims ):
+		reduction = self._reduction
+		for i in range(eChannel.numValues):
+			tolerance = reduction.tolerance( i )
+			values = self.columns[i]
+			if reduction.quantize and tolerance > 0.0:
+				tolerance *= 0.5
+				values = quantizeKeys( values, tolerance )
+			keep = reduceKeys( self.times, values, tolerance )
+			times = array.array( 'd', [ self.times[j] for j in keep ] )
+			keptValues = array.array( 'd', [ values[j] for j in keep ] )
+			if reduction.fitTangents:
+				addKeys( fTransformAnims[i], times, keptValues, tangentType=MFnAnimCurve.kTangentFixed )
+				_setTangents( fTransformAnims[i], times, keySlopes( self.times, values, keep ) )
+			else:
+				addKeys( fTransformAnims[i], times, keptValues, tangentType=MFnAnimCurve.kTangentLinear )
+
+def quantizeKeys( values, step ):
+	'''values rounded to the nearest multiples of step, as an array('d').'''
+	if numpy is not None:
+		v = numpy.asarray( values, dtype=numpy.float64 )
+		result = numpy.round( v / step ) * step
+		# tostring() is deprecated in newer NumPy releases.
+		#
+		toBytes = getattr( result, "tobytes", None ) or result.tostring
+		return array.array( 'd', toBytes() )
+	return array.array( 'd', [ round( value / step ) * step for value in values ] )
+
+def reduceKeys( times, values, tolerance ):
+	'''The indices of the keys to keep so that interpolating linearly
+	   between them passes within tolerance of every key. The first and
+	   last keys are always kept. This is the Ramer-Douglas-Peucker
+	   algorithm measured along the value axis.'''
+	numKeys = len( times )
+	if numKeys <= 2:
+		return range( numKeys )
+	if numpy is not None:
+		t = numpy.asarray( times, dtype=numpy.float64 )
+		v = numpy.asarray( values, dtype=numpy.float64 )
+	keep = [ False ] * numKeys
+	keep[0] = keep[-1] = True
+	spans = [ (0, numKeys - 1) ]
+	while spans:
+		(first, last) = spans.pop()
+		if last - first < 2:
+			continue
+		slope = (values[last] - values[first]) / (times[last] - times[first])
+		if numpy is not None:
+			errors = numpy.abs( values[first] + slope * (t[first + 1:last] - times[first]) - v[first + 1:last] )
+			worst = int( numpy.argmax( errors ) )
+			maxError = errors[worst]
+			worst += first + 1
+		else:
+			maxError = -1.0
+			worst = -1
+			for j in range( first + 1, last ):
+				error = abs( values[first] + slope * (times[j] - times[first]) - values[j] )
+				if error > maxError:
+					maxError = error
+					worst = j
+		if maxError > tolerance:
+			keep[worst] = True
+			spans.append( (first, worst) )
+			spans.append( (worst, last) )
+	return [ j for j in range( numKeys ) if keep[j] ]
+
+def keySlopes( times, values, indices ):
+	'''The slope, in value per UI time unit, of the keys around each of
+	   the keys at indices.'''
+	numKeys = len( times )
+	if numKeys < 2:
+		return [ 0.0 ] * len( indices )
+	slopes = []
+	for j in indices:
+		before = max( j - 1, 0 )
+		after = min( j + 1, numKeys - 1 )
+		slopes.append( (values[after] - values[before]) / (times[after] - times[before]) )
+	return slopes
+
+def addKeys( fAnim, times, values, mTimes=None, tangentType=MFnAnimCurve.kTangentGlobal ):
+	'''Add keys at the given UI unit times to an anim curve. Keys are
+	   added in bulk when that is supported and one at a time otherwise.'''
+	if not times:
+		return
+	
+	if bulkKeysEnabled():
+		if mTimes is None:
+			mTimes = _timeArray( times )
+		mValues = MDoubleArray()
+		for value in values:
+			mValues.append( value )
+		
+		numKeys = fAnim.numKeys()
+		try:
+			fAnim.addKeys( mTimes, mValues, tangentType, tangentType, True )
+			if fAnim.numKeys() == numKeys + len( times ):
+				return
+		except RuntimeError, e:
+			pass
+		# Bulk insertion misbehaved. Stop using it and add whatever
+		# keys are missing one at a time.
+		#
+		setBulkKeysEnabled( False )
+	
+	_addKeysSeparately( fAnim, times, values, tangentType )
+
+def _addKeysSeparately( fAnim, times, values, tangentType ):
+	unit = MTime.uiUnit()
+	indexUtil = MScriptUtil()
+	indexPtr = indexUtil.asUintPtr()
+	for i in range( len( times ) ):
+		time = MTime( times[i], unit )
+		if fAnim.numKeys() and fAnim.find( time, indexPtr ):
+			continue
+		fAnim.addKeyframe( time, values[i], tangentType, tangentType )
+
+def _setTangents( fAnim, times, slopes ):
+	'''Set the in and out tangents of the keys at times to slopes (value
+	   in internal units, e.g. radians or centimeters, per UI time
+	   unit).'''
+	unit = MTime.uiUnit()
+	framesPerSecond = nsm.Utils.framesPerSecond()
+	indexUtil = MScriptUtil()
+	indexPtr = indexUtil.asUintPtr()
+	for i in range( len( times ) ):
+		if not fAnim.find( MTime( times[i], unit ), indexPtr ):
+			continue
+		index = MScriptUtil.getUint( indexPtr )
+		# Curves measure tangents per second. The buffered values are in
+		# internal units so the tangents are set without converting them
+		# from UI units (degrees, the UI linear unit).
+		#
+		angle = MAngle( math.atan( slopes[i] * framesPerSecond ) )
+		fAnim.setTangent( index, angle, 1.0, True, None, False )
+		fAnim.setTangent( index, angle, 1.0, False, None, False )
+
+def _timeArray( times ):
+	unit = MTime.uiUnit()
+	mTimes = MTimeArray()
+	for time in times:
+		mTimes.append( MTime( time, unit ) )
+	return mTimes
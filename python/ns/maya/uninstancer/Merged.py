@@ -0,0 +1,465 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import array
+import os
+import tempfile
+
+from maya.OpenMaya import *
+from maya.OpenMayaAnim import *
+import maya.cmds as mc
+
+import ns.py as nspy
+import ns.py.Errors
+import ns.py.PointCache
+
+import ns.maya as nsm
+import ns.maya.Utils
+from ns.maya.uninstancer.Geometry import *
+
+# NumPy isn't part of every Maya install. When it's missing the vertex
+# transforms fall back to a pure Python loop.
+#
+try:
+	import numpy
+except ImportError, e:
+	numpy = None
+
+
+def _timeNode():
+	'''The scene's time node. It is normally time1 but can be renamed.'''
+	timeNodes = mc.ls( type="time" )
+	if not timeNodes:
+		raise nspy.Errors.Error( "The scene has no time node to drive the point cache with." )
+	if "time1" in timeNodes:
+		return "time1"
+	return timeNodes[0]
+
+def transformPoints( points, matrices ):
+	'''Transforms every point by every matrix. points is a flat sequence
+	   of xyz triples and matrices a flat sequence of row-major 4x4
+	   matrices (16 values each, Maya's row vector convention). Returns a
+	   flat array('d') holding all the points transformed by the first
+	   matrix, then by the second matrix and so on.'''
+	numPoints = len( points ) / 3
+	numMatrices = len( matrices ) / 16
+	if numpy is not None:
+		p = numpy.asarray( points, dtype=numpy.float64 ).reshape( (numPoints, 3) )
+		m = numpy.asarray( matrices, dtype=numpy.float64 ).reshape( (numMatrices, 4, 4) )
+		# For each matrix: p * upper 3x3 + translation row
+		#
+		result = numpy.dot( p, m[:, :3, :3] ).transpose( (1, 0, 2) ) + m[:, 3:, :3]
+		result = result.ravel()
+		# tostring() is deprecated in newer NumPy releases.
+		#
+		toBytes = getattr( result, "tobytes", None ) or result.tostring
+		return array.array( 'd', toBytes() )
+	
+	result = array.array( 'd', [0.0] ) * (numPoints * numMatrices * 3)
+	out = 0
+	for j in range( 0, numMatrices * 16, 16 ):
+		(m00, m01, m02, m03,
+		 m10, m11, m12, m13,
+		 m20, m21, m22, m23,
+		 m30, m31, m32, m33) = matrices[j:j+16]
+		for i in range( 0, numPoints * 3, 3 ):
+			x = points[i]
+			y = points[i+1]
+			z = points[i+2]
+			result[out] = x*m00 + y*m10 + z*m20 + m30
+			result[out+1] = x*m01 + y*m11 + z*m21 + m31
+			result[out+2] = x*m02 + y*m12 + z*m22 + m32
+			out += 3
+	return result
+
+def offsetIndices( indices, stride, count ):
+	'''Returns indices repeated count times with the n'th repetition offset
+	   by n * stride.'''
+	if numpy is not None and indices:
+		base = numpy.asarray( indices, dtype=numpy.int32 )
+		offsets = numpy.arange( count, dtype=numpy.int32 ) * stride
+		return ( base[numpy.newaxis, :] + offsets[:, numpy.newaxis] ).ravel().tolist()
+	result = []
+	for n in range( count ):
+		offset = n * stride
+		result.extend( [ index + offset for index in indices ] )
+	return result
+
+def matrixValues( matrix ):
+	'''The 16 values of an MMatrix in row-major order.'''
+	return [ matrix( row, column ) for row in range(4) for column in range(4) ]
+
+class MeshPrototype:
+	'''The meshes of an instanced object merged into one set of points,
+	   faces, UVs and per-face shading engines, read once. Points are in
+	   the space of the instanced object's root transform so that they
+	   only need to be transformed by the particles' instance matrices.'''
+	
+	def __init__(self, geometry, baseMatrix):
+		self._geometry = geometry
+		self.points = array.array( 'd' )
+		self.polygonCounts = []
+		self.polygonConnects = []
+		self.u = []
+		self.v = []
+		self.uvCounts = []
+		self.uvIds = []
+		self.shadingEngines = []
+		# Index into shadingEngines per face, -1 if the face is unshaded.
+		#
+		self.faceShaders = []
+		
+		inverseBase = baseMatrix.inverse()
+		for oShape in geometry.shapes:
+			if not oShape.hasFn( MFn.kMesh ):
+				continue
+			dpShape = MDagPath()
+			MDagPath.getAPathTo( oShape, dpShape )
+			if MFnDagNode( dpShape ).isIntermediateObject():
+				continue
+			self._addMesh( dpShape, dpShape.inclusiveMatrix() * inverseBase )
+	
+	def numPoints(self):
+		return len( self.points ) / 3
+	
+	def numPolygons(self):
+		return len( self.polygonCounts )
+	
+	def numUVs(self):
+		return len( self.u )
+	
+	def createMesh(self, matrices, names):
+		'''Create one mesh holding a copy of the prototype per matrix (flat,
+		   16 values each) and return the path to its transform.'''
+		count = len( matrices ) / 16
+		points = transformPoints( self.points, matrices )
+		numPoints = len( points ) / 3
+		
+		vertexArray = nsm.Utils.pointArray( points )
+		polygonCounts = nsm.Utils.intArray( self.polygonCounts * count )
+		polygonConnects = nsm.Utils.intArray( offsetIndices( self.polygonConnects, self.numPoints(), count ) )
+		
+		fMesh = MFnMesh()
+		if self.numUVs():
+			uArray = nsm.Utils.floatArray( self.u * count )
+			vArray = nsm.Utils.floatArray( self.v * count )
+			oTransform = fMesh.create( numPoints, self.numPolygons() * count,
+									   vertexArray, polygonCounts, polygonConnects,
+									   uArray, vArray )
+			fMesh.assignUVs( nsm.Utils.intArray( self.uvCounts * count ),
+							 nsm.Utils.intArray( offsetIndices( self.uvIds, self.numUVs(), count ) ) )
+		else:
+			oTransform = fMesh.create( numPoints, self.numPolygons() * count,
+									   vertexArray, polygonCounts, polygonConnects )
+		
+		dpMesh = MDagPath()
+		MDagPath.getAPathTo( fMesh.object(), dpMesh )
+		self._nameMesh( oTransform, fMesh, names )
+		self._assignShading( dpMesh, count )
+		
+		dpTransform = MDagPath()
+		MDagPath.getAPathTo( oTransform, dpTransform )
+		return dpTransform
+	
+	def _nameMesh(self, oTransform, fMesh, names):
+		if names.useDefaultNames():
+			return
+		originalPath = self._geometry.root.fullPathName()
+		originalName = originalPath.split( "|" )[-1]
+		(name,) = names.names( [ originalName + "_merged" ] )
+		MFnDependencyNode( oTransform ).setName( name )
+		fMesh.setName( name + "Shape" )
+	
+	def _assignShading(self, dpMesh, count):
+		numEngines = len( self.shadingEngines )
+		if not numEngines:
+			return
+		
+		if numEngines == 1 and -1 not in self.faceShaders:
+			MFnSet( self.shadingEngines[0] ).addMember( dpMesh )
+			return
+		
+		# Per face shading - gather each shading engine's faces for all
+		# the copies and assign them in one go.
+		#
+		numPolygons = self.numPolygons()
+		for engine in range( numEngines ):
+			faces = [ i for i in range( numPolygons ) if self.faceShaders[i] == engine ]
+			fComponent = MFnSingleIndexedComponent()
+			oComponent = fComponent.create( MFn.kMeshPolygonComponent )
+			fComponent.addElements( nsm.Utils.intArray( offsetIndices( faces, numPolygons, count ) ) )
+			MFnSet( self.shadingEngines[engine] ).addMember( dpMesh, oComponent )
+	
+	def _addMesh(self, dpShape, matrix):
+		fMesh = MFnMesh( dpShape )
+		pointOffset = self.numPoints()
+		uvOffset = self.numUVs()
+		
+		points = MPointArray()
+		fMesh.getPoints( points, MSpace.kObject )
+		for i in range( points.length() ):
+			point = points[i] * matrix
+			self.points.extend( (point.x, point.y, point.z) )
+		
+		counts = MIntArray()
+		connects = MIntArray()
+		fMesh.getVertices( counts, connects )
+		self.polygonCounts.extend( [ counts[i] for i in range( counts.length() ) ] )
+		self.polygonConnects.extend( [ connects[i] + pointOffset for i in range( connects.length() ) ] )
+		
+		u = MFloatArray()
+		v = MFloatArray()
+		fMesh.getUVs( u, v )
+		self.u.extend( [ u[i] for i in range( u.length() ) ] )
+		self.v.extend( [ v[i] for i in range( v.length() ) ] )
+		uvCounts = MIntArray()
+		uvIds = MIntArray()
+		fMesh.getAssignedUVs( uvCounts, uvIds )
+		self.uvCounts.extend( [ uvCounts[i] for i in range( uvCounts.length() ) ] )
+		self.uvIds.extend( [ uvIds[i] + uvOffset for i in range( uvIds.length() ) ] )
+		
+		shaders = MObjectArray()
+		faceShaders = MIntArray()
+		fMesh.getConnectedShaders( dpShape.instanceNumber(), shaders, faceShaders )
+		remap = []
+		for i in range( shaders.length() ):
+			index = -1
+			for j in range( len( self.shadingEngines ) ):
+				if self.shadingEngines[j] == shaders[i]:
+					index = j
+			if index < 0:
+				index = len( self.shadingEngines )
+				self.shadingEngines.append( shaders[i] )
+			remap.append( index )
+		for i in range( faceShaders.length() ):
+			if faceShaders[i] < 0:
+				self.faceShaders.append( -1 )
+			else:
+				self.faceShaders.append( remap[faceShaders[i]] )
+
+class MergedUninstance(StaticUninstance):
+	'''Bakes every particle of every baked frame into one mesh per
+	   instanced object instead of one duplicate per particle. The
+	   particles' instance matrices are collected as they are baked and
+	   the meshes are built by finalize() with one mesh create call each.'''
+	
+	def __init__(self, instancer, names):
+		StaticUninstance.__init__( self, instancer )
+		self._names = names
+		# Flat row-major instance matrices, by object index.
+		#
+		self._matrices = {}
+	
+	def bake(self, particleIndex):
+		objectIndex = self._instancer.getObjectIndex( particleIndex )
+		matrix = self._instancer.getInstanceMatrix( particleIndex, objectIndex )
+		try:
+			matrices = self._matrices[objectIndex]
+		except KeyError, e:
+			matrices = array.array( 'd' )
+			self._matrices[objectIndex] = matrices
+		matrices.extend( matrixValues( matrix ) )
+	
+	def retire(self):
+		# Particles share the merged meshes so nothing is done when one
+		# dies.
+		#
+		pass
+	
+	def finalize(self):
+		objectIndices = self._matrices.keys()
+		objectIndices.sort()
+		for objectIndex in objectIndices:
+			matrices = self._matrices.pop( objectIndex )
+			geometry = self._instancer.getInstance( objectIndex )
+			prototype = MeshPrototype( geometry, self._instancer.getMatrix( objectIndex ) )
+			if not prototype.numPolygons():
+				continue
+			self._paths.append( prototype.createMesh( matrices, self._names ) )
+
+class SlotUninstance(Uninstance):
+	'''A particle's share of a MergedAnimation - the slot its copy of the
+	   instanced object takes up in the merged mesh.'''
+	
+	def __init__(self, instancer, merged):
+		Uninstance.__init__( self, instancer )
+		self._merged = merged
+		self._objectIndex = -1
+		self._slot = -1
+	
+	def bake(self, particleIndex):
+		objectIndex = self._instancer.getObjectIndex( particleIndex )
+		if objectIndex != self._objectIndex:
+			# The particle has switched instanced objects, so it moves
+			# to a slot in the other object's mesh.
+			#
+			self._release()
+			self._slot = self._merged.acquireSlot( objectIndex )
+			self._objectIndex = objectIndex
+		self._merged.setMatrix( objectIndex,
+								self._slot,
+								self._instancer.getInstanceMatrix( particleIndex, objectIndex ) )
+	
+	def retire(self):
+		self._release()
+	
+	def _release(self):
+		if self._slot >= 0:
+			self._merged.releaseSlot( self._objectIndex, self._slot )
+		self._slot = -1
+		self._objectIndex = -1
+
+class MergedAnimation:
+	'''Bakes animation to one mesh per instanced object, played back from
+	   a point cache by an nsPointCache deformer. Each particle takes up a
+	   slot (a copy of the instanced object's points) in its object's mesh.
+	   Slots of dead particles are collapsed and handed to particles born
+	   later.
+	   
+	   Every frame's slot matrices are written to a temporary file as the
+	   bake goes. finalize() creates the meshes and transforms the
+	   instanced objects' points by those matrices to write the caches.'''
+	
+	def __init__(self, instancer, names, cacheDirectory, startTime, timeStep):
+		self._instancer = instancer
+		self._names = names
+		self._cacheDirectory = cacheDirectory
+		self._startTime = startTime
+		self._timeStep = timeStep
+		self._paths = []
+		
+		self._samples = tempfile.TemporaryFile()
+		self._numFrames = 0
+		self._frame = -1
+		# By object index: the number of slots, the slots that are free
+		# (with the time they were freed), and the current frame's slot
+		# matrices (16 values per slot, zero for empty slots).
+		#
+		self._numSlots = {}
+		self._freeSlots = {}
+		self._matrices = {}
+	
+	def getPaths(self):
+		return self._paths
+	
+	def acquireSlot(self, objectIndex):
+		time = self._instancer.time().value()
+		free = self._freeSlots.setdefault( objectIndex, [] )
+		# Slots are only reused on a later frame than the one they were
+		# freed on so that a dead particle's last frame isn't lost.
+		#
+		if free and free[0][0] < time:
+			return free.pop( 0 )[1]
+		slot = self._numSlots.get( objectIndex, 0 )
+		self._numSlots[objectIndex] = slot + 1
+		return slot
+	
+	def releaseSlot(self, objectIndex, slot):
+		time = self._instancer.time().value()
+		self._freeSlots.setdefault( objectIndex, [] ).append( (time, slot) )
+	
+	def setMatrix(self, objectIndex, slot, matrix):
+		frame = int( round( (self._instancer.time().value() - self._startTime) / self._timeStep ) )
+		if frame != self._frame:
+			self._writeFrame()
+			self._frame = frame
+		try:
+			matrices = self._matrices[objectIndex]
+		except KeyError, e:
+			matrices = array.array( 'd' )
+			self._matrices[objectIndex] = matrices
+		offset = slot * 16
+		if len( matrices ) < offset + 16:
+			matrices.extend( [0.0] * (offset + 16 - len( matrices )) )
+		matrices[offset:offset + 16] = array.array( 'd', matrixValues( matrix ) )
+	
+	def finalize(self):
+		self._writeFrame()
+		objectIndices = self._numSlots.keys()
+		objectIndices.sort()
+		
+		writers = {}
+		prototypes = {}
+		try:
+			for objectIndex in objectIndices:
+				geometry = self._instancer.getInstance( objectIndex )
+				prototype = MeshPrototype( geometry, self._instancer.getMatrix( objectIndex ) )
+				if not prototype.numPolygons():
+					continue
+				numSlots = self._numSlots[objectIndex]
+				# The mesh's own points are never seen, the deformer
+				# replaces them every frame.
+				#
+				dpTransform = prototype.createMesh( matrixValues( MMatrix() ) * numSlots, self._names )
+				self._paths.append( dpTransform )
+				
+				path = self._cachePath( dpTransform )
+				writers[objectIndex] = nspy.PointCache.PointCacheWriter( path,
+																		 prototype.numPoints() * numSlots,
+																		 self._numFrames,
+																		 self._startTime,
+																		 self._timeStep )
+				prototypes[objectIndex] = prototype
+				self._createDeformer( dpTransform, path )
+			
+			# One pass through the samples writes every object's cache.
+			#
+			self._samples.seek( 0 )
+			while True:
+				header = array.array( 'i' )
+				try:
+					header.fromfile( self._samples, 3 )
+				except EOFError, e:
+					break
+				(frame, objectIndex, numSlots) = header
+				matrices = array.array( 'd' )
+				matrices.fromfile( self._samples, numSlots * 16 )
+				if writers.has_key( objectIndex ):
+					writers[objectIndex].setFrame( frame, transformPoints( prototypes[objectIndex].points, matrices ) )
+		finally:
+			for writer in writers.values():
+				writer.close()
+			self._samples.close()
+	
+	def _writeFrame(self):
+		if self._frame < 0:
+			return
+		for (objectIndex, matrices) in self._matrices.items():
+			numSlots = len( matrices ) / 16
+			array.array( 'i', [ self._frame, objectIndex, numSlots ] ).tofile( self._samples )
+			matrices.tofile( self._samples )
+		self._numFrames = max( self._numFrames, self._frame + 1 )
+		self._matrices = {}
+	
+	def _cachePath(self, dpTransform):
+		directory = self._cacheDirectory
+		if not directory:
+			directory = os.path.join( mc.workspace( q=True, rootDirectory=True ), "data" )
+		if not os.path.isdir( directory ):
+			os.makedirs( directory )
+		name = dpTransform.partialPathName().replace( ":", "_" ).replace( "|", "_" )
+		return os.path.join( directory, name + ".nspc" )
+	
+	def _createDeformer(self, dpTransform, path):
+		deformer = mc.deformer( dpTransform.fullPathName(), type="nsPointCache" )[0]
+		mc.setAttr( deformer + ".cacheFile", path, type="string" )
+		mc.connectAttr( _timeNode() + ".outTime", deformer + ".time" )
@@ -0,0 +1,83 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+
+import re
+
+import maya.cmds as mc
+
+
+_suffixRegex = re.compile( r"_(\d+)$" )
+
+class NameAllocator:
+	'''Hands out names for the nodes of duplicated instanced objects. Each
+	   node is named after its original followed by the duplicate's number
+	   (e.g. pCube1_12 and pCubeShape1_12). Duplicates are parented to
+	   world, so instanced objects whose roots have the same short name
+	   share a counter. The scene is only searched once per counter, for
+	   the first free number, and numbers are handed out from the counter
+	   after that. Names can optionally be
+	   put in a namespace, or the allocator can be disabled so duplicates
+	   keep the default names Maya gives them. A tag is put in front of
+	   every number (e.g. pCube1_s2_12 for the tag "s2_") so that bakes
+	   made apart from each other can be merged without name clashes.'''
+	
+	def __init__( self, namespace="", useDefaultNames=False, tag="" ):
+		self._namespace = namespace
+		self._tag = tag
+		self._useDefaultNames = useDefaultNames
+		self._counters = {}
+		self._namespaceCreated = False
+	
+	def useDefaultNames( self ):
+		return self._useDefaultNames
+	
+	def names( self, originalNames ):
+		'''Returns the names for the nodes of a new duplicate. originalNames
+		   are the short names of the nodes being duplicated, in order,
+		   starting with the root.'''
+		baseNames = [ self._baseName( name ) for name in originalNames ]
+		key = baseNames[0]
+		try:
+			number = self._counters[key]
+		except KeyError, e:
+			number = self._firstFreeNumber( baseNames )
+		self._counters[key] = number + 1
+		return [ "%s_%s%d" % (name, self._tag, number) for name in baseNames ]
+	
+	def _baseName( self, name ):
+		if not self._namespace:
+			return name
+		if not self._namespaceCreated:
+			if not mc.namespace( exists=":" + self._namespace ):
+				mc.namespace( add=":" + self._namespace )
+			self._namespaceCreated = True
+		return "%s:%s" % (self._namespace, name.split( ":" )[-1])
+	
+	def _firstFreeNumber( self, baseNames ):
+		highest = 0
+		for name in baseNames:
+			for existing in mc.ls( name + "_" + self._tag + "*" ) or []:
+				match = _suffixRegex.search( existing.split( "|" )[-1] )
+				if match:
+					highest = max( highest, int( match.group(1) ) )
+		return highest + 1
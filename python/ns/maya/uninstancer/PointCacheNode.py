@@ -0,0 +1,103 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import sys
+
+from maya.OpenMaya import *
+import maya.OpenMayaMPx as OpenMayaMPx
+
+import ns.py as nspy
+import ns.py.PointCache
+
+import ns.maya as nsm
+import ns.maya.Utils
+
+
+kPluginNodeName = "nsPointCache"
+# In the range of IDs reserved for local use.
+#
+kPluginNodeId = MTypeId( 0x0007F0A0 )
+
+class PointCacheNode(OpenMayaMPx.MPxDeformerNode):
+	'''Deformer that plays back a point cache written by a mergedAnimation
+	   bake. The cache is memory mapped so only the frames that are shown
+	   are read.'''
+	
+	aCacheFile = MObject()
+	aTime = MObject()
+	
+	def __init__(self):
+		OpenMayaMPx.MPxDeformerNode.__init__(self)
+		self._cache = None
+		self._cachePath = ""
+	
+	def deform(self, dataBlock, itGeo, matrix, multiIndex):
+		path = dataBlock.inputValue( PointCacheNode.aCacheFile ).asString()
+		cache = self._openCache( path )
+		if not cache:
+			return
+		
+		envelope = dataBlock.inputValue( OpenMayaMPx.cvar.MPxDeformerNode_envelope ).asFloat()
+		time = dataBlock.inputValue( PointCacheNode.aTime ).asTime()
+		points = cache.points( time.asUnits( MTime.uiUnit() ) )
+		if len( points ) != itGeo.count() * 3:
+			# The cache doesn't match the mesh, leave it as is.
+			#
+			return
+		
+		if envelope < 1.0:
+			current = MPointArray()
+			itGeo.allPositions( current )
+			points = nspy.PointCache.blend( nsm.Utils.pointValues( current ), points, envelope )
+		itGeo.setAllPositions( nsm.Utils.pointArray( points ) )
+	
+	def _openCache(self, path):
+		if path == self._cachePath:
+			return self._cache
+		if self._cache:
+			self._cache.close()
+		self._cache = None
+		self._cachePath = path
+		if path:
+			try:
+				self._cache = nspy.PointCache.PointCache( path )
+			except (IOError, ValueError), e:
+				sys.stderr.write( "%s: %s\n" % (kPluginNodeName, e) )
+		return self._cache
+
+def nodeCreator():
+	return OpenMayaMPx.asMPxPtr( PointCacheNode() )
+
+def nodeInitializer():
+	fTyped = MFnTypedAttribute()
+	PointCacheNode.aCacheFile = fTyped.create( "cacheFile", "cf", MFnData.kString )
+	fTyped.setStorable( True )
+	PointCacheNode.addAttribute( PointCacheNode.aCacheFile )
+	
+	fUnit = MFnUnitAttribute()
+	PointCacheNode.aTime = fUnit.create( "time", "tm", MFnUnitAttribute.kTime, 0.0 )
+	fUnit.setStorable( True )
+	PointCacheNode.addAttribute( PointCacheNode.aTime )
+	
+	outputGeom = OpenMayaMPx.cvar.MPxDeformerNode_outputGeom
+	PointCacheNode.attributeAffects( PointCacheNode.aCacheFile, outputGeom )
+	PointCacheNode.attributeAffects( PointCacheNode.aTime, outputGeom )
@@ -0,0 +1,362 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import copy
+import hashlib
+import os
+
+from maya.OpenMaya import *
+from maya.OpenMayaAnim import *
+from maya.OpenMayaFX import *
+
+import ns.py as nspy
+import ns.py.Checkpoint
+import ns.py.Errors
+import ns.py.ParticleCache
+
+import ns.maya as nsm
+import ns.maya.InstancerUtil
+import ns.maya.ParticleUtil
+import ns.maya.Progress
+import ns.maya.RunUpCache
+import ns.maya.Utils
+import ns.maya.uninstancer.Selection
+from ns.maya.uninstancer.BakeTarget import *
+
+
+def findInstancers():
+	'''Returns (dpParticle, [dpInstancer, ...]) for every particle system
+	   in the scene that drives at least one instancer.'''
+	found = []
+	byParticle = {}
+	itDag = MItDag( MItDag.kDepthFirst, MFn.kInstancer )
+	while not itDag.isDone():
+		dpInstancer = MDagPath()
+		itDag.getPath( dpInstancer )
+		itDag.next()
+		try:
+			(oParticle, instancerIndex) = nsm.InstancerUtil.particle( dpInstancer )
+		except nspy.Errors.Error, e:
+			# Nothing is instanced onto it.
+			#
+			continue
+		if not oParticle.hasFn( MFn.kParticle ):
+			continue
+		dpParticle = MDagPath()
+		MDagPath.getAPathTo( oParticle, dpParticle )
+		name = dpParticle.fullPathName()
+		if not byParticle.has_key( name ):
+			byParticle[name] = (dpParticle, [])
+			found.append( byParticle[name] )
+		byParticle[name][1].append( dpInstancer )
+	return found
+
+class ParticleBake:
+	'''Bakes the given instancers of one particle system every frameStep
+	   frames from startFrame to endFrame. The particle data, ID mapping
+	   and birth/death events are found once per frame and shared by all
+	   of the instancers. Only the given particles are baked if a
+	   ParticleSelection is given.'''
+	
+	def __init__(self, dpParticle, dpInstancers, settings, startFrame, endFrame, frameStep=1, selection=None):
+		self._dpParticle = dpParticle
+		self.startFrame = startFrame
+		self.endFrame = endFrame
+		self.frameStep = frameStep
+		self._selection = selection
+		if selection is None:
+			self._selection = nsm.uninstancer.Selection.ParticleSelection()
+		# Where the frames come from: the running simulation, a particle
+		# disk cache or a capture. A capture can also be recorded while
+		# baking.
+		#
+		self.particleCache = None
+		self.replay = None
+		self.capture = None
+		# An open file that a hash of every baked frame's particles is
+		# written to, if any, so that bakes of the same particle system
+		# in different processes can be checked against each other.
+		#
+		self.hashFile = None
+		# A file the run-up state is restored from, or saved to if it
+		# doesn't hold a matching one (see ParticleUtil.runUpTo()).
+		#
+		self.stateFile = None
+		# Only record the capture, without baking any instances. Used by
+		# ns.py.ShardDriver.CaptureDriver to capture parts of a disk
+		# cache's frame range in separate processes.
+		#
+		self.captureOnly = False
+		# The file to checkpoint the bake to every checkpointInterval
+		# baked frames, which needs a capture to record the frames in.
+		# To resume from a Checkpoint, resume is set to it and
+		# resumeCapture to its capture, opened for reading. The frames
+		# up to the checkpoint are then re-baked from the capture and
+		# the simulation carries on from the checkpoint's state.
+		#
+		self.checkpointFile = None
+		self.checkpointInterval = 10
+		self.resume = None
+		self.resumeCapture = None
+		self._numBaked = 0
+		self._sceneDigest = None
+		self._statePath = None
+		self._runUp = None
+		self._idMapper = nsm.ParticleUtil.IdMapper()
+		self._events = nsm.ParticleUtil.IdEvents()
+		
+		if endFrame < startFrame:
+			raise nspy.Errors.BadArgumentError( "The end frame is before the start frame." )
+		if frameStep < 1:
+			raise nspy.Errors.BadArgumentError( "The frame step must be at least 1." )
+		
+		# Merged animation caches are laid out by this bake's frames.
+		#
+		settings = copy.copy( settings )
+		settings.startFrame = startFrame
+		settings.frameStep = frameStep
+		self._particleData = nsm.ParticleUtil.ParticleSnapshot( dpParticle )
+		self._targets = [ BakeTarget( dpParticle, dpInstancer, settings, self._particleData )
+						  for dpInstancer in dpInstancers ]
+	
+	def particlePath(self):
+		return self._dpParticle
+	
+	def isSimulated(self):
+		'''Whether the frames come from the running simulation.'''
+		return not self.particleCache and not self.replay
+	
+	def simulationStart(self):
+		'''The first frame that has to be simulated.'''
+		if self.resume:
+			return self.resume.frame + 1
+		return self.startFrame
+	
+	def runUp(self, frame, cache=None):
+		'''Run the simulation up to the frame before frame.'''
+		if self.checkpointFile:
+			# Before the run up can swap the initial state.
+			#
+			self._sceneDigest = nsm.RunUpCache.sceneDigest( self._dpParticle )
+		stateFile = self.stateFile
+		if self.resume and self.resume.statePath and frame == self.simulationStart():
+			stateFile = self.resume.statePath
+		self._runUp = nsm.ParticleUtil.runUpTo( self._dpParticle, frame, cache, stateFile )
+	
+	def wantsFrame(self, frame):
+		return (self.startFrame <= frame <= self.endFrame and
+				(frame - self.startFrame) % self.frameStep == 0)
+	
+	def bakeFrame(self, frame, time):
+		'''Bake the particles at time. For simulated bakes the current
+		   time has to have been set to it already.'''
+		# Get the mapping of particle id to index in the per-particle
+		# attribute arrays. This starts out 1-to-1 but changes as
+		# particles die. The particle data is fetched once and
+		# shared by every instancer.
+		#
+		idMapper = self._idMapper
+		resumed = self.resume is not None and frame <= self.resume.frame
+		if resumed:
+			# Already baked before the checkpoint, and captured.
+			#
+			captured = self.resumeCapture.frameAt( time.value() )
+			if captured is None:
+				raise nspy.Errors.OutOfBoundsError( "Frame %d is before the start of the checkpoint's capture." % frame )
+			self._targets[0].instancer().updateFromCapture( captured, time )
+			idMapper.fromIds( captured.ids )
+		elif self.replay:
+			captured = self.replay.frameAt( time.value() )
+			if captured is None:
+				raise nspy.Errors.OutOfBoundsError( "Frame %d is before the start of the capture." % frame )
+			self._targets[0].instancer().updateFromCapture( captured, time )
+			idMapper.fromIds( captured.ids )
+		elif self.particleCache:
+			sample = self.particleCache.sample( nspy.ParticleCache.ticks( frame, nsm.Utils.framesPerSecond() ) )
+			for target in self._targets:
+				target.instancer().updateFromSample( sample, time )
+			idMapper.fromIds( sample.ids() )
+		else:
+			self._particleData.update()
+			for target in self._targets:
+				target.instancer().update( False )
+			idMapper.fromParticle( self._dpParticle.node() )
+		numParticles = self._targets[0].instancer().particleCount()
+		if self.capture and not resumed:
+			# Every particle is captured, not just the targeted
+			# ones, so that the capture can be re-baked with a
+			# different selection.
+			#
+			(objectIndices, matrices) = self._targets[0].instancer().capture()
+			self.capture.addFrame( time.value(), idMapper.ids(), objectIndices, matrices )
+		if self.hashFile:
+			self.hashFile.write( "%d %s\n" % (frame, self._frameHash( idMapper, numParticles )) )
+		if self.captureOnly:
+			return
+		
+		self._events.update( idMapper.sortedIds() )
+		idMapper.update( self._events.born, self._events.died )
+		particleIndices = self._selection.particleIndices( idMapper, numParticles )
+		for target in self._targets:
+			target.bake( idMapper, self._events.died, particleIndices )
+		
+		if self.checkpointFile and not resumed:
+			self._numBaked += 1
+			if self._numBaked % self.checkpointInterval == 0 and frame + self.frameStep <= self.endFrame:
+				self._checkpoint( frame )
+	
+	def _checkpoint(self, frame):
+		'''Save a Checkpoint of the bake at frame, the frame just baked.
+		   The capture and particle state are on disk before the
+		   checkpoint that refers to them is.'''
+		self.capture.sync()
+		statePath = None
+		if self.isSimulated() and nsm.RunUpCache.isRestorable( self._dpParticle ):
+			# Systems that can't be restored are run up from the
+			# start on resume, so their state isn't saved.
+			#
+			statePath = "%s.%d.state" % (self.checkpointFile, frame)
+			state = nsm.RunUpCache.ParticleState( self._dpParticle )
+			state.save( statePath, nsm.RunUpCache.frameKey( self._sceneDigest, frame ) )
+		checkpoint = nspy.Checkpoint.Checkpoint( frame, self.capture.numFrames(), self.capture.path(), statePath )
+		nspy.Checkpoint.write( self.checkpointFile, checkpoint )
+		previous = self._statePath
+		if previous is None and self.resume:
+			previous = self.resume.statePath
+		if previous and previous != statePath and os.path.exists( previous ):
+			os.remove( previous )
+		self._statePath = statePath
+	
+	def _frameHash(self, idMapper, numParticles):
+		'''A hash of every particle's ID and instanced position.'''
+		digest = hashlib.md5()
+		ids = idMapper.ids()
+		values = self._targets[0].instancer().particleMatrixValues()
+		for i in range( numParticles ):
+			j = 16 * i + 12
+			digest.update( "%d %.6g %.6g %.6g;" % (int( ids[i] ), values[j], values[j+1], values[j+2]) )
+		return digest.hexdigest()
+	
+	def finalize(self):
+		'''Finish the bake and return the paths of everything baked. The
+		   settings' batch has to have been committed first.'''
+		if self.capture:
+			self.capture.close()
+		paths = []
+		if self.captureOnly:
+			return paths
+		for target in self._targets:
+			target.finalize()
+			paths.extend( target.getPaths() )
+		return paths
+	
+	def close(self):
+		'''Release the bake's files and put back any particle state
+		   changed by a cached run up, whether or not the bake finished.'''
+		if self.capture:
+			self.capture.close()
+		if self.replay:
+			self.replay.close()
+		if self.resumeCapture:
+			self.resumeCapture.close()
+		if self.hashFile:
+			self.hashFile.close()
+		if self._runUp:
+			self._runUp.restore()
+			self._runUp = None
+
+class BakeScheduler:
+	'''Bakes any number of ParticleBakes, each with its own frame range
+	   and step, in a single pass over the timeline. Every simulated
+	   particle system is run up once to the earliest start frame and
+	   the current time is then set once per frame for all of them.'''
+	
+	def __init__(self):
+		self._bakes = []
+	
+	def add(self, bake):
+		self._bakes.append( bake )
+	
+	def bakes(self):
+		return self._bakes
+	
+	def numFrames(self):
+		if not self._bakes:
+			return 0
+		return self._endFrame() - self._startFrame() + 1
+	
+	def run(self, runUpCache=None):
+		'''Bake every frame of every ParticleBake. runUpCache is the
+		   RunUpCache to restore and store the run ups with, if any.'''
+		if not self._bakes:
+			return
+		startFrame = self._startFrame()
+		endFrame = self._endFrame()
+		simulated = [ bake for bake in self._bakes if bake.isSimulated() ]
+		
+		# Bakes resumed from a checkpoint only need simulating from the
+		# frame after it.
+		#
+		simulationStart = startFrame
+		if simulated:
+			simulationStart = min( [ bake.simulationStart() for bake in simulated ] )
+			nsm.Progress.setTitle("Run up")
+			for bake in simulated:
+				bake.runUp( simulationStart, runUpCache )
+		nsm.Progress.advanceProgress( 1 )
+		
+		for curFrame in range( startFrame, endFrame + 1 ):
+			curTime = MTime( curFrame, MTime.uiUnit() )
+			
+			# Set the current time on every frame, even the ones no
+			# bake wants, so any particle systems that depend on being
+			# evaluated each frame will be. Frames read from a particle
+			# cache or a capture are independent of each other so the
+			# skipped ones are never read.
+			#
+			if simulated and curFrame >= simulationStart:
+				MAnimControl.setCurrentTime( curTime )
+			
+			bakes = [ bake for bake in self._bakes if bake.wantsFrame( curFrame ) ]
+			if bakes:
+				nsm.Progress.setTitle("Frame %d" % curFrame)
+			for bake in bakes:
+				bake.bakeFrame( curFrame, curTime )
+			nsm.Progress.advanceProgress( 1 )
+	
+	def finalize(self):
+		'''Returns the paths of everything baked. The batches the bakes
+		   were made with have to have been committed first.'''
+		paths = []
+		for bake in self._bakes:
+			paths.extend( bake.finalize() )
+		return paths
+	
+	def close(self):
+		for bake in self._bakes:
+			bake.close()
+	
+	def _startFrame(self):
+		return min( [ bake.startFrame for bake in self._bakes ] )
+	
+	def _endFrame(self):
+		return max( [ bake.endFrame for bake in self._bakes ] )
@@ -0,0 +1,87 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+
+import math
+
+class ParticleSelection:
+	'''The particle IDs a bake has been restricted to. An empty selection
+	   means that every particle is baked. IDs are kept in a hash set so
+	   membership tests don't depend on the size of the selection.'''
+	
+	def __init__( self ):
+		self._ids = set()
+		# Only particles whose ID modulo the shard count is the shard
+		# index are selected, if a shard is set.
+		#
+		self._shardIndex = 0
+		self._numShards = 1
+	
+	def __len__( self ):
+		return len( self._ids )
+	
+	def isEmpty( self ):
+		return not self._ids
+	
+	def add( self, particleIds ):
+		self._ids.update( particleIds )
+	
+	def clear( self ):
+		self._ids = set()
+	
+	def setShard( self, index, numShards ):
+		'''Restrict the selection to the index'th of numShards shards of
+		   the particle IDs.'''
+		self._shardIndex = index
+		self._numShards = numShards
+	
+	def contains( self, particleId ):
+		if self._numShards > 1 and particleId % self._numShards != self._shardIndex:
+			return False
+		return not self._ids or particleId in self._ids
+	
+	def particleIndices( self, idMapper, numParticles ):
+		indices = self._selectedIndices( idMapper, numParticles )
+		if self._numShards > 1:
+			ids = idMapper.ids()
+			numShards = self._numShards
+			shardIndex = self._shardIndex
+			indices = [ i for i in indices if int( ids[i] ) % numShards == shardIndex ]
+		return indices
+	
+	def _selectedIndices( self, idMapper, numParticles ):
+		'''Returns, in ascending order, the indices into the per-particle
+		   arrays of every selected particle that is alive. When only a
+		   small part of the particle system is selected each selected
+		   ID is looked up on its own, otherwise the particle IDs are
+		   scanned once.'''
+		if not self._ids:
+			return range( numParticles )
+		
+		if len( self._ids ) * max( 1, int( math.log( numParticles + 1, 2 ) ) ) < numParticles:
+			indices = [ i for i in idMapper.idsToIndices( self._ids ) if i >= 0 ]
+			indices.sort()
+			return indices
+		
+		ids = idMapper.ids()
+		selected = self._ids
+		return [ i for i in range( numParticles ) if int( ids[i] ) in selected ]
@@ -0,0 +1,77 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+#
+# Bakes one shard of a bake split up by ns.py.ShardDriver.ShardDriver, or
+# captures one part of a frame range for ns.py.ShardDriver.CaptureDriver.
+# Run with mayapy, not from inside Maya. --shard, --output and --hashFile
+# are only passed on to nsUninstancer if given.
+#
+
+import optparse
+import os
+import sys
+
+
+def main( argv ):
+	parser = optparse.OptionParser( usage="mayapy ShardWorker.py [options] target..." )
+	parser.add_option( "--scene" )
+	parser.add_option( "--plugin" )
+	parser.add_option( "--shard", nargs=2, type="int" )
+	parser.add_option( "--output" )
+	parser.add_option( "--hashFile" )
+	parser.add_option( "--flags", default="" )
+	(options, targets) = parser.parse_args( argv )
+	
+	import maya.standalone
+	maya.standalone.initialize( name="python" )
+	import maya.cmds as mc
+	import maya.mel
+	import ns.py.MayaAscii
+	quote = ns.py.MayaAscii.quote
+	
+	try:
+		# Load the plug-in first so scenes that already hold its nodes
+		# (e.g. nsPointCache deformers) don't open them as unknown nodes.
+		#
+		mc.loadPlugin( options.plugin )
+		mc.file( options.scene, open=True, force=True )
+		command = [ "nsUninstancer", options.flags ]
+		if options.shard:
+			command.append( "-shard %d %d" % options.shard )
+		if options.output:
+			command.append( "-outputFile %s -loadOutput \"none\"" % quote( options.output ) )
+		if options.hashFile:
+			command.append( "-hashFile %s" % quote( options.hashFile ) )
+		command.extend( [ quote( target ) for target in targets ] )
+		maya.mel.eval( " ".join( command ) )
+	except Exception, e:
+		sys.stderr.write( "Shard failed: %s\n" % e )
+		return 1
+	return 0
+
+if __name__ == "__main__":
+	# Make the ns package importable. It lives in the python directory
+	# three levels above this one.
+	#
+	sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) ) ) )
+	sys.exit( main( sys.argv[1:] ) )
@@ -75,6 +75,8 @@
 #	2. Use x or y syntax to assign default values ageAttr = getAttr() or "age"
 
 
+import math
+import os
 import sys
 
 from maya.OpenMaya import *
@@ -87,13 +89,25 @@ import ns.py as nspy
 import ns.py.Errors
 import ns.py.Const
 import ns.py.Timer
+import ns.py.ParticleCache
+import ns.py.CaptureStore
+import ns.py.Checkpoint
 import ns.maya as nsm
 import ns.maya.Errors
 import ns.maya.Utils
 import ns.maya.InstancerUtil
 import ns.maya.ParticleUtil
+import ns.maya.RunUpCache
 import ns.maya.MayaModifier
+import ns.maya.ModifierBatch
 import ns.maya.Progress
+import ns.maya.uninstancer.AsciiOutput
+import ns.maya.uninstancer.KeyBuffer
+import ns.maya.uninstancer.Merged
+import ns.maya.uninstancer.Names
+import ns.maya.uninstancer.Scheduler
+import ns.maya.uninstancer.Selection
+from ns.maya.uninstancer.BakeTarget import *
 from ns.maya.uninstancer.Geometry import *
 from ns.maya.uninstancer.Instancer import *
 
@@ -103,6 +117,10 @@ kPluginCmdName = "nsUninstancer"
 
 kInstancerFlag 		= "ins"
 kInstancerFlagLong 	= "instancer"
+kAllInstancersFlag 	= "ai"
+kAllInstancersFlagLong 	= "allInstancers"
+kSceneFlag 		= "scn"
+kSceneFlagLong 		= "scene"
 kCopyAsInstanceFlag 	= "cai"
 kCopyAsInstanceFlagLong = "copyAsInstance"
 kStartFrameFlag 	= "sf"
@@ -113,12 +131,52 @@ kFrameStepFlag 		= "fs"
 kFrameStepFlagLong 	= "frameStep"
 kBakeTypeFlag 		= "bt"
 kBakeTypeFlagLong 	= "bakeType"
-
-# NSuninstancerCmd enums
-# TODO: try moving these class definitions into class NSuninstancerCmd?
-# TODO: try prefacing the class name with _ or _
-class eBake:
-	geometry, curves, animation, blendShapes, numValues = range(5)
+kKeyBufferSizeFlag 	= "kbs"
+kKeyBufferSizeFlagLong 	= "keyBufferSize"
+kRecycleFlag 		= "rcy"
+kRecycleFlagLong 	= "recycle"
+kNamespaceFlag 		= "nsp"
+kNamespaceFlagLong 	= "namespace"
+kDefaultNamesFlag 	= "dn"
+kDefaultNamesFlagLong 	= "defaultNames"
+kBatchSizeFlag 		= "bsz"
+kBatchSizeFlagLong 	= "batchSize"
+kOutputFileFlag 	= "of"
+kOutputFileFlagLong 	= "outputFile"
+kLoadOutputFlag 	= "lo"
+kLoadOutputFlagLong 	= "loadOutput"
+kCacheDirectoryFlag 	= "cdr"
+kCacheDirectoryFlagLong = "cacheDirectory"
+kParticleCacheFlag 	= "pc"
+kParticleCacheFlagLong 	= "particleCache"
+kCaptureFileFlag 	= "cpf"
+kCaptureFileFlagLong 	= "captureFile"
+kReplayFileFlag 	= "rpf"
+kReplayFileFlagLong 	= "replayFile"
+kRunUpCacheFlag 	= "ruc"
+kRunUpCacheFlagLong 	= "runUpCache"
+kClearRunUpCacheFlag 	= "crc"
+kClearRunUpCacheFlagLong = "clearRunUpCache"
+kShardFlag 		= "shd"
+kShardFlagLong 		= "shard"
+kHashFileFlag 		= "hf"
+kHashFileFlagLong 	= "hashFile"
+kStateFileFlag 		= "stf"
+kStateFileFlagLong 	= "stateFile"
+kCaptureOnlyFlag 	= "cpo"
+kCaptureOnlyFlagLong 	= "captureOnly"
+kCheckpointFileFlag 	= "ckf"
+kCheckpointFileFlagLong = "checkpointFile"
+kCheckpointIntervalFlag = "cki"
+kCheckpointIntervalFlagLong = "checkpointInterval"
+kResumeFlag 		= "rsm"
+kResumeFlagLong 	= "resume"
+kKeyToleranceFlag 	= "ktl"
+kKeyToleranceFlagLong 	= "keyTolerance"
+kQuantizeKeysFlag 	= "qk"
+kQuantizeKeysFlagLong 	= "quantizeKeys"
+kFitTangentsFlag 	= "ftg"
+kFitTangentsFlagLong 	= "fitTangents"
 
 # command
 class UninstancerCmd(OpenMayaMPx.MPxCommand):
@@ -126,20 +184,77 @@ class UninstancerCmd(OpenMayaMPx.MPxCommand):
 	def __init__(self):
 		OpenMayaMPx.MPxCommand.__init__(self)
  
-		self._dpInstancer = MDagPath()
+		# Every instancer to bake. They all belong to the same particle
+		# system, which is stepped once for all of them.
+		#
+		self._dpInstancers = []
 		self._dpParticle = MDagPath()
 		self._copyAsInstance = False
 		self._bakeType = eBake.geometry
 		self._startFrame = -1
 		self._endFrame = -1
 		self._frameStep = 1
+		self._keyBufferSize = nsm.uninstancer.KeyBuffer.kDefaultMaxFrames
+		self._keyReduction = None
+		self._recycle = False
+		self._namespace = ""
+		self._useDefaultNames = False
+		self._batch = None
+		self._outputFile = ""
+		self._loadOutput = nsm.uninstancer.AsciiOutput.eLoad.importFile
+		self._output = None
+		self._cacheDirectory = ""
+		# The particle disk cache (PDC or nCache) to read frames from
+		# instead of running the dynamics.
+		#
+		self._particleCache = None
+		# The CaptureWriter recording every baked frame, and the
+		# CaptureStore to replay frames from instead of running the
+		# dynamics.
+		#
+		self._capture = None
+		self._replay = None
+		# Whether to restore the run up from the session's RunUpCache.
+		# Off by default: a restored state is only exact for particle
+		# systems that RunUpCache.isRestorable(), and fingerprinting
+		# the upstream graph has a cost of its own.
+		#
+		self._useRunUpCache = False
+		# Whether to bake every instancer in the scene rather than the
+		# command's target.
+		#
+		self._bakeScene = False
+		# The shard of the particle IDs to bake, as (index, count), and
+		# where to write the per-frame hashes of the particles.
+		#
+		self._shard = (0, 1)
+		self._hashFile = ""
+		# The file to restore the run-up state from, or to save it to,
+		# and whether to only record the -captureFile (see
+		# ns.py.ShardDriver.CaptureDriver).
+		#
+		self._stateFile = ""
+		self._captureOnly = False
+		# Where to checkpoint the bake and how often, the Checkpoint to
+		# resume from, if any, and the capture the checkpoints use if
+		# none was asked for (which is deleted once the bake is done).
+		#
+		self._checkpointFile = ""
+		self._checkpointInterval = 10
+		self._checkpoint = None
+		self._resumeCapture = None
+		self._checkpointCapture = ""
 		self._particleIdOffset = 0
 		self._hasBeenUndone = False
-		self._targetParticleIds = []
+		self._selection = nsm.uninstancer.Selection.ParticleSelection()
 		self._animData = []
 		self._modifier = MDagModifier()
 		self._mayaModifier = nsm.MayaModifier.MayaModifier()
-		self._uninstances = {}
+		# Steps the timeline and hands each frame to the particle
+		# systems being baked.
+		#
+		self._scheduler = nsm.uninstancer.Scheduler.BakeScheduler()
+		self._paths = []
 		
 	# Creator
 		
@@ -157,92 +272,41 @@ class UninstancerCmd(OpenMayaMPx.MPxCommand):
 
 		
 		try:
-			nsm.Progress.setTitle("Run up")
-			nsm.ParticleUtil.runUpTo( self._dpParticle, self._startFrame )
-			nsm.Progress.advanceProgress( 1 )
-			
-			fInstancer = MFnInstancer( self._dpInstancer )
-			idMapper = nsm.ParticleUtil.IdMapper()
-			
-			for curFrame in range( self._startFrame, self._endFrame + 1 ):
-				curTime = MTime( curFrame, MTime.uiUnit() )
-				MAnimControl.setCurrentTime( curTime )
-				
-				# Only bake geometry/animation every frameStep frames.
-				# But still make sure to call setCurrentTime so any
-				# particle systems that depend on being evaluated each
-				# frame will be.
-				#
-				if (curFrame - self._startFrame) % self._frameStep != 0:
-					continue
-				
-				nsm.Progress.setTitle("Frame %d" % curFrame)
-				
-				self._instancer.update()
-				# Get the mapping of particle id to index in the per-particle
-				# attribute arrays. This starts out 1-to-1 but changes as
-				# particles die.
-				#
-				idMapper.fromParticle( self._dpParticle.node() )
-				numParticles = fInstancer.particleCount()
-	
-				for particleIndex in range(0, numParticles):
-					newTransformObj = MObject()
-	
-					particleId = idMapper.indexToId( particleIndex )
-					if not self.isParticleSpecified( particleId ):
-						continue
-					
-					objectIndex = self._instancer.getObjectIndex(particleIndex)
-					if not self._instancer.getInstance( objectIndex ).root.isValid():
-						# This shouldn't happen, but we should carry on
-						# regardless.
-						#
-						assert 0
-						continue
-					
-					uninstance = self._getUninstance( particleId )
-					uninstance.bake( particleIndex )
-	
-				for uninstance in self._uninstances.values():
-					uninstance.endFrame()
-				nsm.Progress.advanceProgress( 1 )
+			cache = None
+			if self._useRunUpCache:
+				cache = nsm.RunUpCache.sessionCache()
+			self._scheduler.run( cache )
 					
 			nsm.Progress.setTitle("Finalizing")
-			result = []
-			for uninstance in self._uninstances.values():
-				uninstance.finalize()
-				for path in uninstance.getPaths():
-					result.append( path.partialPathName() )
-			self.setResult( result )
+			self._batch.commit()
+			self._paths.extend( self._scheduler.finalize() )
+			if self._output:
+				self._finishOutput()
+			else:
+				self.setResult( [ path.partialPathName() for path in self._paths ] )
 			nsm.Progress.advanceProgress( 1 )
 		finally:
+			if self._output:
+				self._output.close()
+			self._scheduler.close()
 			nsm.Progress.stop()
 		
-	def _getUninstance( self, particleId ):
-		uninstance = None
-		try:
-			uninstance = self._uninstances[particleId]
-		except KeyError, e:
-			if eBake.geometry == self._bakeType:
-				uninstance = StaticUninstance( self._instancer )
-			elif eBake.animation == self._bakeType:
-				uninstance = AnimatedUninstance( self._instancer )
-			self._uninstances[particleId] = uninstance
-		return uninstance
-										
-	def isParticleSpecified( self, particleId ):
-		# TODO:
-		# This may be able to be optimized since the MItInstancer
-		# appears to iterate over the indices in ascending order.
-		#
-		# If no IDs were explicitly specified then we are acting
-		# on the entire particle system. Otherwise an ID is only
-		# specified it if can be found in the targetParticleIds
-		# list
-		return ( not self._targetParticleIds or
-				 self._targetParticleIds.count( particleId ) )
-			
+		if self._checkpointFile:
+			# The bake is done, there is nothing left to resume.
+			#
+			nspy.Checkpoint.remove( self._checkpointFile )
+			if self._checkpointCapture and os.path.exists( self._checkpointCapture ):
+				os.remove( self._checkpointCapture )
+	
+	def _finishOutput( self ):
+		'''Close the Maya ASCII output and load it into the scene.'''
+		self._output.close()
+		self._paths = self._output.load( self._loadOutput )
+		if self._paths:
+			self.setResult( [ path.partialPathName() for path in self._paths ] )
+		else:
+			self.setResult( self._output.roots() )
+		
 	def undoIt( self ):
 		if not self._hasBeenUndone:
 			if self._copyAsInstance:
@@ -250,17 +314,15 @@ class UninstancerCmd(OpenMayaMPx.MPxCommand):
 				# Even though doIt() isn't called, MDGModifier still
 				# does *something* when deleteNode(...) is first called
 				#
-				for uninstance in self._uninstances.values():
-					for path in uninstance.getPaths():
-						oDuplicate = path.transform()
-						fDuplicate = MFnDagNode( oDuplicate )
-						for j in range( fDuplicate.childCount(), 0, -1 ):
-							self._mayaModifier.removeChildAt( oDuplicate, j-1 )
+				for path in self._paths:
+					oDuplicate = path.transform()
+					fDuplicate = MFnDagNode( oDuplicate )
+					for j in range( fDuplicate.childCount(), 0, -1 ):
+						self._mayaModifier.removeChildAt( oDuplicate, j-1 )
 				self._mayaModifier.doIt()
 		
-			for uninstance in self._uninstances.values():
-				for path in uninstance.getPaths():
-					self._modifier.deleteNode( path.transform() )
+			for path in self._paths:
+				self._modifier.deleteNode( path.transform() )
 				
 			self._modifier.doIt()
 			self._hasBeenUndone = True
@@ -276,6 +338,8 @@ class UninstancerCmd(OpenMayaMPx.MPxCommand):
 	def getCommandTarget( self, argData ):
 		objects = MSelectionList()
 		argData.getObjects(objects)
+		if 0 == objects.length():
+			raise nspy.Errors.BadArgumentError("Please select a single particle instancer, single particle system, or some number of individual particles.")
 	
 		# A plug is not a valid argument.
 		#			
@@ -308,17 +372,23 @@ class UninstancerCmd(OpenMayaMPx.MPxCommand):
 			if objects.length() > 1:
 				raise nspy.Errors.BadArgumentError("Please select a single particle instancer, single particle system, or some number of individual particles.")
 
-			objects.getDagPath( 0, self._dpInstancer )
-			assert self._dpInstancer.hasFn( MFn.kInstancer )
+			dpInstancer = MDagPath()
+			objects.getDagPath( 0, dpInstancer )
+			assert dpInstancer.hasFn( MFn.kInstancer )
 	
 			# Get the particle object and the instancer's index in its instanceData
 			# array.
 			#
-			oParticle, instancerIndex = nsm.InstancerUtil.particle( self._dpInstancer )
+			oParticle, instancerIndex = nsm.InstancerUtil.particle( dpInstancer )
 			if not oParticle.hasFn( MFn.kParticle ):
 				raise nspy.Errors.Error("No particle system associated with the instancer.")
 			MDagPath.getAPathTo( oParticle, self._dpParticle )
 			assert self._dpParticle.hasFn( MFn.kParticle )
+			
+			if argData.isFlagSet( kAllInstancersFlag ) and argData.flagArgumentBool( kAllInstancersFlag, 0 ):
+				self._dpInstancers = self._allInstancers()
+			else:
+				self._dpInstancers = [ dpInstancer ]
 
 		#####################################/
 		# A particle system was selected.
@@ -333,42 +403,57 @@ class UninstancerCmd(OpenMayaMPx.MPxCommand):
 			MDagPath.getAPathTo( oTarget, self._dpParticle )
 			assert self._dpParticle.hasFn( MFn.kParticle )
 	
-			if argData.isFlagSet( kInstancerFlag ):
-				# The instancer flag was specified, this means that the user wants
-				# to select which particle instancer associated with the give
-				# particle object to uninstance.
-				#
-				instancerName = argData.flagArgumentString( kInstancerFlag, 0 )
-	
-				# Find the indicated instancer object.
+			if argData.isFlagSet( kAllInstancersFlag ) and argData.flagArgumentBool( kAllInstancersFlag, 0 ):
+				# Bake every instancer of the particle system in one pass.
 				#
-				list = MSelectionList()
-				MGlobal.getSelectionListByName( instancerName, list )
-				assert list.length() > 0
-				
-				oInstancer = MObject()
-				list.getDependNode( 0, oInstancer )
-				if not oInstancer.hasFn( MFn.kInstancer ):
-					wrongNode = MFnDependencyNode( oInstancer )
-					raise nspy.Errors.Error( wrongNode.name() +  " is not a particle instancer node." )
-				list.getDagPath( 0, self._dpInstancer )
-				assert self._dpInstancer.hasFn( MFn.kInstancer )
-	
-				# Verify that the indicated instancer object is associated
-				# with the particle object specified as the command target.
+				if argData.isFlagSet( kInstancerFlag ):
+					raise nspy.Errors.BadArgumentError("The instancer flag can not be used with the allInstancers flag.")
+				self._dpInstancers = self._allInstancers()
+			elif argData.isFlagSet( kInstancerFlag ):
+				# The instancer flag was specified, this means that the user wants
+				# to select which particle instancers associated with the give
+				# particle object to uninstance. The flag can be used more than
+				# once to bake several of them in one pass.
 				#
-				oConnectedParticle, instancerIndex = nsm.InstancerUtil.particle( self._dpInstancer )
-				if not oConnectedParticle == self._dpParticle.node():
-					fInstancer = MFnInstancer( self._dpInstancer )
-					fParticle = MFnParticleSystem( self._dpParticle )
-					raise nspy.Errors.Error( fInstancer.name() +  " is not associated with " + fParticle.name() + "." )
+				self._dpInstancers = []
+				for use in range( argData.numberOfFlagUses( kInstancerFlag ) ):
+					flagArgs = MArgList()
+					argData.getFlagArgumentList( kInstancerFlag, use, flagArgs )
+					instancerName = flagArgs.asString( 0 )
+		
+					# Find the indicated instancer object.
+					#
+					list = MSelectionList()
+					MGlobal.getSelectionListByName( instancerName, list )
+					assert list.length() > 0
+					
+					oInstancer = MObject()
+					list.getDependNode( 0, oInstancer )
+					if not oInstancer.hasFn( MFn.kInstancer ):
+						wrongNode = MFnDependencyNode( oInstancer )
+						raise nspy.Errors.Error( wrongNode.name() +  " is not a particle instancer node." )
+					dpInstancer = MDagPath()
+					list.getDagPath( 0, dpInstancer )
+					assert dpInstancer.hasFn( MFn.kInstancer )
+		
+					# Verify that the indicated instancer object is associated
+					# with the particle object specified as the command target.
+					#
+					oConnectedParticle, instancerIndex = nsm.InstancerUtil.particle( dpInstancer )
+					if not oConnectedParticle == self._dpParticle.node():
+						fInstancer = MFnInstancer( dpInstancer )
+						fParticle = MFnParticleSystem( self._dpParticle )
+						raise nspy.Errors.Error( fInstancer.name() +  " is not associated with " + fParticle.name() + "." )
+					self._dpInstancers.append( dpInstancer )
 			else:
 				# No instancer flag is present - if the particle object only has
 				# one associated instancer, use it, otherwise throw an error.
 				#
 				oInstancer = nsm.ParticleUtil.instancer(self._dpParticle)
-				MDagPath.getAPathTo( oInstancer, self._dpInstancer )
-				assert self._dpInstancer.hasFn( MFn.kInstancer )
+				dpInstancer = MDagPath()
+				MDagPath.getAPathTo( oInstancer, dpInstancer )
+				assert dpInstancer.hasFn( MFn.kInstancer )
+				self._dpInstancers = [ dpInstancer ]
 	
 			# Check to see if individual particles were specified. If so store
 			# those particle IDs and only uninstance them.
@@ -412,18 +497,22 @@ class UninstancerCmd(OpenMayaMPx.MPxCommand):
 					fComponent = MFnSingleIndexedComponent( oComponent )
 					indices = MIntArray()
 					fComponent.getElements( indices )
-					i = 0
-					for i in range( indices.length() ):
-						self._targetParticleIds.append( idMapper.indexToId( indices[i] ) )
-	
-				# Sort the indices so we can use a binary search later.
-				#
-				self._targetParticleIds.sort()
+					self._selection.add( idMapper.indicesToIds( indices ) )
 		else:
 			raise nspy.Errors.BadArgumentError("Please select a single particle instancer, single particle system, or some number of individual particles.")
 	
-		assert self._dpInstancer.isValid()
+		assert self._dpInstancers
+		for dpInstancer in self._dpInstancers:
+			assert dpInstancer.isValid()
 		assert self._dpParticle.isValid()
+	
+	def _allInstancers( self ):
+		dpInstancers = []
+		for oInstancer in nsm.ParticleUtil.instancers( self._dpParticle ):
+			dpInstancer = MDagPath()
+			MDagPath.getAPathTo( oInstancer, dpInstancer )
+			dpInstancers.append( dpInstancer )
+		return dpInstancers
 		
 	def parseArg( self, argList ):
 	#
@@ -454,8 +543,12 @@ class UninstancerCmd(OpenMayaMPx.MPxCommand):
 				self._bakeType = eBake.geometry
 			elif bakeType == "animation":
 				self._bakeType = eBake.animation
+			elif bakeType == "mergedGeometry":
+				self._bakeType = eBake.mergedGeometry
+			elif bakeType == "mergedAnimation":
+				self._bakeType = eBake.mergedAnimation
 			else:
-				raise  nspy.Errors.BadArgumentError( bakeType + " is not a valid bake type. Please use one of \"geometry\" or \"animation\"." )
+				raise  nspy.Errors.BadArgumentError( bakeType + " is not a valid bake type. Please use one of \"geometry\", \"animation\", \"mergedGeometry\" or \"mergedAnimation\"." )
 		else:
 			self._bakeType = eBake.geometry
 
@@ -470,31 +563,283 @@ class UninstancerCmd(OpenMayaMPx.MPxCommand):
 			self._frameStep = argData.flagArgumentInt( kFrameStepFlag, 0 )
 		if argData.isFlagSet( kCopyAsInstanceFlag ):
 			self._copyAsInstance = argData.flagArgumentBool( kCopyAsInstanceFlag, 0 )
+		if argData.isFlagSet( kKeyBufferSizeFlag ):
+			# The number of frames of keys each animated particle buffers
+			# before writing them to its curves. 0 buffers everything
+			# until the bake is finished.
+			#
+			self._keyBufferSize = argData.flagArgumentInt( kKeyBufferSizeFlag, 0 )
+		if argData.isFlagSet( kKeyToleranceFlag ):
+			# Drop the animated duplicates' transform keys that the
+			# curves pass within these translate, rotate (in degrees)
+			# and scale tolerances of anyway. The keys are reduced each
+			# time a particle's key buffer is flushed and the last key
+			# of every flush is kept, so a -keyBufferSize of 0 reduces
+			# each particle's lifetime as a whole. Only keys baked into
+			# the scene are reduced: -outputFile streams its keys to the
+			# file unbuffered and can't be combined with this flag, and
+			# neither can sharded bakes, which always write to a file.
+			#
+			translate = argData.flagArgumentDouble( kKeyToleranceFlag, 0 )
+			rotate = argData.flagArgumentDouble( kKeyToleranceFlag, 1 )
+			scale = argData.flagArgumentDouble( kKeyToleranceFlag, 2 )
+			if translate < 0.0 or rotate < 0.0 or scale < 0.0:
+				raise nspy.Errors.BadArgumentError( "Key tolerances can not be negative." )
+			self._keyReduction = nsm.uninstancer.KeyBuffer.KeyReduction( translate, math.radians( rotate ), scale )
+		if argData.isFlagSet( kQuantizeKeysFlag ) and argData.flagArgumentBool( kQuantizeKeysFlag, 0 ):
+			if not self._keyReduction:
+				raise nspy.Errors.BadArgumentError( "-quantizeKeys needs a -keyTolerance." )
+			self._keyReduction.quantize = True
+		if argData.isFlagSet( kFitTangentsFlag ) and argData.flagArgumentBool( kFitTangentsFlag, 0 ):
+			if not self._keyReduction:
+				raise nspy.Errors.BadArgumentError( "-fitTangents needs a -keyTolerance." )
+			self._keyReduction.fitTangents = True
+		if argData.isFlagSet( kRecycleFlag ) and argData.flagArgumentBool( kRecycleFlag, 0 ):
+			# Reuse the duplicates of dead particles for particles born
+			# later on. Only meaningful when baking animation.
+			#
+			self._recycle = True
+		if argData.isFlagSet( kNamespaceFlag ):
+			self._namespace = argData.flagArgumentString( kNamespaceFlag, 0 )
+		if argData.isFlagSet( kDefaultNamesFlag ):
+			# Keep the names Maya gives the duplicates rather than naming
+			# them after the instanced objects.
+			#
+			self._useDefaultNames = argData.flagArgumentBool( kDefaultNamesFlag, 0 )
+		batchSize = nsm.ModifierBatch.kDefaultBatchSize
+		if argData.isFlagSet( kBatchSizeFlag ):
+			# The number of node creations, reparents and transform
+			# edits grouped into each modifier commit. 0 commits once
+			# at the end of the bake.
+			#
+			batchSize = argData.flagArgumentInt( kBatchSizeFlag, 0 )
+		self._batch = nsm.ModifierBatch.ModifierBatch( batchSize )
+		if argData.isFlagSet( kOutputFileFlag ):
+			# Write the bake to a Maya ASCII file instead of creating the
+			# nodes directly.
+			#
+			self._outputFile = argData.flagArgumentString( kOutputFileFlag, 0 )
+		if argData.isFlagSet( kCacheDirectoryFlag ):
+			# Where mergedAnimation bakes write their point caches. By
+			# default they go in the project's data directory.
+			#
+			self._cacheDirectory = argData.flagArgumentString( kCacheDirectoryFlag, 0 )
+		# Files are only opened once every argument has been checked, so
+		# that a rejected command leaves them untouched.
+		#
+		particleCachePath = ""
+		replayPath = ""
+		capturePath = ""
+		if argData.isFlagSet( kParticleCacheFlag ):
+			# Read the particles from a PDC sequence (any one of its
+			# .pdc files) or an nCache (its .xml file) rather than
+			# evaluating the particle system.
+			#
+			particleCachePath = argData.flagArgumentString( kParticleCacheFlag, 0 )
+		if argData.isFlagSet( kReplayFileFlag ):
+			# Bake the frames recorded by an earlier -captureFile bake
+			# rather than evaluating the particle system.
+			#
+			if particleCachePath:
+				raise nspy.Errors.BadArgumentError( "-replayFile can not be used with -particleCache." )
+			replayPath = argData.flagArgumentString( kReplayFileFlag, 0 )
+		if argData.isFlagSet( kCheckpointFileFlag ):
+			# Save where the bake has got to every -checkpointInterval
+			# baked frames so that, if it doesn't finish, it can be
+			# carried on from there with -resume.
+			#
+			self._checkpointFile = argData.flagArgumentString( kCheckpointFileFlag, 0 )
+		if argData.isFlagSet( kCheckpointIntervalFlag ):
+			self._checkpointInterval = argData.flagArgumentInt( kCheckpointIntervalFlag, 0 )
+			if self._checkpointInterval < 1:
+				raise nspy.Errors.BadArgumentError( "The checkpoint interval must be at least 1." )
+		if argData.isFlagSet( kResumeFlag ) and argData.flagArgumentBool( kResumeFlag, 0 ):
+			if not self._checkpointFile:
+				raise nspy.Errors.BadArgumentError( "-resume needs the -checkpointFile to resume from." )
+			if argData.isFlagSet( kCaptureFileFlag ):
+				raise nspy.Errors.BadArgumentError( "-resume carries on the checkpoint's capture and can not be used with -captureFile." )
+			self._checkpoint = nspy.Checkpoint.read( self._checkpointFile )
+			if self._checkpoint is None:
+				raise nspy.Errors.Error( "There is no checkpoint in %s to resume from." % self._checkpointFile )
+			if not self._startFrame <= self._checkpoint.frame < self._endFrame:
+				raise nspy.Errors.BadArgumentError( "The checkpoint is at frame %d, which is not in the frame range being baked." % self._checkpoint.frame )
+		if argData.isFlagSet( kCaptureFileFlag ):
+			# Record every baked frame's particles so that they can be
+			# baked again, with other settings, using -replayFile.
+			#
+			capturePath = argData.flagArgumentString( kCaptureFileFlag, 0 )
+		if self._checkpoint:
+			# The frames up to the checkpoint are re-baked from its
+			# capture, which the rest of the frames are added to.
+			#
+			capturePath = self._checkpoint.capturePath
+			if capturePath == self._checkpointFile + ".nscs":
+				self._checkpointCapture = capturePath
+		elif self._checkpointFile and not capturePath:
+			self._checkpointCapture = self._checkpointFile + ".nscs"
+			capturePath = self._checkpointCapture
+		if argData.isFlagSet( kRunUpCacheFlag ):
+			# Whether to reuse the state of an earlier bake's run up
+			# to the same frame.
+			#
+			self._useRunUpCache = argData.flagArgumentBool( kRunUpCacheFlag, 0 )
+		if argData.isFlagSet( kLoadOutputFlag ):
+			loadOutput = argData.flagArgumentString( kLoadOutputFlag, 0 )
+			if loadOutput == "import":
+				self._loadOutput = nsm.uninstancer.AsciiOutput.eLoad.importFile
+			elif loadOutput == "none":
+				self._loadOutput = nsm.uninstancer.AsciiOutput.eLoad.none
+			else:
+				raise nspy.Errors.BadArgumentError( loadOutput + " is not a valid load option. Please use one of \"import\" or \"none\"." )
 
 		maxRange = (self._endFrame - self._startFrame) + 4
 		nsm.Progress.reset(maxRange)
 		nsm.Progress.setTitle("Initializing")
 
-		self.getCommandTarget( argData )
+		if argData.isFlagSet( kShardFlag ):
+			# Bake only the particles whose ID modulo count is index, so
+			# that a bake can be split between processes.
+			#
+			self._shard = ( argData.flagArgumentInt( kShardFlag, 0 ),
+							argData.flagArgumentInt( kShardFlag, 1 ) )
+			if self._shard[1] < 1 or not 0 <= self._shard[0] < self._shard[1]:
+				raise nspy.Errors.BadArgumentError( "-shard takes a shard index and a shard count, and the index must be less than the count." )
+			self._selection.setShard( self._shard[0], self._shard[1] )
+		if argData.isFlagSet( kHashFileFlag ):
+			self._hashFile = argData.flagArgumentString( kHashFileFlag, 0 )
+		if argData.isFlagSet( kStateFileFlag ):
+			self._stateFile = argData.flagArgumentString( kStateFileFlag, 0 )
+		if argData.isFlagSet( kCaptureOnlyFlag ):
+			self._captureOnly = argData.flagArgumentBool( kCaptureOnlyFlag, 0 )
+			if self._captureOnly and not capturePath:
+				raise nspy.Errors.BadArgumentError( "-captureOnly needs a -captureFile to record to." )
+		if argData.isFlagSet( kSceneFlag ):
+			self._bakeScene = argData.flagArgumentBool( kSceneFlag, 0 )
 		
-		self._instancer = Instancer( self._dpParticle, self._dpInstancer )
-		self._instancer.reset( self._copyAsInstance, eBake.animation == self._bakeType )
-		if self._instancer.numInstances() <= 0:
-			raise nspy.Errors.Error("No shape associated with the instancer.")
-
-
+		if self._bakeScene:
+			# Every particle system that drives an instancer, with all
+			# of its instancers.
+			#
+			if self._checkpointFile:
+				raise nspy.Errors.BadArgumentError( "-checkpointFile can not be used with -scene." )
+			if particleCachePath or capturePath or replayPath:
+				raise nspy.Errors.BadArgumentError( "-particleCache, -captureFile and -replayFile can not be used with -scene." )
+			particleInstancers = nsm.uninstancer.Scheduler.findInstancers()
+			if not particleInstancers:
+				raise nspy.Errors.Error( "There are no particle instancers in the scene." )
+		else:
+			self.getCommandTarget( argData )
+			particleInstancers = [ (self._dpParticle, self._dpInstancers) ]
 		
-		# When baking animation the instanced object itself
-		# can't be animated - although its children can be so long
-		# as we aren't baking to blendshapes (i.e. the objectIndex
-		# associated with a given particleId never changes.
-		#
-		if eBake.animation == self._bakeType:
-			for i in range( self._instancer.numInstances() ):
-				if MAnimUtil.isAnimated( self._instancer.getInstance(i).root.transform() ):
-					raise nspy.Errors.Error( "Instanced object " + self._instancer.getInstance(i).root.partialPathName() + " is animated. Bake type 'Animation' is unsupported." )
-
+		if len( particleInstancers ) > 1:
+			if self._hashFile:
+				raise nspy.Errors.BadArgumentError( "-hashFile can not be used with -scene." )
+			if self._stateFile:
+				raise nspy.Errors.BadArgumentError( "-stateFile can not be used with -scene." )
+		if len( self._dpInstancers ) > 1 and self._checkpointFile:
+			# The checkpoint's capture holds a single instancer's frames.
+			#
+			raise nspy.Errors.BadArgumentError( "-checkpointFile can only be used with a single instancer." )
+		if len( self._dpInstancers ) > 1 and (capturePath or replayPath):
+			raise nspy.Errors.BadArgumentError( "-captureFile and -replayFile can only be used with a single instancer." )
+		if self._keyReduction and self._outputFile:
+			# Keys written to a file are streamed rather than buffered.
+			#
+			raise nspy.Errors.BadArgumentError( "-keyTolerance can not be used with -outputFile, its keys are written unbuffered." )
+		_checkPaths( [ ("-particleCache", particleCachePath), ("-replayFile", replayPath) ],
+					 [ ("-captureFile", capturePath),
+					   ("-outputFile", self._outputFile),
+					   ("-hashFile", self._hashFile),
+					   ("-stateFile", self._stateFile),
+					   ("-checkpointFile", self._checkpointFile) ] )
+		
+		if argData.isFlagSet( kClearRunUpCacheFlag ) and argData.flagArgumentBool( kClearRunUpCacheFlag, 0 ):
+			# For changes the cached states' fingerprints don't catch.
+			#
+			for (dpParticle, dpInstancers) in particleInstancers:
+				nsm.RunUpCache.sessionCache().invalidate( dpParticle.fullPathName() )
+		
+		tag = ""
+		if self._shard[1] > 1:
+			# Name the shards' duplicates apart so that they can be
+			# merged.
+			#
+			tag = "s%d_" % self._shard[0]
+		names = nsm.uninstancer.Names.NameAllocator( self._namespace, self._useDefaultNames, tag )
+		
+		settings = BakeSettings()
+		settings.bakeType = self._bakeType
+		settings.copyAsInstance = self._copyAsInstance
+		settings.keyBufferSize = self._keyBufferSize
+		settings.keyReduction = self._keyReduction
+		settings.recycle = self._recycle
+		settings.names = names
+		settings.batch = self._batch
+		settings.cacheDirectory = self._cacheDirectory
+		
+		try:
+			if particleCachePath:
+				self._particleCache = nspy.ParticleCache.openCache( particleCachePath )
+			if replayPath:
+				self._replay = nspy.CaptureStore.CaptureStore( replayPath )
+			if self._checkpoint:
+				self._resumeCapture = nspy.CaptureStore.CaptureStore( capturePath )
+				self._capture = nspy.CaptureStore.CaptureWriter( capturePath, self._checkpoint.numFrames )
+			elif capturePath:
+				self._capture = nspy.CaptureStore.CaptureWriter( capturePath )
+			if self._outputFile:
+				self._output = nsm.uninstancer.AsciiOutput.AsciiOutput( self._outputFile, names, self._keyBufferSize )
+			settings.output = self._output
 			
+			for (dpParticle, dpInstancers) in particleInstancers:
+				bake = nsm.uninstancer.Scheduler.ParticleBake( dpParticle,
+															   dpInstancers,
+															   settings,
+															   self._startFrame,
+															   self._endFrame,
+															   self._frameStep,
+															   self._selection )
+				# Added straight away so that the scheduler closes
+				# whatever the bake opens.
+				#
+				self._scheduler.add( bake )
+				bake.particleCache = self._particleCache
+				bake.capture = self._capture
+				bake.replay = self._replay
+				bake.resumeCapture = self._resumeCapture
+				if self._hashFile:
+					bake.hashFile = open( self._hashFile, "w" )
+				bake.stateFile = self._stateFile or None
+				bake.captureOnly = self._captureOnly
+				if self._checkpointFile:
+					bake.checkpointFile = self._checkpointFile
+					bake.checkpointInterval = self._checkpointInterval
+					bake.resume = self._checkpoint
+		except:
+			if self._output:
+				self._output.close()
+			if self._capture:
+				self._capture.close()
+			if self._replay:
+				self._replay.close()
+			if self._resumeCapture:
+				self._resumeCapture.close()
+			self._scheduler.close()
+			raise
+
+def _checkPaths( inputs, outputs ):
+	'''Raise if a file the command writes is also one it reads or
+	   another one it writes. inputs and outputs are (flag, path) pairs,
+	   unset flags have empty paths.'''
+	seen = {}
+	for (flag, path) in inputs + outputs:
+		if not path:
+			continue
+		key = os.path.normcase( os.path.abspath( path ) )
+		if seen.has_key( key ) and (flag, path) in outputs:
+			raise nspy.Errors.BadArgumentError( "%s and %s can not both be %s." % (seen[key], flag, path) )
+		seen.setdefault( key, flag )
+
 def cmdCreator():
 	return OpenMayaMPx.asMPxPtr( UninstancerCmd() )
 
@@ -502,13 +847,39 @@ def syntaxCreator():
 	syntax = MSyntax() 
 
 	syntax.addFlag( kInstancerFlag, kInstancerFlagLong, MSyntax.kString )
+	syntax.makeFlagMultiUse( kInstancerFlag )
+	syntax.addFlag( kAllInstancersFlag, kAllInstancersFlagLong, MSyntax.kBoolean )
+	syntax.addFlag( kSceneFlag, kSceneFlagLong, MSyntax.kBoolean )
+	syntax.addFlag( kShardFlag, kShardFlagLong, MSyntax.kLong, MSyntax.kLong )
+	syntax.addFlag( kHashFileFlag, kHashFileFlagLong, MSyntax.kString )
+	syntax.addFlag( kStateFileFlag, kStateFileFlagLong, MSyntax.kString )
+	syntax.addFlag( kCaptureOnlyFlag, kCaptureOnlyFlagLong, MSyntax.kBoolean )
+	syntax.addFlag( kCheckpointFileFlag, kCheckpointFileFlagLong, MSyntax.kString )
+	syntax.addFlag( kCheckpointIntervalFlag, kCheckpointIntervalFlagLong, MSyntax.kLong )
+	syntax.addFlag( kResumeFlag, kResumeFlagLong, MSyntax.kBoolean )
 	syntax.addFlag( kCopyAsInstanceFlag, kCopyAsInstanceFlagLong, MSyntax.kBoolean )
 	syntax.addFlag( kStartFrameFlag, kStartFrameFlagLong, MSyntax.kLong )
 	syntax.addFlag( kEndFrameFlag, kEndFrameFlagLong, MSyntax.kLong )
 	syntax.addFlag( kFrameStepFlag, kFrameStepFlagLong, MSyntax.kLong )
 	syntax.addFlag( kBakeTypeFlag, kBakeTypeFlagLong, MSyntax.kString )
+	syntax.addFlag( kKeyBufferSizeFlag, kKeyBufferSizeFlagLong, MSyntax.kLong )
+	syntax.addFlag( kKeyToleranceFlag, kKeyToleranceFlagLong, MSyntax.kDouble, MSyntax.kDouble, MSyntax.kDouble )
+	syntax.addFlag( kQuantizeKeysFlag, kQuantizeKeysFlagLong, MSyntax.kBoolean )
+	syntax.addFlag( kFitTangentsFlag, kFitTangentsFlagLong, MSyntax.kBoolean )
+	syntax.addFlag( kRecycleFlag, kRecycleFlagLong, MSyntax.kBoolean )
+	syntax.addFlag( kNamespaceFlag, kNamespaceFlagLong, MSyntax.kString )
+	syntax.addFlag( kDefaultNamesFlag, kDefaultNamesFlagLong, MSyntax.kBoolean )
+	syntax.addFlag( kBatchSizeFlag, kBatchSizeFlagLong, MSyntax.kLong )
+	syntax.addFlag( kOutputFileFlag, kOutputFileFlagLong, MSyntax.kString )
+	syntax.addFlag( kLoadOutputFlag, kLoadOutputFlagLong, MSyntax.kString )
+	syntax.addFlag( kCacheDirectoryFlag, kCacheDirectoryFlagLong, MSyntax.kString )
+	syntax.addFlag( kParticleCacheFlag, kParticleCacheFlagLong, MSyntax.kString )
+	syntax.addFlag( kCaptureFileFlag, kCaptureFileFlagLong, MSyntax.kString )
+	syntax.addFlag( kReplayFileFlag, kReplayFileFlagLong, MSyntax.kString )
+	syntax.addFlag( kRunUpCacheFlag, kRunUpCacheFlagLong, MSyntax.kBoolean )
+	syntax.addFlag( kClearRunUpCacheFlag, kClearRunUpCacheFlagLong, MSyntax.kBoolean )
 
-	syntax.setObjectType( MSyntax.kSelectionList, 1 )
+	syntax.setObjectType( MSyntax.kSelectionList, 0 )
 	syntax.useSelectionAsDefault( True )
 	
 	return syntax 
@@ -0,0 +1,211 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import array
+import bisect
+import mmap
+import os
+import struct
+
+
+# File layout: a fixed size header, then every captured frame's columns
+# (numParticles int32 particle IDs, numParticles int32 object indices and
+# numParticles row-major 4x4 float64 instance matrices) one after the
+# other, then a table of (time, numParticles, offset) per frame. The
+# header's frame count and table offset are filled in on close(), and on
+# every sync() in between, in which case frames added afterwards follow
+# the table.
+#
+kMagic = "NSCS"
+kVersion = 1
+_headerFormat = "<4siiq"
+kHeaderSize = struct.calcsize( _headerFormat )
+_entryFormat = "<diq"
+_entrySize = struct.calcsize( _entryFormat )
+_intSize = array.array( 'i' ).itemsize
+_matrixSize = 16 * array.array( 'd' ).itemsize
+
+class CaptureWriter:
+	'''Records the particles' instance matrices frame by frame. Frames
+	   have to be added in increasing time order. If numFrames is given
+	   the capture at path is continued after its first numFrames frames
+	   (as of its last sync() or close()) rather than started over.'''
+	
+	def __init__( self, path, numFrames=None ):
+		self._path = path
+		if numFrames is None:
+			self._file = open( path, "w+b" )
+			self._file.write( struct.pack( _headerFormat, kMagic, kVersion, 0, 0 ) )
+			self._entries = []
+		else:
+			self._file = open( path, "r+b" )
+			self._entries = _readTable( self._file, path )
+			if numFrames > len( self._entries ):
+				self._file.close()
+				raise ValueError( "%s only holds %d frames." % (path, len( self._entries )) )
+			del self._entries[numFrames:]
+			self._file.seek( 0, 2 )
+	
+	def path( self ):
+		return self._path
+	
+	def numFrames( self ):
+		return len( self._entries )
+	
+	def addFrame( self, time, ids, objectIndices, matrices ):
+		'''ids and objectIndices hold one value per particle, matrices
+		   16 values per particle.'''
+		numParticles = len( ids )
+		if len( objectIndices ) != numParticles or len( matrices ) != 16 * numParticles:
+			raise ValueError( "Every particle needs an ID, an object index and a matrix." )
+		if self._entries and time <= self._entries[-1][0]:
+			raise ValueError( "Frames must be captured in increasing time order." )
+		
+		self._entries.append( (time, numParticles, self._file.tell()) )
+		self._file.write( array.array( 'i', [ int( i ) for i in ids ] ).tostring() )
+		self._file.write( array.array( 'i', [ int( i ) for i in objectIndices ] ).tostring() )
+		self._file.write( array.array( 'd', matrices ).tostring() )
+	
+	def sync( self ):
+		'''Make the frames added so far readable, and safe on disk, without
+		   closing the capture. The table is written after the frames and
+		   only then does the header point to it, so a crash at any point
+		   leaves the capture as of the last sync().'''
+		self._writeTable()
+		self._file.seek( 0, 2 )
+	
+	def close( self ):
+		if self._file is None:
+			return
+		self._writeTable()
+		self._file.close()
+		self._file = None
+	
+	def _writeTable( self ):
+		tableOffset = self._file.tell()
+		for entry in self._entries:
+			self._file.write( struct.pack( _entryFormat, *entry ) )
+		self._file.flush()
+		os.fsync( self._file.fileno() )
+		self._file.seek( 0 )
+		self._file.write( struct.pack( _headerFormat, kMagic, kVersion, len( self._entries ), tableOffset ) )
+		self._file.flush()
+		os.fsync( self._file.fileno() )
+
+class CaptureFrame:
+	'''One captured frame. ids and objectIndices are array('i')s,
+	   matrices is a flat array('d') of 16 values per particle.'''
+	
+	def __init__( self, time, ids, objectIndices, matrices ):
+		self.time = time
+		self.ids = ids
+		self.objectIndices = objectIndices
+		self.matrices = matrices
+	
+	def count( self ):
+		return len( self.ids )
+
+class CaptureStore:
+	'''Reads a capture written by CaptureWriter. Frames are read straight
+	   from a read-only memory map of the file, in any order.'''
+	
+	def __init__( self, path ):
+		self._file = open( path, "rb" )
+		self._map = None
+		self._entries = _readTable( self._file, path )
+		if self._entries:
+			self._map = mmap.mmap( self._file.fileno(), 0, access=mmap.ACCESS_READ )
+		self._times = [ entry[0] for entry in self._entries ]
+	
+	def numFrames( self ):
+		return len( self._entries )
+	
+	def times( self ):
+		return self._times
+	
+	def frame( self, index ):
+		'''The index'th captured frame.'''
+		(time, numParticles, offset) = self._entries[index]
+		ids = self._read( 'i', offset, numParticles * _intSize )
+		offset += numParticles * _intSize
+		objectIndices = self._read( 'i', offset, numParticles * _intSize )
+		offset += numParticles * _intSize
+		matrices = self._read( 'd', offset, numParticles * _matrixSize )
+		return CaptureFrame( time, ids, objectIndices, matrices )
+	
+	def frameAt( self, time ):
+		'''The frame captured at time, or the latest one before it. Returns
+		   None if time is before the first captured frame.'''
+		i = bisect.bisect_right( self._times, time + 1e-6 )
+		if not i:
+			return None
+		return self.frame( i - 1 )
+	
+	def _read( self, typeCode, offset, size ):
+		values = array.array( typeCode )
+		if size:
+			values.fromstring( self._map[offset:offset + size] )
+		return values
+	
+	def close( self ):
+		if self._map is not None:
+			self._map.close()
+			self._map = None
+		self._file.close()
+
+def _readTable( file, path ):
+	'''Returns the (time, numParticles, offset) of every frame in the
+	   capture open as file.'''
+	file.seek( 0 )
+	header = file.read( kHeaderSize )
+	if len( header ) < kHeaderSize:
+		raise ValueError( "%s is not a capture." % path )
+	(magic, version, numFrames, tableOffset) = struct.unpack( _headerFormat, header )
+	if magic != kMagic or version != kVersion:
+		raise ValueError( "%s is not a capture." % path )
+	file.seek( tableOffset )
+	table = file.read( numFrames * _entrySize )
+	if len( table ) < numFrames * _entrySize:
+		raise ValueError( "%s is truncated." % path )
+	return [ struct.unpack( _entryFormat, table[i * _entrySize:(i + 1) * _entrySize] )
+			 for i in range( numFrames ) ]
+
+def concatenate( paths, path ):
+	'''Join captures of consecutive frame ranges, in order, into one
+	   capture at path. A frame that is not later than the last frame
+	   already joined is skipped, so overlapping ranges are fine.'''
+	writer = CaptureWriter( path )
+	try:
+		lastTime = None
+		for sourcePath in paths:
+			store = CaptureStore( sourcePath )
+			try:
+				for i in range( store.numFrames() ):
+					frame = store.frame( i )
+					if lastTime is not None and frame.time <= lastTime:
+						continue
+					writer.addFrame( frame.time, frame.ids, frame.objectIndices, frame.matrices )
+					lastTime = frame.time
+			finally:
+				store.close()
+	finally:
+		writer.close()
@@ -0,0 +1,117 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+import os
+import struct
+
+import ns.py as nspy
+import ns.py.Errors
+
+
+# File layout: magic, version, the last baked frame, the number of frames
+# in the capture, and the lengths of the capture and state paths, then
+# the paths themselves. An empty state path means there is no particle
+# state to restore.
+#
+kMagic = "NSCK"
+kVersion = 1
+_header = struct.Struct( "<4siiiii" )
+
+class Checkpoint:
+	'''Where a bake had got to: the last frame baked, the capture holding
+	   every frame baked up to it (and how many frames of it count) and
+	   the file holding the particle state at that frame, if the particles
+	   are simulated.'''
+	
+	def __init__( self, frame, numFrames, capturePath, statePath=None ):
+		self.frame = frame
+		self.numFrames = numFrames
+		self.capturePath = capturePath
+		self.statePath = statePath
+
+def write( path, checkpoint ):
+	'''Replace the checkpoint at path. A reader sees either the old
+	   checkpoint or the new one, never part of one.'''
+	statePath = checkpoint.statePath or ""
+	tmpPath = path + ".tmp"
+	file = open( tmpPath, "wb" )
+	try:
+		file.write( _header.pack( kMagic, kVersion, checkpoint.frame, checkpoint.numFrames,
+								  len( checkpoint.capturePath ), len( statePath ) ) )
+		file.write( checkpoint.capturePath )
+		file.write( statePath )
+		file.flush()
+		os.fsync( file.fileno() )
+	finally:
+		file.close()
+	# rename() replaces the old checkpoint atomically, except on Windows
+	# where it can't replace an existing file. If a crash there leaves
+	# only the complete temporary file, read() falls back to it.
+	#
+	if os.name == "nt" and os.path.exists( path ):
+		os.remove( path )
+	os.rename( tmpPath, path )
+
+def read( path ):
+	'''Returns the Checkpoint at path, or None if there is none. If
+	   write() was interrupted while replacing the checkpoint, the one it
+	   was writing is returned.'''
+	if os.path.exists( path ):
+		return _read( path, True )
+	if os.path.exists( path + ".tmp" ):
+		return _read( path + ".tmp", False )
+	return None
+
+def remove( path ):
+	'''Delete the checkpoint at path and its particle state file.'''
+	checkpoint = read( path )
+	if checkpoint is None:
+		return
+	if checkpoint.statePath and os.path.exists( checkpoint.statePath ):
+		os.remove( checkpoint.statePath )
+	for checkpointPath in ( path, path + ".tmp" ):
+		if os.path.exists( checkpointPath ):
+			os.remove( checkpointPath )
+
+def _read( path, complete ):
+	'''Reads the checkpoint at path. If complete is False the file may
+	   have been cut short by a crash, in which case None is returned.'''
+	file = open( path, "rb" )
+	try:
+		header = file.read( _header.size )
+		if len( header ) < _header.size:
+			if not complete:
+				return None
+			raise nspy.Errors.BadArgumentError( "%s is not a checkpoint." % path )
+		(magic, version, frame, numFrames, capturePathLength, statePathLength) = _header.unpack( header )
+		if magic != kMagic:
+			raise nspy.Errors.BadArgumentError( "%s is not a checkpoint." % path )
+		if version != kVersion:
+			raise nspy.Errors.UnsupportedError( "Checkpoint version %d is not supported." % version )
+		capturePath = file.read( capturePathLength )
+		statePath = file.read( statePathLength )
+		if len( capturePath ) < capturePathLength or len( statePath ) < statePathLength:
+			if not complete:
+				return None
+			raise nspy.Errors.BadArgumentError( "%s is truncated." % path )
+		return Checkpoint( frame, numFrames, capturePath, statePath or None )
+	finally:
+		file.close()
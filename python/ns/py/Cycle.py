@@ -0,0 +1,71 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+# NumPy is optional: without it the object indices are computed one
+# particle at a time.
+#
+try:
+	import numpy
+except ImportError, e:
+	numpy = None
+
+
+def sequentialObjectIndices( ages, cycleStarts, step, numInstances, numParticles ):
+	'''Compute the instanced object index of every particle when the
+	   instancer cycles sequentially. ages are in seconds, as is step.
+	   cycleStarts holds each particle's cycle start object and may be
+	   None if no attribute is mapped to it.
+	   
+	   The particle's age divided by the step gives the number of
+	   objects it has cycled through. It looks like Maya rounds that
+	   result to 3 decimal places before truncating it to an int, and
+	   the same arithmetic is used here so the indices match exactly.'''
+	if numpy is not None and numParticles and step:
+		return _sequentialObjectIndices( ages, cycleStarts, step, numInstances, numParticles )
+	particles = range( numParticles )
+	if cycleStarts is None:
+		return [ int( round( ages[i] / step, 3 ) ) % numInstances
+				 for i in particles ]
+	return [ (int( cycleStarts[i] ) + int( round( ages[i] / step, 3 ) )) % numInstances
+			 for i in particles ]
+
+def _sequentialObjectIndices( ages, cycleStarts, step, numInstances, numParticles ):
+	'''sequentialObjectIndices() with NumPy.'''
+	cycles = _asArray( ages, numParticles, numpy.float64 ) / step
+	indices = numpy.floor( cycles ).astype( numpy.int64 )
+	# Rounding to 3 decimal places only changes the truncated value of
+	# negative cycles and of those within 0.0005 of the next integer.
+	# Those few are rounded by Python exactly as above.
+	#
+	inexact = numpy.nonzero( (cycles < 0.0) | (numpy.floor( cycles + 0.0005 ) != indices) )[0]
+	for i in inexact.tolist():
+		indices[i] = int( round( float( cycles[i] ), 3 ) )
+	if cycleStarts is not None:
+		# int() truncates towards zero, as does the cast.
+		#
+		indices += _asArray( cycleStarts, numParticles, numpy.float64 ).astype( numpy.int64 )
+	return (indices % numInstances).tolist()
+
+def _asArray( values, count, dtype ):
+	'''The first count values as a NumPy array.'''
+	if isinstance( values, numpy.ndarray ):
+		return values[:count].astype( dtype )
+	return numpy.array( [ values[i] for i in range( count ) ], dtype=dtype )
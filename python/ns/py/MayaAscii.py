@@ -0,0 +1,230 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import os
+import time
+
+
+# Keys written per setAttr statement. Long statements are split so that
+# Maya never has to parse one huge line.
+#
+kKeysPerStatement = 100
+
+# Tangent type values as they are stored in anim curve ".kit"/".kot"
+# attributes.
+#
+class eTangent:
+	globalTangent, fixed, linear, flat, smooth, step = range(6)
+	
+def quote( string ):
+	'''Returns string as a double quoted MEL string literal.'''
+	return '"%s"' % string.replace( '\\', '\\\\' ).replace( '"', '\\"' )
+
+def formatValue( value ):
+	'''Formats a number the way Maya writes them, without needless
+	   trailing zeros.'''
+	if isinstance( value, bool ):
+		return ( value and "yes" ) or "no"
+	if isinstance( value, (int, long) ):
+		return "%d" % value
+	text = "%.10g" % value
+	if text == "-0":
+		return "0"
+	return text
+
+def concatenate( paths, path ):
+	'''Write the statements of every Maya ASCII file in paths, in order,
+	   to a single file at path. Comments are dropped and only the first
+	   file's currentUnit statement is kept.'''
+	stream = open( path, "w" )
+	try:
+		writer = Writer( stream )
+		writer.comment( "Maya ASCII scene" )
+		writer.comment( "Name: %s" % os.path.basename( path ) )
+		for i in range( len( paths ) ):
+			source = open( paths[i], "r" )
+			try:
+				for line in source:
+					if line.startswith( "//" ):
+						continue
+					if i and line.startswith( "currentUnit " ):
+						continue
+					stream.write( line )
+			finally:
+				source.close()
+		writer.end( path )
+	finally:
+		stream.close()
+
+class Writer:
+	'''Writes Maya ASCII statements to a file-like object as they are
+	   requested. Nothing is buffered beyond the stream itself so files
+	   of any size can be written in constant memory. Statements that
+	   use relative attribute names (setAttr ".t" ...) apply to the node
+	   most recently created or selected with createNode() or select().'''
+	
+	def __init__( self, stream ):
+		self._stream = stream
+		self._current = None
+	
+	def header( self, fileName, linearUnit="centimeter", angularUnit="degree",
+				timeUnit="film", requires=() ):
+		self._write( "//Maya ASCII scene" )
+		self._write( "//Name: %s" % os.path.basename( fileName ) )
+		self._write( "//Last modified: %s" % time.strftime( "%a, %b %d, %Y %I:%M:%S %p" ) )
+		for (plugin, version) in requires:
+			self._statement( "requires %s %s" % (quote( plugin ), quote( version )) )
+		self._statement( "currentUnit -l %s -a %s -t %s" % (linearUnit, angularUnit, timeUnit) )
+	
+	def end( self, fileName ):
+		self._write( "// End of %s" % os.path.basename( fileName ) )
+	
+	def comment( self, text ):
+		self._write( "//%s" % text )
+	
+	def createNode( self, nodeType, name, parent=None, shared=False ):
+		flags = ""
+		if shared:
+			flags += " -s"
+		flags += " -n %s" % quote( name )
+		if parent:
+			flags += " -p %s" % quote( parent )
+		self._statement( "createNode %s%s" % (nodeType, flags) )
+		self._current = name
+	
+	def select( self, name ):
+		'''Make name the target of relative setAttr statements.'''
+		if name != self._current:
+			self._statement( "select -ne %s" % quote( name ) )
+			self._current = name
+	
+	def setAttr( self, attr, values, attrType=None, size=None, lock=False ):
+		'''values is a sequence of numbers or strings. Strings are
+		   quoted.'''
+		flags = ""
+		if size is not None:
+			flags += " -s %d" % size
+		if lock:
+			flags += " -l on"
+		flags += " %s" % quote( attr )
+		if attrType:
+			flags += " -type %s" % quote( attrType )
+		self._statement( "setAttr%s %s" % (flags, self._formatValues( values )) )
+	
+	def connectAttr( self, source, destination, nextAvailable=False ):
+		flags = ""
+		if nextAvailable:
+			flags = " -na"
+		self._statement( "connectAttr%s %s %s" % (flags, quote( source ), quote( destination )) )
+	
+	def command( self, statement ):
+		'''Write a MEL statement as is. Invalidates the current node since
+		   the statement may change the selection.'''
+		self._statement( statement )
+		self._current = None
+	
+	def keys( self, curve, firstIndex, times, values, outTangent=None ):
+		'''Append keys to an anim curve node written earlier. firstIndex is
+		   the number of keys already written to the curve. If outTangent
+		   is set the keys' out tangents are set to it.'''
+		numKeys = len( times )
+		if not numKeys:
+			return
+		self.select( curve )
+		for start in range( 0, numKeys, kKeysPerStatement ):
+			stop = min( start + kKeysPerStatement, numKeys )
+			pairs = []
+			for i in range( start, stop ):
+				pairs.append( formatValue( times[i] ) )
+				pairs.append( formatValue( values[i] ) )
+			self._statement( "setAttr \".ktv[%d:%d]\" %s" % (firstIndex + start,
+															 firstIndex + stop - 1,
+															 " ".join( pairs )) )
+			if outTangent is not None:
+				tangents = " ".join( [ "%d" % outTangent ] * (stop - start) )
+				self._statement( "setAttr \".kot[%d:%d]\" %s" % (firstIndex + start,
+																  firstIndex + stop - 1,
+																  tangents) )
+	
+	def _formatValues( self, values ):
+		formatted = []
+		for value in values:
+			if isinstance( value, basestring ):
+				formatted.append( quote( value ) )
+			else:
+				formatted.append( formatValue( value ) )
+		return " ".join( formatted )
+	
+	def _statement( self, statement ):
+		self._write( statement + ";" )
+	
+	def _write( self, line ):
+		self._stream.write( line + "\n" )
+
+class KeyStream:
+	'''Writes anim curves from a stream of per-frame samples. Keys are held
+	   per curve until chunkSize of them are waiting and then written, so
+	   memory use doesn't grow with the length of the stream.'''
+	
+	def __init__( self, writer, chunkSize=kKeysPerStatement ):
+		self._writer = writer
+		self._chunkSize = chunkSize
+		# Per curve: [ numWritten, times, values, outTangent ]
+		#
+		self._curves = {}
+	
+	def addCurve( self, curve, outTangent=None ):
+		self._curves[curve] = [ 0, [], [], outTangent ]
+	
+	def add( self, curve, time, value ):
+		state = self._curves[curve]
+		state[1].append( time )
+		state[2].append( value )
+		if len( state[1] ) >= self._chunkSize:
+			self._flushCurve( curve, state )
+	
+	def addSamples( self, samples ):
+		'''samples is an iterable (e.g. a generator) of (time, keys) per
+		   frame where keys is an iterable of (curve, value).'''
+		for (time, keys) in samples:
+			for (curve, value) in keys:
+				self.add( curve, time, value )
+	
+	def numKeys( self, curve ):
+		state = self._curves[curve]
+		return state[0] + len( state[1] )
+	
+	def finishCurve( self, curve ):
+		'''Write the curve's waiting keys and stop tracking it.'''
+		self._flushCurve( curve, self._curves.pop( curve ) )
+	
+	def flush( self ):
+		for (curve, state) in self._curves.items():
+			self._flushCurve( curve, state )
+	
+	def _flushCurve( self, curve, state ):
+		if not state[1]:
+			return
+		self._writer.keys( curve, state[0], state[1], state[2], state[3] )
+		state[0] += len( state[1] )
+		state[1] = []
+		state[2] = []
@@ -0,0 +1,371 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import array
+import bisect
+import os
+import re
+import struct
+import sys
+import xml.dom.minidom
+
+import ns.py as nspy
+import ns.py.Errors
+
+
+# Maya cache times are in ticks.
+#
+kTicksPerSecond = 6000
+
+def ticks( frame, framesPerSecond ):
+	return int( round( frame * kTicksPerSecond / float( framesPerSecond ) ) )
+
+class ParticleSample:
+	'''One frame of cached per-particle data. Every attribute is a flat
+	   array('d') - vector attributes hold xyz triples.'''
+	
+	def __init__( self, ticks ):
+		self.ticks = ticks
+		self._arrays = {}
+		self._vectors = {}
+	
+	def set( self, attrName, values, isVector=False ):
+		self._arrays[attrName] = values
+		self._vectors[attrName] = isVector
+	
+	def attributes( self ):
+		return self._arrays.keys()
+	
+	def has( self, attrName ):
+		return self._arrays.has_key( attrName )
+	
+	def isVector( self, attrName ):
+		return self._vectors[attrName]
+	
+	def array( self, attrName ):
+		'''The attribute's values, or None if the sample doesn't have it.'''
+		return self._arrays.get( attrName )
+	
+	def ids( self ):
+		return self._arrays.get( "id" ) or array.array( 'd' )
+	
+	def count( self ):
+		return len( self.ids() )
+
+def _bigEndian( values ):
+	if sys.byteorder == "little":
+		values.byteswap()
+	return values
+
+def _readArray( stream, typeCode, count ):
+	values = array.array( typeCode )
+	if count:
+		values.fromstring( stream.read( values.itemsize * count ) )
+		if len( values ) != count:
+			raise nspy.Errors.Error( "Unexpected end of cache file." )
+	return _bigEndian( values )
+
+###########################################################################
+# PDC - Maya's classic particle disk cache. One big-endian file per frame
+# named <particleShape>.<ticks>.pdc.
+###########################################################################
+
+class ePdcType:
+	intValue, intArray, doubleValue, doubleArray, vector, vectorArray = range(6)
+
+def readPdc( path, ticks=0 ):
+	'''Returns the ParticleSample stored in a .pdc file.'''
+	stream = open( path, "rb" )
+	try:
+		(magic, version, byteOrder, extra1, extra2,
+		 numParticles, numAttributes) = struct.unpack( ">4s6i", stream.read( 28 ) )
+		if magic != "PDC ":
+			raise nspy.Errors.Error( "%s is not a PDC file." % path )
+		
+		sample = ParticleSample( ticks )
+		for i in range( numAttributes ):
+			(nameLength,) = struct.unpack( ">i", stream.read( 4 ) )
+			name = stream.read( nameLength )
+			(dataType,) = struct.unpack( ">i", stream.read( 4 ) )
+			if ePdcType.intValue == dataType:
+				values = array.array( 'd', _readArray( stream, 'i', 1 ).tolist() * numParticles )
+				sample.set( name, values )
+			elif ePdcType.intArray == dataType:
+				sample.set( name, array.array( 'd', _readArray( stream, 'i', numParticles ).tolist() ) )
+			elif ePdcType.doubleValue == dataType:
+				sample.set( name, _readArray( stream, 'd', 1 ) * numParticles )
+			elif ePdcType.doubleArray == dataType:
+				sample.set( name, _readArray( stream, 'd', numParticles ) )
+			elif ePdcType.vector == dataType:
+				sample.set( name, _readArray( stream, 'd', 3 ) * numParticles, True )
+			elif ePdcType.vectorArray == dataType:
+				sample.set( name, _readArray( stream, 'd', 3 * numParticles ), True )
+			else:
+				raise nspy.Errors.Error( "%s has an attribute of unknown type %d." % (path, dataType) )
+		return sample
+	finally:
+		stream.close()
+
+class PdcCache:
+	'''A sequence of .pdc files. path is any one file of the sequence.'''
+	
+	def __init__( self, path ):
+		match = re.match( r"^(.*)\.(-?\d+)\.pdc$", path )
+		if not match:
+			raise nspy.Errors.BadArgumentError( "%s is not named like a PDC cache file (<particle>.<ticks>.pdc)." % path )
+		self._prefix = match.group(1)
+		directory = os.path.dirname( self._prefix )
+		pattern = re.compile( r"^%s\.(-?\d+)\.pdc$" % re.escape( os.path.basename( self._prefix ) ) )
+		self._ticks = []
+		for fileName in os.listdir( directory or "." ):
+			fileMatch = pattern.match( fileName )
+			if fileMatch:
+				self._ticks.append( int( fileMatch.group(1) ) )
+		self._ticks.sort()
+	
+	def times( self ):
+		'''The cached times, in ticks.'''
+		return self._ticks
+	
+	def sample( self, ticks ):
+		'''Returns the sample at ticks, or the latest one before it.'''
+		cached = _cachedTime( self._ticks, ticks )
+		return readPdc( "%s.%d.pdc" % (self._prefix, cached), cached )
+
+def _cachedTime( times, ticks ):
+	i = bisect.bisect_right( times, ticks )
+	if not i:
+		raise nspy.Errors.OutOfBoundsError( "Time %d (ticks) is before the start of the particle cache." % ticks )
+	return times[i - 1]
+
+###########################################################################
+# nCache - an .xml description plus either one .mcc/.mcx file per frame or
+# a single one for the whole cache. The data files are IFF-like: .mcc files
+# use 32-bit FOR4 groups aligned to 4 bytes, .mcx files 64-bit FOR8 groups
+# aligned to 8 bytes, where each tag is followed by 4 bytes of padding and
+# an 8-byte size.
+###########################################################################
+
+_channelTypes = { "DBLA" : ('d', 1),
+				  "DVCA" : ('d', 3),
+				  "FBCA" : ('f', 1),
+				  "FVCA" : ('f', 3) }
+
+class _IffReader:
+	def __init__( self, stream, is64 ):
+		self._stream = stream
+		self._is64 = is64
+		self._align = ( is64 and 8 ) or 4
+	
+	def chunk( self ):
+		'''Reads a chunk header. Returns (tag, size) or (None, 0) at the
+		   end of the file.'''
+		tag = self._stream.read( 4 )
+		if len( tag ) < 4:
+			return (None, 0)
+		if self._is64:
+			self._stream.read( 4 )
+			(size,) = struct.unpack( ">Q", self._stream.read( 8 ) )
+		else:
+			(size,) = struct.unpack( ">I", self._stream.read( 4 ) )
+		return (tag, size)
+	
+	def data( self, size ):
+		data = self._stream.read( size )
+		self.pad( size )
+		return data
+	
+	def array( self, typeCode, count, size ):
+		values = _readArray( self._stream, typeCode, count )
+		self._stream.seek( size - values.itemsize * count, 1 )
+		self.pad( size )
+		return values
+	
+	def skip( self, size ):
+		self._stream.seek( size, 1 )
+		self.pad( size )
+	
+	def pad( self, size ):
+		'''Skip the padding that follows size bytes of data.'''
+		self._stream.seek( (self._align - size % self._align) % self._align, 1 )
+	
+	def seek( self, offset ):
+		self._stream.seek( offset )
+	
+	def tell( self ):
+		return self._stream.tell()
+
+class NCache:
+	'''An nCache written from a particle or nParticle system. path is the
+	   cache's .xml description. Channels are named after the particle
+	   attribute they hold.'''
+	
+	def __init__( self, path ):
+		self._path = path
+		self._directory = os.path.dirname( path )
+		self._baseName = os.path.splitext( os.path.basename( path ) )[0]
+		
+		document = xml.dom.minidom.parse( path )
+		cacheType = document.getElementsByTagName( "cacheType" )[0]
+		self._oneFile = ( cacheType.getAttribute( "Type" ) == "OneFile" )
+		self._format = cacheType.getAttribute( "Format" ) or "mcc"
+		self._ticksPerFrame = int( document.getElementsByTagName( "cacheTimePerFrame" )[0].getAttribute( "TimePerFrame" ) )
+		(start, end) = document.getElementsByTagName( "time" )[0].getAttribute( "Range" ).split( "-" )
+		self._start = int( start )
+		self._end = int( end )
+		
+		# Channel name -> particle attribute name
+		#
+		self._channels = {}
+		for channels in document.getElementsByTagName( "Channels" ):
+			for node in channels.childNodes:
+				if node.nodeType != node.ELEMENT_NODE:
+					continue
+				channelName = node.getAttribute( "ChannelName" )
+				attrName = node.getAttribute( "ChannelInterpretation" ) or channelName.split( "_" )[-1]
+				self._channels[channelName] = attrName
+		document.unlink()
+		
+		# Offsets of each time's block in a single file cache, found the
+		# first time a sample is read.
+		#
+		self._blocks = None
+		self._times = None
+	
+	def times( self ):
+		'''The cached times, in ticks.'''
+		if self._times is None:
+			if self._oneFile:
+				self._indexBlocks()
+				self._times = self._blocks.keys()
+			else:
+				self._times = self._frameFileTimes()
+			self._times.sort()
+		return self._times
+	
+	def sample( self, ticks ):
+		'''Returns the sample at ticks, or the latest one before it.'''
+		cached = _cachedTime( self.times(), ticks )
+		sample = ParticleSample( cached )
+		if self._oneFile:
+			stream = open( self._dataPath( self._baseName ), "rb" )
+			try:
+				stream.seek( self._blocks[cached] )
+				self._readBlock( _IffReader( stream, self._is64() ), sample )
+			finally:
+				stream.close()
+		else:
+			stream = open( self._frameFilePath( cached ), "rb" )
+			try:
+				reader = _IffReader( stream, self._is64() )
+				self._skipHeader( reader )
+				self._readBlock( reader, sample )
+			finally:
+				stream.close()
+		return sample
+	
+	def _is64( self ):
+		return "mcx" == self._format
+	
+	def _dataPath( self, name ):
+		return os.path.join( self._directory, "%s.%s" % (name, self._format) )
+	
+	def _frameFilePath( self, ticks ):
+		frame = ticks / self._ticksPerFrame
+		tick = ticks % self._ticksPerFrame
+		if tick:
+			return self._dataPath( "%sFrame%dTick%d" % (self._baseName, frame, tick) )
+		return self._dataPath( "%sFrame%d" % (self._baseName, frame) )
+	
+	def _frameFileTimes( self ):
+		times = []
+		pattern = re.compile( r"^%sFrame(-?\d+)(?:Tick(\d+))?\.%s$" % (re.escape( self._baseName ), self._format) )
+		for fileName in os.listdir( self._directory or "." ):
+			match = pattern.match( fileName )
+			if match:
+				ticks = int( match.group(1) ) * self._ticksPerFrame
+				if match.group(2):
+					ticks += int( match.group(2) )
+				times.append( ticks )
+		return times
+	
+	def _skipHeader( self, reader ):
+		(tag, size) = reader.chunk()
+		if tag not in ( "FOR4", "FOR8" ):
+			raise nspy.Errors.Error( "%s is not an nCache file." % self._path )
+		reader.skip( size )
+	
+	def _indexBlocks( self ):
+		self._blocks = {}
+		stream = open( self._dataPath( self._baseName ), "rb" )
+		try:
+			reader = _IffReader( stream, self._is64() )
+			self._skipHeader( reader )
+			while True:
+				offset = reader.tell()
+				(tag, size) = reader.chunk()
+				if tag is None:
+					break
+				end = reader.tell() + size
+				reader.data( 4 )
+				(timeTag, timeSize) = reader.chunk()
+				if "TIME" == timeTag:
+					(ticks,) = struct.unpack( ">i", reader.data( timeSize )[:4] )
+					self._blocks[ticks] = offset
+				reader.seek( end )
+				reader.pad( size )
+		finally:
+			stream.close()
+	
+	def _readBlock( self, reader, sample ):
+		(tag, size) = reader.chunk()
+		if tag not in ( "FOR4", "FOR8" ):
+			raise nspy.Errors.Error( "%s is not an nCache file." % self._path )
+		end = reader.tell() + size
+		reader.data( 4 )
+		
+		channelName = None
+		count = 0
+		while reader.tell() < end:
+			(tag, size) = reader.chunk()
+			if "CHNM" == tag:
+				channelName = reader.data( size ).rstrip( "\0" )
+			elif "SIZE" == tag:
+				(count,) = struct.unpack( ">I", reader.data( size )[:4] )
+			elif _channelTypes.has_key( tag ):
+				(typeCode, width) = _channelTypes[tag]
+				values = reader.array( typeCode, count * width, size )
+				if typeCode != 'd':
+					values = array.array( 'd', values.tolist() )
+				attrName = self._channels.get( channelName ) or channelName.split( "_" )[-1]
+				sample.set( attrName, values, width == 3 )
+			else:
+				reader.skip( size )
+
+def openCache( path ):
+	'''Opens a PDC sequence (given one of its .pdc files) or an nCache
+	   (given its .xml file).'''
+	if path.endswith( ".pdc" ):
+		return PdcCache( path )
+	if path.endswith( ".xml" ):
+		return NCache( path )
+	raise nspy.Errors.BadArgumentError( "%s is not a .pdc or nCache .xml file." % path )
@@ -0,0 +1,162 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import array
+import mmap
+import os
+import struct
+
+# NumPy is optional: without it frames are interpolated one value at a
+# time.
+#
+try:
+	import numpy
+except ImportError, e:
+	numpy = None
+
+
+# File layout: a fixed size header followed by numFrames frames of
+# numPoints xyz float32 positions.
+#
+kMagic = "NSPC"
+kVersion = 1
+_headerFormat = "<4siiidd"
+kHeaderSize = struct.calcsize( _headerFormat )
+_pointSize = 3 * array.array( 'f' ).itemsize
+
+class PointCacheWriter:
+	'''Writes a point cache through a memory map of the whole file. The
+	   file is sized up front and frames can be written in any order.'''
+	
+	def __init__( self, path, numPoints, numFrames, startTime, timeStep ):
+		self._numPoints = numPoints
+		self._numFrames = numFrames
+		self._frameSize = numPoints * _pointSize
+		
+		self._file = open( path, "w+b" )
+		self._file.write( struct.pack( _headerFormat, kMagic, kVersion,
+									   numPoints, numFrames, startTime, timeStep ) )
+		size = kHeaderSize + self._frameSize * numFrames
+		if size > kHeaderSize:
+			self._file.seek( size - 1 )
+			self._file.write( "\0" )
+			self._file.flush()
+			self._map = mmap.mmap( self._file.fileno(), size )
+		else:
+			self._map = None
+	
+	def setFrame( self, frame, points ):
+		'''points is a flat sequence of numPoints xyz positions. Missing
+		   trailing points are left at the origin.'''
+		if not 0 <= frame < self._numFrames:
+			raise IndexError( "Frame %d is not in the cache." % frame )
+		values = array.array( 'f', points ).tostring()
+		if len( values ) > self._frameSize:
+			raise ValueError( "Too many points for the cache." )
+		offset = kHeaderSize + frame * self._frameSize
+		self._map[offset:offset + len( values )] = values
+	
+	def close( self ):
+		if self._map is not None:
+			self._map.flush()
+			self._map.close()
+			self._map = None
+		self._file.close()
+
+class PointCache:
+	'''Reads a point cache written by PointCacheWriter. Frames are read
+	   straight from a read-only memory map of the file.'''
+	
+	def __init__( self, path ):
+		self._file = open( path, "rb" )
+		header = self._file.read( kHeaderSize )
+		if len( header ) < kHeaderSize:
+			raise ValueError( "%s is not a point cache." % path )
+		(magic, version, self.numPoints, self.numFrames,
+		 self.startTime, self.timeStep) = struct.unpack( _headerFormat, header )
+		if magic != kMagic or version != kVersion:
+			raise ValueError( "%s is not a point cache." % path )
+		self._frameSize = self.numPoints * _pointSize
+		self._map = None
+		if self.numFrames and self.numPoints:
+			self._map = mmap.mmap( self._file.fileno(), 0, access=mmap.ACCESS_READ )
+	
+	def frame( self, index ):
+		'''The positions of the index'th frame as a flat array('f').'''
+		points = array.array( 'f' )
+		points.fromstring( self._frameString( index ) )
+		return points
+	
+	def _frameString( self, index ):
+		if self._map is None:
+			return ""
+		offset = kHeaderSize + index * self._frameSize
+		return self._map[offset:offset + self._frameSize]
+	
+	def points( self, time ):
+		'''The positions at time (in the units the cache was written in).
+		   Times between frames are linearly interpolated, times outside
+		   the cache are clamped to its first or last frame.'''
+		if not self.numFrames:
+			return array.array( 'f' )
+		position = 0.0
+		if self.timeStep > 0.0:
+			position = (time - self.startTime) / self.timeStep
+		if position <= 0.0:
+			return self.frame( 0 )
+		if position >= self.numFrames - 1:
+			return self.frame( self.numFrames - 1 )
+		
+		index = int( position )
+		weight = position - index
+		if weight < 1e-6:
+			return self.frame( index )
+		if numpy is not None and self._map is not None:
+			before = numpy.frombuffer( self._frameString( index ), dtype=numpy.float32 )
+			after = numpy.frombuffer( self._frameString( index + 1 ), dtype=numpy.float32 )
+		else:
+			before = self.frame( index )
+			after = self.frame( index + 1 )
+		return blend( before, after, weight )
+	
+	def close( self ):
+		if self._map is not None:
+			self._map.close()
+			self._map = None
+		self._file.close()
+
+def blend( before, after, weight ):
+	'''before + (after - before) * weight for two flat sequences of the
+	   same length, as an array('f'). The arithmetic is done in double
+	   precision either way so NumPy gives the same values as the loop.'''
+	if numpy is not None and len( before ):
+		b = numpy.asarray( before, dtype=numpy.float64 )
+		a = numpy.asarray( after, dtype=numpy.float64 )
+		result = (b + (a - b) * weight).astype( numpy.float32 )
+		# tostring() is deprecated in newer NumPy releases.
+		#
+		toBytes = getattr( result, "tobytes", None ) or result.tostring
+		return array.array( 'f', toBytes() )
+	result = array.array( 'f', before )
+	for i in range( len( result ) ):
+		result[i] += (after[i] - result[i]) * weight
+	return result
@@ -0,0 +1,209 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import os
+import subprocess
+import sys
+
+import ns.py as nspy
+import ns.py.CaptureStore
+import ns.py.Errors
+import ns.py.MayaAscii
+
+
+# The workers' -outputFile streams keys to the file, which key
+# reduction needs buffered.
+#
+_unsupportedFlags = [ "-keyTolerance", "-ktl" ]
+
+def workerScript():
+	'''The mayapy script that bakes a shard (ns/maya/uninstancer/ShardWorker.py).'''
+	return os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ),
+						 "maya", "uninstancer", "ShardWorker.py" )
+
+class ShardDriver:
+	'''Splits a bake between numShards local worker processes by particle
+	   ID and merges their Maya ASCII outputs into one file. Every worker
+	   opens the scene, simulates the whole particle system and bakes
+	   only the particles whose ID modulo numShards is its shard index.
+	   The workers write a hash of every frame's particles and the bake
+	   fails if any worker's simulation differs from the first one's.
+	   
+	   workerCommand is the command line that starts a worker, by default
+	   mayapy (or $MAYAPY) running ShardWorker.py. The driver appends
+	   
+	     --scene <scene> --plugin <plugin> --shard <index> <count>
+	     --output <shard .ma> --hashFile <shard hashes> --flags <flags>
+	     <targets...>
+	   
+	   and expects the worker to write both files and exit with 0. Any
+	   program that does that can stand in for a real worker.
+	   
+	   Workers bake to Maya ASCII with -outputFile, which streams keys to
+	   the file, so flags can't include -keyTolerance (or the options
+	   that go with it) and sharded bakes aren't key reduced.'''
+	
+	def __init__( self, numShards, workerCommand=None ):
+		if numShards < 1:
+			raise nspy.Errors.BadArgumentError( "At least one shard is needed." )
+		self._numShards = numShards
+		self._workerCommand = workerCommand or [ os.environ.get( "MAYAPY", "mayapy" ), workerScript() ]
+	
+	def run( self, scene, plugin, targets, flags, outputPath ):
+		'''Bake targets (the nsUninstancer command's objects) in scene with
+		   the nsUninstancer flags given as a string. plugin is the path to
+		   NimbleTools.py. The merged bake is written to outputPath, which
+		   is returned.'''
+		if set( flags.split() ) & set( _unsupportedFlags ):
+			raise nspy.Errors.BadArgumentError( "-keyTolerance can not be used with a sharded bake." )
+		base = os.path.splitext( outputPath )[0]
+		shardPaths = [ "%s.shard%d.ma" % (base, i) for i in range( self._numShards ) ]
+		hashPaths = [ "%s.shard%d.hash" % (base, i) for i in range( self._numShards ) ]
+		
+		try:
+			processes = []
+			for i in range( self._numShards ):
+				command = self._workerCommand + [ "--scene", scene,
+												  "--plugin", plugin,
+												  "--shard", str( i ), str( self._numShards ),
+												  "--output", shardPaths[i],
+												  "--hashFile", hashPaths[i],
+												  "--flags", flags ] + list( targets )
+				processes.append( subprocess.Popen( command ) )
+			
+			failed = []
+			for i in range( self._numShards ):
+				if processes[i].wait():
+					failed.append( i )
+			if failed:
+				raise nspy.Errors.Error( "Shards %s failed to bake." % ", ".join( [ str( i ) for i in failed ] ) )
+			
+			self._checkHashes( hashPaths )
+			nspy.MayaAscii.concatenate( shardPaths, outputPath )
+		finally:
+			for path in shardPaths + hashPaths:
+				if os.path.exists( path ):
+					os.remove( path )
+		return outputPath
+	
+	def _checkHashes( self, hashPaths ):
+		'''Every shard simulates every particle so their hashes have to
+		   match frame for frame.'''
+		expected = _readHashes( hashPaths[0] )
+		for i in range( 1, len( hashPaths ) ):
+			hashes = _readHashes( hashPaths[i] )
+			for j in range( min( len( expected ), len( hashes ) ) ):
+				if hashes[j] != expected[j]:
+					raise nspy.Errors.Error( "Shard %d's simulation differs from shard 0's at frame %s." % (i, hashes[j][0]) )
+			if len( hashes ) != len( expected ):
+				raise nspy.Errors.Error( "Shard %d baked %d frames but shard 0 baked %d." % (i, len( hashes ), len( expected )) )
+
+class CaptureDriver:
+	'''Captures a frame range of a particle disk cache (PDC or nCache) in
+	   parallel: the range is split into numChunks consecutive parts,
+	   each captured (-captureOnly) by its own local worker process, and
+	   the parts' captures are joined into one capture of the whole
+	   range.
+	   
+	   This only speeds up reading the disk cache and composing the
+	   instance matrices. The bake itself, which creates the nodes and
+	   keys them, replays the joined capture (-replayFile) in a single
+	   process, and so it doesn't get any faster with more chunks. Split
+	   that by particle with a ShardDriver instead. Scenes without a disk
+	   cache can't be captured in parallel: every worker would have to
+	   run the simulation up from the start of the scene.
+	   
+	   workerCommand is as for ShardDriver. The driver appends
+	   
+	     --scene <scene> --plugin <plugin> --flags <flags> <targets...>
+	   
+	   with -particleCache, -startFrame, -endFrame, -frameStep,
+	   -captureFile and -captureOnly added to the flags.'''
+	
+	def __init__( self, numChunks, workerCommand=None ):
+		if numChunks < 1:
+			raise nspy.Errors.BadArgumentError( "At least one chunk is needed." )
+		self._numChunks = numChunks
+		self._workerCommand = workerCommand or [ os.environ.get( "MAYAPY", "mayapy" ), workerScript() ]
+	
+	def run( self, scene, plugin, targets, flags, particleCache, startFrame, endFrame, frameStep, capturePath ):
+		'''Capture targets in scene from startFrame to endFrame, reading
+		   the particles from particleCache (as for -particleCache), and
+		   write the joined capture to capturePath, which is returned.'''
+		if not particleCache:
+			raise nspy.Errors.BadArgumentError( "Parallel captures need a particle disk cache to read the particles from." )
+		chunks = chunkRanges( startFrame, endFrame, frameStep, self._numChunks )
+		base = os.path.splitext( capturePath )[0]
+		chunkPaths = [ "%s.chunk%d.nscs" % (base, i) for i in range( len( chunks ) ) ]
+		
+		try:
+			processes = []
+			for i in range( len( chunks ) ):
+				(first, last) = chunks[i]
+				chunkFlags = "%s -particleCache %s -startFrame %d -endFrame %d -frameStep %d -captureFile %s -captureOnly true" % \
+							 (flags, nspy.MayaAscii.quote( particleCache ),
+							  first, last, frameStep,
+							  nspy.MayaAscii.quote( chunkPaths[i] ))
+				command = self._workerCommand + [ "--scene", scene,
+												  "--plugin", plugin,
+												  "--flags", chunkFlags ] + list( targets )
+				processes.append( subprocess.Popen( command ) )
+			
+			failed = []
+			for i in range( len( chunks ) ):
+				if processes[i].wait():
+					failed.append( "%d-%d" % chunks[i] )
+			if failed:
+				raise nspy.Errors.Error( "Chunks %s failed to capture." % ", ".join( failed ) )
+			
+			nspy.CaptureStore.concatenate( chunkPaths, capturePath )
+		finally:
+			for path in chunkPaths:
+				if os.path.exists( path ):
+					os.remove( path )
+		return capturePath
+
+def chunkRanges( startFrame, endFrame, frameStep, numChunks ):
+	'''Split the frames from startFrame to endFrame, every frameStep
+	   frames, into at most numChunks consecutive (first, last) ranges
+	   of nearly the same number of frames.'''
+	if endFrame < startFrame:
+		raise nspy.Errors.BadArgumentError( "The end frame is before the start frame." )
+	if frameStep < 1:
+		raise nspy.Errors.BadArgumentError( "The frame step must be at least 1." )
+	numFrames = (endFrame - startFrame) / frameStep + 1
+	numChunks = min( numChunks, numFrames )
+	chunks = []
+	first = 0
+	for i in range( numChunks ):
+		count = numFrames / numChunks + (i < numFrames % numChunks)
+		chunks.append( (startFrame + first * frameStep, startFrame + (first + count - 1) * frameStep) )
+		first += count
+	return chunks
+
+def _readHashes( path ):
+	'''Returns the (frame, hash) pairs in a worker's hash file.'''
+	stream = open( path, "r" )
+	try:
+		return [ tuple( line.split() ) for line in stream if line.strip() ]
+	finally:
+		stream.close()
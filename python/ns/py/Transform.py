@@ -0,0 +1,153 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+import array
+import struct
+
+# NumPy is optional: without it decompose() is not available and callers
+# decompose with MTransformationMatrix instead.
+#
+try:
+	import numpy
+except ImportError, e:
+	numpy = None
+
+# ctypes lets matrixArrayValues() copy each MMatrix's values in one call.
+#
+try:
+	import ctypes
+except ImportError, e:
+	ctypes = None
+
+
+# Maya's rotate orders, in rotateOrder attribute and MEulerRotation order,
+# as the axes in the order they are applied.
+#
+kRotateOrderAxes = ( (0, 1, 2),		# xyz
+					 (1, 2, 0),		# yzx
+					 (2, 0, 1),		# zxy
+					 (0, 2, 1),		# xzy
+					 (1, 0, 2),		# yxz
+					 (2, 1, 0) )	# zyx
+
+# Matrices whose rows are further than this from orthogonal are treated
+# as sheared.
+#
+kTolerance = 1.0e-6
+
+# Size of an MMatrix's values, its public double matrix[4][4].
+#
+kMatrixSize = struct.calcsize( "16d" )
+
+# Whether matrices can be copied straight from memory. None until it has
+# been checked against MMatrix's own accessors on the first matrix seen.
+# If the check fails the values are read one at a time for the rest of
+# the session.
+#
+_copyMatrices = None
+
+def matrixValues( matrix ):
+	'''An MMatrix's 16 values, row by row.'''
+	return [ matrix( row, column ) for row in range( 4 ) for column in range( 4 ) ]
+
+def matrixArrayValues( matrices ):
+	'''The values of every matrix in an MMatrixArray, row by row, as one
+	   flat array('d').'''
+	global _copyMatrices
+	numMatrices = matrices.length()
+	values = array.array( 'd' )
+	if _copyMatrices is None and numMatrices:
+		_copyMatrices = _canCopyMatrix( matrices[0] )
+	if _copyMatrices:
+		stringAt = ctypes.string_at
+		chunks = []
+		for i in range( numMatrices ):
+			# Hold on to the matrix while its memory is read.
+			#
+			matrix = matrices[i]
+			chunks.append( stringAt( long( matrix.this ), kMatrixSize ) )
+		values.fromstring( "".join( chunks ) )
+		return values
+	for i in range( numMatrices ):
+		values.extend( matrixValues( matrices[i] ) )
+	return values
+
+def setMatrixCopyEnabled( enabled ):
+	'''Force matrixArrayValues() to copy matrices from memory or not, or
+	   with None to check again on its next call.'''
+	global _copyMatrices
+	_copyMatrices = enabled
+
+def _canCopyMatrix( matrix ):
+	if ctypes is None:
+		return False
+	try:
+		values = array.array( 'd' )
+		values.fromstring( ctypes.string_at( long( matrix.this ), kMatrixSize ) )
+	except Exception, e:
+		return False
+	return values.tolist() == matrixValues( matrix )
+
+def decompose( matrices, rotateOrders ):
+	'''Decompose row-major 4x4 matrices (an (n, 4, 4) array in Maya's row
+	   vector convention) into an (n, 9) array of tx, ty, tz, rx, ry, rz,
+	   sx, sy, sz. Rotations are in radians, in each matrix's rotate order
+	   (n Maya rotate orders).
+	   
+	   Only scale, rotation and translation are handled. Also returns an
+	   array of n flags which are False for the matrices that are sheared,
+	   have a negative or zero scale or are at gimbal lock. Their values
+	   are not set and they should be decomposed by MTransformationMatrix
+	   instead.'''
+	matrices = numpy.asarray( matrices, dtype=numpy.float64 ).reshape( (-1, 4, 4) )
+	rotateOrders = numpy.asarray( rotateOrders, dtype=numpy.int32 )
+	result = numpy.zeros( (len( matrices ), 9) )
+	result[:, 0:3] = matrices[:, 3, 0:3]
+	
+	# Without shear each row of the upper 3x3 is a rotation row scaled
+	# by that axis's scale.
+	#
+	rows = matrices[:, 0:3, 0:3]
+	scales = numpy.sqrt( (rows * rows).sum( axis=2 ) )
+	result[:, 6:9] = scales
+	valid = (scales > kTolerance).all( axis=1 )
+	rotations = rows / numpy.where( scales > kTolerance, scales, 1.0 )[:, :, numpy.newaxis]
+	products = numpy.matmul( rotations, rotations.transpose( (0, 2, 1) ) )
+	valid &= (numpy.abs( products - numpy.identity( 3 ) ) < kTolerance).all( axis=(1, 2) )
+	valid &= numpy.linalg.det( rotations ) > 0.0
+	
+	for order in numpy.unique( rotateOrders ):
+		# Permuting the axes into their rotate order leaves an xyz
+		# rotation, of the negated angles if the permutation is odd.
+		#
+		axes = kRotateOrderAxes[order]
+		sign = 1.0
+		if order > 2:
+			sign = -1.0
+		selected = numpy.nonzero( rotateOrders == order )[0]
+		r = rotations[selected][:, axes][:, :, axes]
+		cosMiddle = numpy.hypot( r[:, 0, 0], r[:, 0, 1] )
+		valid[selected] &= cosMiddle > kTolerance
+		result[selected, 3 + axes[0]] = sign * numpy.arctan2( r[:, 1, 2], r[:, 2, 2] )
+		result[selected, 3 + axes[1]] = sign * numpy.arctan2( -r[:, 0, 2], cosMiddle )
+		result[selected, 3 + axes[2]] = sign * numpy.arctan2( r[:, 0, 1], r[:, 0, 0] )
+	
+	return (result, valid)
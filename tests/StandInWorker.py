@@ -0,0 +1,119 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+#
+# Stands in for ShardWorker.py in the ShardDriver and CaptureDriver tests.
+# Instead of baking a scene it makes up a deterministic particle system:
+# particle i is born on frame i / 2 + 1 and dies on frame i + 10.
+#
+#   --flags with -captureFile writes a capture of -startFrame to
+#   -endFrame every -frameStep frames, like -captureOnly.
+#   --shard i n writes a Maya ASCII file with a node per particle of the
+#   shard to --output and the frame hashes to --hashFile. If
+#   STAND_IN_DIVERGE is set to i, shard i's hash of frame 3 differs.
+#
+
+import hashlib
+import optparse
+import os
+import shlex
+import sys
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "python" ) )
+
+import ns.py.CaptureStore
+import ns.py.MayaAscii
+
+kNumParticles = 40
+kNumHashedFrames = 5
+
+def particles( frame ):
+	'''The ids of the particles alive at frame.'''
+	return [ i for i in range( kNumParticles ) if i / 2 + 1 <= frame < i + 10 ]
+
+def matrix( particleId, frame ):
+	return [ 1.0, 0.0, 0.0, 0.0,
+			 0.0, 1.0, 0.0, 0.0,
+			 0.0, 0.0, 1.0, 0.0,
+			 float( particleId ), float( frame ), float( particleId * frame ), 1.0 ]
+
+def flagValue( flags, name ):
+	return flags[flags.index( name ) + 1]
+
+def capture( flags ):
+	startFrame = int( flagValue( flags, "-startFrame" ) )
+	endFrame = int( flagValue( flags, "-endFrame" ) )
+	frameStep = int( flagValue( flags, "-frameStep" ) )
+	writer = ns.py.CaptureStore.CaptureWriter( flagValue( flags, "-captureFile" ) )
+	try:
+		for frame in range( startFrame, endFrame + 1, frameStep ):
+			ids = particles( frame )
+			matrices = []
+			for particleId in ids:
+				matrices.extend( matrix( particleId, frame ) )
+			writer.addFrame( float( frame ), ids, [ 0 ] * len( ids ), matrices )
+	finally:
+		writer.close()
+
+def bakeShard( index, count, outputPath, hashPath ):
+	stream = open( outputPath, "w" )
+	try:
+		writer = ns.py.MayaAscii.Writer( stream )
+		writer.header( outputPath )
+		writer.comment( "shard %d of %d" % (index, count) )
+		for particleId in range( index, kNumParticles, count ):
+			writer.createNode( "transform", "particle_s%d_%d" % (index, particleId) )
+		writer.end( outputPath )
+	finally:
+		stream.close()
+	
+	stream = open( hashPath, "w" )
+	try:
+		for frame in range( 1, kNumHashedFrames + 1 ):
+			digest = hashlib.md5( " ".join( [ str( i ) for i in particles( frame ) ] ) )
+			if frame == 3 and os.environ.get( "STAND_IN_DIVERGE" ) == str( index ):
+				digest.update( "diverged" )
+			stream.write( "%d %s\n" % (frame, digest.hexdigest()) )
+	finally:
+		stream.close()
+
+def main( argv ):
+	parser = optparse.OptionParser()
+	parser.add_option( "--scene" )
+	parser.add_option( "--plugin" )
+	parser.add_option( "--shard", nargs=2, type="int" )
+	parser.add_option( "--output" )
+	parser.add_option( "--hashFile" )
+	parser.add_option( "--flags", default="" )
+	(options, targets) = parser.parse_args( argv )
+	
+	flags = shlex.split( options.flags )
+	if "-fail" in flags:
+		return 1
+	if "-captureFile" in flags:
+		capture( flags )
+	if options.shard:
+		bakeShard( options.shard[0], options.shard[1], options.output, options.hashFile )
+	return 0
+
+if __name__ == "__main__":
+	sys.exit( main( sys.argv[1:] ) )
@@ -0,0 +1,78 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "python" ) )
+
+import ns.py.CaptureStore
+
+def identity( count ):
+	return [ 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0 ] * count
+
+class CaptureStoreTest( unittest.TestCase ):
+	
+	def setUp( self ):
+		self.directory = tempfile.mkdtemp()
+	
+	def tearDown( self ):
+		shutil.rmtree( self.directory )
+	
+	def _capture( self, name, frames ):
+		path = os.path.join( self.directory, name )
+		writer = ns.py.CaptureStore.CaptureWriter( path )
+		for (time, ids) in frames:
+			writer.addFrame( time, ids, [ 0 ] * len( ids ), identity( len( ids ) ) )
+		writer.close()
+		return path
+	
+	def _ids( self, path ):
+		store = ns.py.CaptureStore.CaptureStore( path )
+		try:
+			return [ (store.frame( i ).time, list( store.frame( i ).ids )) for i in range( store.numFrames() ) ]
+		finally:
+			store.close()
+	
+	def testFrameAt( self ):
+		store = ns.py.CaptureStore.CaptureStore( self._capture( "a.nscs", [ (1.0, [ 3 ]), (3.0, [ 3, 4 ]) ] ) )
+		try:
+			self.assertEqual( store.frameAt( 0.0 ), None )
+			self.assertEqual( list( store.frameAt( 2.0 ).ids ), [ 3 ] )
+			self.assertEqual( list( store.frameAt( 3.0 ).ids ), [ 3, 4 ] )
+			self.assertEqual( list( store.frameAt( 9.0 ).matrices ), identity( 2 ) )
+		finally:
+			store.close()
+	
+	def testConcatenateSkipsOverlappingFrames( self ):
+		first = self._capture( "a.nscs", [ (1.0, [ 3 ]), (2.0, [ 3, 4 ]) ] )
+		second = self._capture( "b.nscs", [ (2.0, [ 9 ]), (3.0, [ 4 ]) ] )
+		empty = self._capture( "c.nscs", [] )
+		joined = os.path.join( self.directory, "joined.nscs" )
+		ns.py.CaptureStore.concatenate( [ first, empty, second ], joined )
+		self.assertEqual( self._ids( joined ), [ (1.0, [ 3 ]), (2.0, [ 3, 4 ]), (3.0, [ 4 ]) ] )
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,96 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "python" ) )
+
+import ns.py.CaptureStore
+import ns.py.Checkpoint
+
+class CheckpointTest( unittest.TestCase ):
+	
+	def setUp( self ):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join( self.directory, "bake.ckpt" )
+	
+	def tearDown( self ):
+		shutil.rmtree( self.directory )
+	
+	def testRoundTrip( self ):
+		self.assertEqual( ns.py.Checkpoint.read( self.path ), None )
+		ns.py.Checkpoint.write( self.path, ns.py.Checkpoint.Checkpoint( 12, 5, "bake.nscs", "bake.12.state" ) )
+		ns.py.Checkpoint.write( self.path, ns.py.Checkpoint.Checkpoint( 22, 15, "bake.nscs" ) )
+		checkpoint = ns.py.Checkpoint.read( self.path )
+		self.assertEqual( (checkpoint.frame, checkpoint.numFrames, checkpoint.capturePath, checkpoint.statePath),
+						  (22, 15, "bake.nscs", None) )
+		self.assertFalse( os.path.exists( self.path + ".tmp" ) )
+	
+	def testInterruptedReplaceFallsBackToTemporaryFile( self ):
+		ns.py.Checkpoint.write( self.path, ns.py.Checkpoint.Checkpoint( 12, 5, "bake.nscs" ) )
+		os.rename( self.path, self.path + ".tmp" )
+		self.assertEqual( ns.py.Checkpoint.read( self.path ).frame, 12 )
+	
+	def testTruncatedTemporaryFileIsIgnored( self ):
+		ns.py.Checkpoint.write( self.path, ns.py.Checkpoint.Checkpoint( 12, 5, "bake.nscs" ) )
+		data = open( self.path, "rb" ).read()
+		os.remove( self.path )
+		open( self.path + ".tmp", "wb" ).write( data[:-3] )
+		self.assertEqual( ns.py.Checkpoint.read( self.path ), None )
+	
+	def testRemove( self ):
+		statePath = os.path.join( self.directory, "bake.12.state" )
+		open( statePath, "wb" ).close()
+		ns.py.Checkpoint.write( self.path, ns.py.Checkpoint.Checkpoint( 12, 5, "bake.nscs", statePath ) )
+		ns.py.Checkpoint.remove( self.path )
+		self.assertEqual( os.listdir( self.directory ), [] )
+	
+	def testCaptureResumesFromLastSync( self ):
+		path = os.path.join( self.directory, "bake.nscs" )
+		matrix = [ 0.0 ] * 16
+		writer = ns.py.CaptureStore.CaptureWriter( path )
+		writer.addFrame( 1.0, [ 1 ], [ 0 ], matrix )
+		writer.sync()
+		writer.addFrame( 2.0, [ 2 ], [ 0 ], matrix )
+		writer.sync()
+		# Never synced, as if the bake died.
+		#
+		writer.addFrame( 3.0, [ 3 ], [ 0 ], matrix )
+		writer._file.flush()
+		
+		resumed = ns.py.CaptureStore.CaptureWriter( path, 1 )
+		resumed.addFrame( 2.5, [ 7 ], [ 0 ], matrix )
+		resumed.close()
+		store = ns.py.CaptureStore.CaptureStore( path )
+		try:
+			self.assertEqual( store.times(), [ 1.0, 2.5 ] )
+			self.assertEqual( list( store.frame( 1 ).ids ), [ 7 ] )
+		finally:
+			store.close()
+		writer._file.close()
+
+if __name__ == "__main__":
+	unittest.main()
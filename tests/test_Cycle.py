@@ -0,0 +1,88 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import array
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "python" ) )
+
+import ns.py.Cycle
+
+def _perParticle( ageData, cycleStartData, step, numInstances ):
+	'''The per-particle loop Instancer used before the indices were
+	   computed in one pass.'''
+	objectIndices = []
+	for i in range( len( ageData ) ):
+		index = int( round( ageData[i] / step, 3 ) )
+		index = (cycleStartData[i] + index) % numInstances
+		objectIndices.append( index )
+	return objectIndices
+
+class SequentialObjectIndicesTest( unittest.TestCase ):
+	
+	def setUp( self ):
+		generator = random.Random( 3 )
+		self.step = 1.0 / 24.0
+		self.ages = array.array( 'd', [ generator.uniform( 0.0, 10.0 ) for i in range( 500 ) ] )
+		# Ages on and either side of the 3 decimal place rounding
+		# boundary.
+		#
+		for cycles in range( 1, 50 ):
+			for offset in ( -0.0005001, -0.0005, -0.0004999, 0.0 ):
+				self.ages.append( (cycles + offset) * self.step )
+		self.ages.append( 0.0 )
+		self.cycleStarts = [ generator.randint( 0, 7 ) for age in self.ages ]
+	
+	def check( self ):
+		numParticles = len( self.ages )
+		self.assertEqual( ns.py.Cycle.sequentialObjectIndices( self.ages, None, self.step, 5, numParticles ),
+						  _perParticle( self.ages, [0] * numParticles, self.step, 5 ) )
+		self.assertEqual( ns.py.Cycle.sequentialObjectIndices( self.ages, self.cycleStarts, self.step, 5, numParticles ),
+						  _perParticle( self.ages, self.cycleStarts, self.step, 5 ) )
+	
+	def testMatchesPerParticle( self ):
+		self.check()
+	
+	def testMatchesPerParticleWithoutNumpy( self ):
+		numpy = ns.py.Cycle.numpy
+		ns.py.Cycle.numpy = None
+		try:
+			self.check()
+		finally:
+			ns.py.Cycle.numpy = numpy
+	
+	@unittest.skipIf( ns.py.Cycle.numpy is None, "needs numpy" )
+	def testNumpyArrays( self ):
+		numpy = ns.py.Cycle.numpy
+		numParticles = len( self.ages )
+		self.assertEqual( ns.py.Cycle.sequentialObjectIndices( numpy.array( self.ages ), numpy.array( self.cycleStarts ),
+															   self.step, 5, numParticles ),
+						  _perParticle( self.ages, self.cycleStarts, self.step, 5 ) )
+	
+	def testEmpty( self ):
+		self.assertEqual( ns.py.Cycle.sequentialObjectIndices( [], None, self.step, 5, 0 ), [] )
+
+if __name__ == "__main__":
+	unittest.main()
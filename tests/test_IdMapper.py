@@ -0,0 +1,88 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+#
+# Checks IdMapper's ID to index table as particles are born and die.
+# Needs Maya: run with mayapy. Skipped under plain Python.
+#
+
+import os
+import sys
+import unittest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "python" ) )
+
+try:
+	import maya.standalone
+except ImportError, e:
+	maya = None
+
+
+# The particle ID at each index on successive frames. As in Maya, born
+# particles are appended and dead ones removed.
+#
+kFrames = [ [ 0, 1, 2, 3 ],
+			[ 0, 1, 2, 3, 4, 5 ],		# born
+			[ 0, 1, 2, 3, 4, 5 ],		# nothing changed
+			[ 0, 2, 3, 5, 6 ],			# died and born
+			[ 0, 2, 3, 5, 6, 7, 8 ],	# born
+			[ 0, 2, 3, 5, 6, 7, 8, 10 ],	# 9 was born and died in between
+			[],							# all died
+			[ 11, 12 ] ]
+
+@unittest.skipIf( maya is None, "needs mayapy" )
+class IdMapperTest( unittest.TestCase ):
+	
+	@classmethod
+	def setUpClass( cls ):
+		maya.standalone.initialize( name="python" )
+	
+	def testTableFollowsBirthsAndDeaths( self ):
+		import ns.maya.ParticleUtil
+		import ns.py.Const
+		mapper = ns.maya.ParticleUtil.IdMapper()
+		events = ns.maya.ParticleUtil.IdEvents()
+		allIds = range( 14 )
+		for ids in kFrames:
+			mapper.fromIds( ids )
+			expected = [ ids.index( particleId ) if particleId in ids else ns.py.Const.kInvalidIndex
+						 for particleId in allIds ]
+			# Before update() the binary search is used.
+			#
+			self.assertEqual( mapper.idsToIndices( allIds ), expected )
+			events.update( mapper.sortedIds() )
+			mapper.update( events.born, events.died )
+			self.assertEqual( mapper.idsToIndices( allIds ), expected )
+			self.assertEqual( [ mapper.idToIndex( particleId ) for particleId in allIds ], expected )
+	
+	def testOutOfOrderBirthsRebuild( self ):
+		import ns.maya.ParticleUtil
+		mapper = ns.maya.ParticleUtil.IdMapper()
+		mapper.fromIds( [ 0, 1 ] )
+		mapper.update( [ 0, 1 ], [] )
+		# Not appended: the existing particles moved.
+		#
+		mapper.fromIds( [ 2, 0, 1 ] )
+		mapper.update( [ 2 ], [] )
+		self.assertEqual( mapper.idsToIndices( [ 0, 1, 2 ] ), [ 1, 2, 0 ] )
+
+if __name__ == "__main__":
+	unittest.main()
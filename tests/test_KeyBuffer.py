@@ -0,0 +1,115 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+#
+# Checks that reduced keys with fitted tangents still follow the
+# unreduced animation. Needs Maya: run with mayapy. Skipped under plain
+# Python.
+#
+
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "python" ) )
+
+try:
+	import maya.standalone
+except ImportError, e:
+	maya = None
+
+
+# In eChannel order.
+#
+kAttributes = [ "translateX", "translateY", "translateZ",
+				"rotateX", "rotateY", "rotateZ",
+				"scaleX", "scaleY", "scaleZ" ]
+kNumFrames = 96
+
+@unittest.skipIf( maya is None, "needs mayapy" )
+class FitTangentsTest( unittest.TestCase ):
+	
+	@classmethod
+	def setUpClass( cls ):
+		maya.standalone.initialize( name="python" )
+	
+	def tearDown( self ):
+		import maya.cmds as mc
+		mc.currentUnit( linear="cm", angle="deg" )
+	
+	def _curves( self ):
+		'''A transform with a new anim curve on each transform channel and
+		   on its visibility.'''
+		import maya.cmds as mc
+		from maya.OpenMaya import MSelectionList, MObject, MFnDependencyNode
+		from maya.OpenMayaAnim import MFnAnimCurve
+		mc.file( new=True, force=True )
+		transform = mc.createNode( "transform" )
+		selection = MSelectionList()
+		selection.add( transform )
+		oTransform = MObject()
+		selection.getDependNode( 0, oTransform )
+		fTransform = MFnDependencyNode( oTransform )
+		fAnims = []
+		for attribute in kAttributes + [ "visibility" ]:
+			fAnim = MFnAnimCurve()
+			fAnim.create( fTransform.findPlug( attribute ) )
+			fAnims.append( fAnim )
+		return fAnims
+	
+	def check( self, channel, tolerance, linearUnit="cm" ):
+		'''Bake a sine wave (in internal units) on channel, reduced with
+		   fitted tangents, and check the curve passes within tolerance of
+		   every sample.'''
+		import maya.cmds as mc
+		from maya.OpenMaya import MTime
+		import ns.maya.uninstancer.KeyBuffer as KeyBuffer
+		
+		fAnims = self._curves()
+		# A new scene resets the units, so set them afterwards.
+		#
+		mc.currentUnit( linear=linearUnit )
+		reduction = KeyBuffer.KeyReduction( tolerance, tolerance, tolerance, fitTangents=True )
+		buffer = KeyBuffer.KeyBuffer( 0, reduction )
+		samples = []
+		for frame in range( 1, kNumFrames + 1 ):
+			value = math.sin( frame * 2.0 * math.pi / 48.0 )
+			values = [ 0.0 ] * 6 + [ 1.0 ] * 3
+			values[channel] = value
+			buffer.add( frame, values )
+			samples.append( (frame, value) )
+		buffer.flush( fAnims[:-1], fAnims[-1] )
+		
+		fAnim = fAnims[channel]
+		self.assertTrue( 2 < fAnim.numKeys() < kNumFrames )
+		for (frame, value) in samples:
+			self.assertAlmostEqual( fAnim.evaluate( MTime( frame, MTime.uiUnit() ) ), value,
+									delta=tolerance )
+	
+	def testRotate( self ):
+		self.check( kAttributes.index( "rotateX" ), 0.01 )
+	
+	def testTranslateInMeters( self ):
+		self.check( kAttributes.index( "translateY" ), 0.01, "m" )
+
+if __name__ == "__main__":
+	unittest.main()
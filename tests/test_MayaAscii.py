@@ -0,0 +1,149 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "python" ) )
+
+import ns.py.MayaAscii
+
+class WriterTest( unittest.TestCase ):
+	
+	def setUp( self ):
+		self.stream = StringIO.StringIO()
+		self.writer = ns.py.MayaAscii.Writer( self.stream )
+	
+	def lines( self ):
+		return self.stream.getvalue().splitlines()
+	
+	def testFormatValue( self ):
+		self.assertEqual( ns.py.MayaAscii.formatValue( 1.5 ), "1.5" )
+		self.assertEqual( ns.py.MayaAscii.formatValue( 2.0 ), "2" )
+		self.assertEqual( ns.py.MayaAscii.formatValue( -0.0 ), "0" )
+		self.assertEqual( ns.py.MayaAscii.formatValue( 3 ), "3" )
+		self.assertEqual( ns.py.MayaAscii.formatValue( True ), "yes" )
+		self.assertEqual( ns.py.MayaAscii.quote( 'a"b\\c' ), '"a\\"b\\\\c"' )
+	
+	def testSelectOnlyWhenNeeded( self ):
+		self.writer.createNode( "transform", "a" )
+		self.writer.select( "a" )
+		self.writer.select( "b" )
+		self.writer.command( "parent -w \"b\"" )
+		self.writer.select( "b" )
+		self.assertEqual( self.lines(), [ 'createNode transform -n "a";',
+										  'select -ne "b";',
+										  'parent -w "b";',
+										  'select -ne "b";' ] )
+	
+	def testKeysAreSplitIntoStatements( self ):
+		numKeys = ns.py.MayaAscii.kKeysPerStatement + 5
+		times = range( numKeys )
+		self.writer.keys( "curve", 10, times, [ 0.5 ] * numKeys, ns.py.MayaAscii.eTangent.step )
+		lines = self.lines()
+		self.assertEqual( lines[0], 'select -ne "curve";' )
+		last = 10 + ns.py.MayaAscii.kKeysPerStatement - 1
+		self.assertTrue( lines[1].startswith( 'setAttr ".ktv[10:%d]" 0 0.5 1 0.5 ' % last ) )
+		self.assertEqual( lines[2], 'setAttr ".kot[10:%d]" %s;' % (last, " ".join( [ "5" ] * ns.py.MayaAscii.kKeysPerStatement )) )
+		self.assertEqual( lines[3], 'setAttr ".ktv[%d:%d]" 100 0.5 101 0.5 102 0.5 103 0.5 104 0.5;' % (last + 1, last + 5) )
+		self.assertEqual( len( lines ), 5 )
+
+class KeyStreamTest( unittest.TestCase ):
+	
+	def setUp( self ):
+		self.stream = StringIO.StringIO()
+		self.keys = ns.py.MayaAscii.KeyStream( ns.py.MayaAscii.Writer( self.stream ), 3 )
+	
+	def lines( self ):
+		return self.stream.getvalue().splitlines()
+	
+	def testChunks( self ):
+		self.keys.addCurve( "a" )
+		self.keys.addCurve( "b" )
+		self.keys.addSamples( [ (frame, [ ("a", frame * 2), ("b", -frame) ]) for frame in range( 1, 8 ) ] )
+		# Each curve is written as soon as 3 keys are waiting, with
+		# indices carrying on from the keys written before.
+		#
+		self.assertEqual( self.lines(), [ 'select -ne "a";',
+										  'setAttr ".ktv[0:2]" 1 2 2 4 3 6;',
+										  'select -ne "b";',
+										  'setAttr ".ktv[0:2]" 1 -1 2 -2 3 -3;',
+										  'select -ne "a";',
+										  'setAttr ".ktv[3:5]" 4 8 5 10 6 12;',
+										  'select -ne "b";',
+										  'setAttr ".ktv[3:5]" 4 -4 5 -5 6 -6;' ] )
+		self.assertEqual( self.keys.numKeys( "a" ), 7 )
+		self.keys.finishCurve( "a" )
+		self.assertEqual( self.lines()[-2:], [ 'select -ne "a";', 'setAttr ".ktv[6:6]" 7 14;' ] )
+		self.assertRaises( KeyError, self.keys.numKeys, "a" )
+		self.keys.flush()
+		self.assertEqual( self.lines()[-2:], [ 'select -ne "b";', 'setAttr ".ktv[6:6]" 7 -7;' ] )
+		# Nothing is waiting, so flushing again writes nothing.
+		#
+		numLines = len( self.lines() )
+		self.keys.flush()
+		self.assertEqual( len( self.lines() ), numLines )
+
+class ConcatenateTest( unittest.TestCase ):
+	
+	def setUp( self ):
+		self.directory = tempfile.mkdtemp()
+	
+	def tearDown( self ):
+		shutil.rmtree( self.directory )
+	
+	def writeShard( self, name, nodeName ):
+		path = os.path.join( self.directory, name )
+		stream = open( path, "w" )
+		try:
+			writer = ns.py.MayaAscii.Writer( stream )
+			writer.header( path )
+			writer.comment( "a comment" )
+			writer.createNode( "transform", nodeName )
+			writer.setAttr( ".t", [ 1.0, 2.0, 3.0 ], "double3" )
+			writer.end( path )
+		finally:
+			stream.close()
+		return path
+	
+	def testConcatenate( self ):
+		paths = [ self.writeShard( "a.ma", "s0_a" ), self.writeShard( "b.ma", "s1_b" ) ]
+		merged = os.path.join( self.directory, "merged.ma" )
+		ns.py.MayaAscii.concatenate( paths, merged )
+		lines = open( merged ).read().splitlines()
+		self.assertEqual( lines[:2], [ "//Maya ASCII scene", "//Name: merged.ma" ] )
+		self.assertEqual( lines[-1], "// End of merged.ma" )
+		# The shards' own comments are dropped and only the first
+		# currentUnit is kept.
+		#
+		self.assertEqual( lines[2:-1], [ "currentUnit -l centimeter -a degree -t film;",
+										 'createNode transform -n "s0_a";',
+										 'setAttr ".t" -type "double3" 1 2 3;',
+										 'createNode transform -n "s1_b";',
+										 'setAttr ".t" -type "double3" 1 2 3;' ] )
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,201 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "python" ) )
+
+import ns.py.Errors
+import ns.py.ParticleCache
+
+kTicksPerFrame = 250
+
+def _pdcAttribute( name, dataType, format, values ):
+	return struct.pack( ">i", len( name ) ) + name + struct.pack( ">i", dataType ) + struct.pack( ">" + format * len( values ), *values )
+
+def _writePdc( path, numParticles, attributes ):
+	file = open( path, "wb" )
+	try:
+		file.write( struct.pack( ">4s6i", "PDC ", 1, 1, 0, 0, numParticles, len( attributes ) ) )
+		for attribute in attributes:
+			file.write( _pdcAttribute( *attribute ) )
+	finally:
+		file.close()
+
+def _pad( data, is64 ):
+	align = ( is64 and 8 ) or 4
+	return data + "\0" * ((align - len( data ) % align) % align)
+
+def _chunk( tag, data, is64 ):
+	'''A chunk: tag, size and data padded to the alignment. FOR8 files
+	   follow each tag with 4 bytes of padding and an 8-byte size.'''
+	if is64:
+		header = tag + "\0\0\0\0" + struct.pack( ">Q", len( data ) )
+	else:
+		header = tag + struct.pack( ">I", len( data ) )
+	return header + _pad( data, is64 )
+
+def _group( groupType, chunks, is64 ):
+	tag = ( is64 and "FOR8" ) or "FOR4"
+	return _chunk( tag, _pad( groupType, is64 ) + "".join( chunks ), is64 )
+
+def _header( is64 ):
+	return _group( "CACH", [ _chunk( "VRSN", "0.1\0", is64 ),
+							 _chunk( "STIM", struct.pack( ">i", kTicksPerFrame ), is64 ),
+							 _chunk( "ETIM", struct.pack( ">i", 3 * kTicksPerFrame ), is64 ) ], is64 )
+
+def _block( ids, positions, radii, is64, ticks=None ):
+	'''One time's channels: ids as doubles, positions as float vectors
+	   and radii as floats.'''
+	chunks = []
+	if ticks is not None:
+		chunks.append( _chunk( "TIME", struct.pack( ">i", ticks ), is64 ) )
+	for (name, tag, format, values, count) in ( ("particleShape1_id", "DBLA", "d", ids, len( ids )),
+												("particleShape1_position", "FVCA", "f", positions, len( ids )),
+												("particleShape1_radius", "FBCA", "f", radii, len( ids )) ):
+		chunks.append( _chunk( "CHNM", name + "\0", is64 ) )
+		chunks.append( _chunk( "SIZE", struct.pack( ">I", count ), is64 ) )
+		chunks.append( _chunk( tag, struct.pack( ">" + format * len( values ), *values ), is64 ) )
+	return _group( "MYCH", chunks, is64 )
+
+kDescription = """<?xml version="1.0"?>
+<Autodesk_Cache_File>
+  <cacheType Type="%s" Format="%s"/>
+  <time Range="250-750"/>
+  <cacheTimePerFrame TimePerFrame="250"/>
+  <cacheVersion Version="2.0"/>
+  <Channels>
+    <channel0 ChannelName="particleShape1_id" ChannelType="DoubleArray" ChannelInterpretation="id" SamplingType="Regular" SamplingRate="250" StartTime="250" EndTime="750"/>
+    <channel1 ChannelName="particleShape1_position" ChannelType="FloatVectorArray" ChannelInterpretation="position" SamplingType="Regular" SamplingRate="250" StartTime="250" EndTime="750"/>
+    <channel2 ChannelName="particleShape1_radius" ChannelType="FloatArray" SamplingType="Regular" SamplingRate="250" StartTime="250" EndTime="750"/>
+  </Channels>
+</Autodesk_Cache_File>
+"""
+
+# The particles at each cached time: (ticks, ids, positions, radii).
+# The last time is between frames.
+#
+kFrames = ( (250, [ 1.0 ], [ 0.5, 1.0, 1.5 ], [ 0.25 ]),
+			(500, [ 1.0, 2.0 ], [ 1.0, 2.0, 3.0, -1.0, -2.0, -3.0 ], [ 0.5, 0.75 ]),
+			(625, [ 2.0 ], [ 4.0, 5.0, 6.0 ], [ 1.25 ]) )
+
+class ParticleCacheTest( unittest.TestCase ):
+	
+	def setUp( self ):
+		self.directory = tempfile.mkdtemp()
+	
+	def tearDown( self ):
+		shutil.rmtree( self.directory )
+	
+	def checkCache( self, cache ):
+		self.assertEqual( cache.times(), [ 250, 500, 625 ] )
+		self.assertRaises( ns.py.Errors.OutOfBoundsError, cache.sample, 249 )
+		for (ticks, ids, positions, radii) in kFrames:
+			sample = cache.sample( ticks )
+			self.assertEqual( sample.ticks, ticks )
+			self.assertEqual( list( sample.ids() ), ids )
+			self.assertEqual( list( sample.array( "position" ) ), positions )
+			self.assertTrue( sample.isVector( "position" ) )
+			self.assertEqual( list( sample.array( "radius" ) ), radii )
+			self.assertFalse( sample.isVector( "radius" ) )
+		# Between and after the cached times the latest earlier one is
+		# used.
+		#
+		self.assertEqual( cache.sample( 600 ).ticks, 500 )
+		self.assertEqual( list( cache.sample( 1000 ).ids() ), [ 2.0 ] )
+	
+	def checkFloatConversion( self, cache ):
+		sample = cache.sample( 500 )
+		self.assertEqual( sample.array( "position" ).typecode, 'd' )
+		self.assertEqual( sample.array( "radius" ).typecode, 'd' )
+	
+	def writeNCache( self, cacheType, format ):
+		is64 = ( "mcx" == format )
+		if "OneFile" == cacheType:
+			data = _header( is64 ) + "".join( [ _block( ids, positions, radii, is64, ticks )
+												for (ticks, ids, positions, radii) in kFrames ] )
+			self.writeFile( "particleShape1.%s" % format, data )
+		else:
+			for (ticks, ids, positions, radii) in kFrames:
+				name = "particleShape1Frame%d" % (ticks / kTicksPerFrame)
+				if ticks % kTicksPerFrame:
+					name += "Tick%d" % (ticks % kTicksPerFrame)
+				self.writeFile( "%s.%s" % (name, format), _header( is64 ) + _block( ids, positions, radii, is64 ) )
+		return self.writeFile( "particleShape1.xml", kDescription % (cacheType, format) )
+	
+	def writeFile( self, name, data ):
+		path = os.path.join( self.directory, name )
+		file = open( path, "wb" )
+		try:
+			file.write( data )
+		finally:
+			file.close()
+		return path
+	
+	def testPdc( self ):
+		for (ticks, ids, positions, radii) in kFrames:
+			_writePdc( os.path.join( self.directory, "particleShape1.%d.pdc" % ticks ), len( ids ),
+					   [ ("id", ns.py.ParticleCache.ePdcType.doubleArray, "d", ids),
+						 ("position", ns.py.ParticleCache.ePdcType.vectorArray, "d", positions),
+						 ("radius", ns.py.ParticleCache.ePdcType.doubleArray, "d", radii),
+						 ("group", ns.py.ParticleCache.ePdcType.intArray, "i", [ 7 ] * len( ids )),
+						 ("lifespan", ns.py.ParticleCache.ePdcType.doubleValue, "d", [ 2.5 ]) ] )
+		# Another particle system's cache in the same directory.
+		#
+		_writePdc( os.path.join( self.directory, "particleShape2.100.pdc" ), 0, [] )
+		cache = ns.py.ParticleCache.openCache( os.path.join( self.directory, "particleShape1.500.pdc" ) )
+		self.checkCache( cache )
+		sample = cache.sample( 500 )
+		self.assertEqual( list( sample.array( "group" ) ), [ 7.0, 7.0 ] )
+		self.assertEqual( sample.array( "group" ).typecode, 'd' )
+		self.assertEqual( list( sample.array( "lifespan" ) ), [ 2.5, 2.5 ] )
+	
+	def testMccFilePerFrame( self ):
+		cache = ns.py.ParticleCache.openCache( self.writeNCache( "OneFilePerFrame", "mcc" ) )
+		self.checkCache( cache )
+		self.checkFloatConversion( cache )
+	
+	def testMccOneFile( self ):
+		cache = ns.py.ParticleCache.openCache( self.writeNCache( "OneFile", "mcc" ) )
+		self.checkCache( cache )
+		self.checkFloatConversion( cache )
+	
+	def testMcxFilePerFrame( self ):
+		cache = ns.py.ParticleCache.openCache( self.writeNCache( "OneFilePerFrame", "mcx" ) )
+		self.checkCache( cache )
+		self.checkFloatConversion( cache )
+	
+	def testMcxOneFile( self ):
+		cache = ns.py.ParticleCache.openCache( self.writeNCache( "OneFile", "mcx" ) )
+		self.checkCache( cache )
+	
+	def testBadNames( self ):
+		self.assertRaises( ns.py.Errors.BadArgumentError, ns.py.ParticleCache.openCache, "particles.mc" )
+		self.assertRaises( ns.py.Errors.BadArgumentError, ns.py.ParticleCache.openCache, "particles.pdc" )
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,81 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import array
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "python" ) )
+
+import ns.py.PointCache
+
+class PointCacheTest( unittest.TestCase ):
+	
+	def setUp( self ):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join( self.directory, "test.nspc" )
+		self.frames = [ [ 0.0, 1.0, 2.0, -3.0, 4.5, 0.1 ],
+						[ 1.0, 3.0, 2.0, 3.0, -4.5, 0.7 ],
+						[ 2.0, 2.0, 5.0, 0.25, 0.0, 1.3 ] ]
+		writer = ns.py.PointCache.PointCacheWriter( self.path, 2, len( self.frames ), 10.0, 0.5 )
+		for (i, points) in enumerate( self.frames ):
+			writer.setFrame( i, points )
+		writer.close()
+		self.cache = ns.py.PointCache.PointCache( self.path )
+	
+	def tearDown( self ):
+		self.cache.close()
+		shutil.rmtree( self.directory )
+	
+	def expected( self, index, weight ):
+		before = array.array( 'f', self.frames[index] )
+		after = array.array( 'f', self.frames[index + 1] )
+		for i in range( len( before ) ):
+			before[i] += (after[i] - before[i]) * weight
+		return before
+	
+	def check( self ):
+		self.assertEqual( self.cache.points( 9.0 ), array.array( 'f', self.frames[0] ) )
+		self.assertEqual( self.cache.points( 10.5 ), array.array( 'f', self.frames[1] ) )
+		self.assertEqual( self.cache.points( 12.0 ), array.array( 'f', self.frames[2] ) )
+		self.assertEqual( self.cache.points( 10.1 ), self.expected( 0, 0.2 ) )
+		self.assertEqual( self.cache.points( 10.85 ), self.expected( 1, (10.85 - 10.0) / 0.5 - 1 ) )
+		self.assertEqual( ns.py.PointCache.blend( [ 1.0, 2.0, 3.0 ], array.array( 'f', [ 3.0, 2.0, 0.0 ] ), 0.25 ),
+						  array.array( 'f', [ 1.5, 2.0, 2.25 ] ) )
+		self.assertEqual( ns.py.PointCache.blend( [], [], 0.5 ), array.array( 'f' ) )
+	
+	def testInterpolation( self ):
+		self.check()
+	
+	def testInterpolationWithoutNumpy( self ):
+		numpy = ns.py.PointCache.numpy
+		ns.py.PointCache.numpy = None
+		try:
+			self.check()
+		finally:
+			ns.py.PointCache.numpy = numpy
+
+if __name__ == "__main__":
+	unittest.main()
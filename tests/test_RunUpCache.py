@@ -0,0 +1,116 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+#
+# Checks that a run up restored from a RunUpCache simulates exactly like a
+# full run up. Needs Maya: run with mayapy. Skipped under plain Python.
+#
+
+import os
+import sys
+import unittest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "python" ) )
+
+try:
+	import maya.standalone
+except ImportError, e:
+	maya = None
+
+
+kRunUpFrame = 10
+kNumFrames = 6
+
+@unittest.skipIf( maya is None, "needs mayapy" )
+class RunUpCacheTest( unittest.TestCase ):
+	
+	@classmethod
+	def setUpClass( cls ):
+		maya.standalone.initialize( name="python" )
+	
+	def _particle( self, emitter=False ):
+		import maya.cmds as mc
+		from maya.OpenMaya import MSelectionList, MDagPath
+		mc.file( new=True, force=True )
+		mc.playbackOptions( minTime=1, animationStartTime=1 )
+		points = [ (x, 0.0, z) for x in range( 5 ) for z in range( 5 ) ]
+		(transform, shape) = mc.particle( p=points )
+		mc.setAttr( shape + ".startFrame", 1 )
+		(gravity,) = mc.gravity()
+		mc.connectDynamic( transform, fields=gravity )
+		if emitter:
+			emitterNode = mc.emitter( position=(0, 0, 0), type="omni", rate=50 )[-1]
+			mc.connectDynamic( transform, emitters=emitterNode )
+		selection = MSelectionList()
+		selection.add( shape )
+		dpParticle = MDagPath()
+		selection.getDagPath( 0, dpParticle )
+		return dpParticle
+	
+	def _simulate( self, dpParticle ):
+		'''The ids and positions on the kNumFrames frames after the run up.'''
+		from maya.OpenMaya import MIntArray, MVectorArray, MTime
+		from maya.OpenMayaAnim import MAnimControl
+		from maya.OpenMayaFX import MFnParticleSystem
+		frames = []
+		for frame in range( kRunUpFrame, kRunUpFrame + kNumFrames ):
+			MAnimControl.setCurrentTime( MTime( frame, MTime.uiUnit() ) )
+			fParticle = MFnParticleSystem( dpParticle )
+			ids = MIntArray()
+			positions = MVectorArray()
+			fParticle.particleIds( ids )
+			fParticle.position( positions )
+			frames.append( ( list( ids ),
+							 [ (round( positions[i].x, 6 ), round( positions[i].y, 6 ), round( positions[i].z, 6 ))
+							   for i in range( positions.length() ) ] ) )
+		return frames
+	
+	def testRestoredRunUpMatchesFullRunUp( self ):
+		import ns.maya.ParticleUtil
+		import ns.maya.RunUpCache
+		dpParticle = self._particle()
+		self.assertTrue( ns.maya.RunUpCache.isRestorable( dpParticle ) )
+		cache = ns.maya.RunUpCache.RunUpCache()
+		
+		self.assertEqual( ns.maya.ParticleUtil.runUpTo( dpParticle, kRunUpFrame, cache ), None )
+		self.assertTrue( cache.numBytes() > 0 )
+		expected = self._simulate( dpParticle )
+		
+		swap = ns.maya.ParticleUtil.runUpTo( dpParticle, kRunUpFrame, cache )
+		self.assertNotEqual( swap, None )
+		try:
+			actual = self._simulate( dpParticle )
+		finally:
+			swap.restore()
+		self.assertEqual( actual, expected )
+	
+	def testEmittersAreNotCached( self ):
+		import ns.maya.ParticleUtil
+		import ns.maya.RunUpCache
+		dpParticle = self._particle( emitter=True )
+		self.assertFalse( ns.maya.RunUpCache.isRestorable( dpParticle ) )
+		cache = ns.maya.RunUpCache.RunUpCache()
+		self.assertEqual( ns.maya.ParticleUtil.runUpTo( dpParticle, kRunUpFrame, cache ), None )
+		self.assertEqual( cache.numBytes(), 0 )
+
+if __name__ == "__main__":
+	unittest.main()
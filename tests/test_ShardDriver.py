@@ -0,0 +1,173 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "python" ) )
+
+import ns.py.CaptureStore
+import ns.py.Errors
+import ns.py.ShardDriver
+
+kStandInWorker = [ sys.executable, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "StandInWorker.py" ) ]
+
+def captureContents( path ):
+	store = ns.py.CaptureStore.CaptureStore( path )
+	try:
+		frames = []
+		for i in range( store.numFrames() ):
+			frame = store.frame( i )
+			frames.append( (frame.time, list( frame.ids ), list( frame.objectIndices ), list( frame.matrices )) )
+		return frames
+	finally:
+		store.close()
+
+class ChunkRangesTest( unittest.TestCase ):
+	
+	def testEvenSplit( self ):
+		self.assertEqual( ns.py.ShardDriver.chunkRanges( 1, 9, 1, 3 ), [ (1, 3), (4, 6), (7, 9) ] )
+	
+	def testRemainderGoesToFirstChunks( self ):
+		self.assertEqual( ns.py.ShardDriver.chunkRanges( 1, 10, 1, 3 ), [ (1, 4), (5, 7), (8, 10) ] )
+	
+	def testChunksStayOnTheFrameStep( self ):
+		self.assertEqual( ns.py.ShardDriver.chunkRanges( 1, 10, 2, 3 ), [ (1, 3), (5, 7), (9, 9) ] )
+	
+	def testMoreChunksThanFrames( self ):
+		self.assertEqual( ns.py.ShardDriver.chunkRanges( 1, 2, 1, 5 ), [ (1, 1), (2, 2) ] )
+	
+	def testSingleFrame( self ):
+		self.assertEqual( ns.py.ShardDriver.chunkRanges( 7, 7, 3, 4 ), [ (7, 7) ] )
+	
+	def testEndBetweenSteps( self ):
+		self.assertEqual( ns.py.ShardDriver.chunkRanges( 0, 5, 2, 2 ), [ (0, 2), (4, 4) ] )
+	
+	def testNegativeFrames( self ):
+		self.assertEqual( ns.py.ShardDriver.chunkRanges( -5, 4, 1, 2 ), [ (-5, -1), (0, 4) ] )
+	
+	def testBadRanges( self ):
+		self.assertRaises( ns.py.Errors.BadArgumentError, ns.py.ShardDriver.chunkRanges, 5, 1, 1, 2 )
+		self.assertRaises( ns.py.Errors.BadArgumentError, ns.py.ShardDriver.chunkRanges, 1, 5, 0, 2 )
+
+class CaptureDriverTest( unittest.TestCase ):
+	
+	def setUp( self ):
+		self.directory = tempfile.mkdtemp()
+	
+	def tearDown( self ):
+		shutil.rmtree( self.directory )
+	
+	def _run( self, numChunks, name, flags="" ):
+		driver = ns.py.ShardDriver.CaptureDriver( numChunks, kStandInWorker )
+		return driver.run( "scene.mb", "NimbleTools.py", [ "instancer1" ], flags, "cache.xml",
+						   1, 37, 2, os.path.join( self.directory, name ) )
+	
+	def testJoinedCaptureMatchesContinuousCapture( self ):
+		continuous = captureContents( self._run( 1, "continuous.nscs" ) )
+		joined = captureContents( self._run( 4, "joined.nscs" ) )
+		self.assertEqual( len( continuous ), 19 )
+		self.assertEqual( joined, continuous )
+	
+	def testChunkCapturesAreRemoved( self ):
+		self._run( 3, "joined.nscs" )
+		self.assertEqual( os.listdir( self.directory ), [ "joined.nscs" ] )
+	
+	def testNeedsParticleCache( self ):
+		driver = ns.py.ShardDriver.CaptureDriver( 2, kStandInWorker )
+		self.assertRaises( ns.py.Errors.BadArgumentError, driver.run,
+						   "scene.mb", "NimbleTools.py", [], "", "", 1, 10, 1,
+						   os.path.join( self.directory, "out.nscs" ) )
+	
+	def testFailedChunk( self ):
+		self.assertRaises( ns.py.Errors.Error, self._run, 2, "out.nscs", "-fail" )
+		self.assertEqual( os.listdir( self.directory ), [] )
+
+class ShardDriverTest( unittest.TestCase ):
+	
+	def setUp( self ):
+		self.directory = tempfile.mkdtemp()
+		self.output = os.path.join( self.directory, "merged.ma" )
+	
+	def tearDown( self ):
+		if os.environ.has_key( "STAND_IN_DIVERGE" ):
+			del os.environ["STAND_IN_DIVERGE"]
+		shutil.rmtree( self.directory )
+	
+	def _run( self, numShards, flags="" ):
+		driver = ns.py.ShardDriver.ShardDriver( numShards, kStandInWorker )
+		return driver.run( "scene.mb", "NimbleTools.py", [ "instancer1" ], flags, self.output )
+	
+	def testMergedOutput( self ):
+		self.assertEqual( self._run( 3 ), self.output )
+		lines = open( self.output ).read().splitlines()
+		nodes = [ line for line in lines if line.startswith( "createNode " ) ]
+		self.assertEqual( len( nodes ), 40 )
+		self.assertEqual( nodes[:2], [ 'createNode transform -n "particle_s0_0";',
+									   'createNode transform -n "particle_s0_3";' ] )
+		self.assertEqual( nodes[-1], 'createNode transform -n "particle_s2_38";' )
+		self.assertEqual( len( [ line for line in lines if line.startswith( "currentUnit " ) ] ), 1 )
+		self.assertFalse( [ line for line in lines if line.startswith( "//shard" ) ] )
+		# The shards' outputs and hashes are removed.
+		#
+		self.assertEqual( os.listdir( self.directory ), [ "merged.ma" ] )
+	
+	def testDivergedShard( self ):
+		os.environ["STAND_IN_DIVERGE"] = "2"
+		try:
+			self._run( 3 )
+		except ns.py.Errors.Error, e:
+			self.assertEqual( str( e ), "Shard 2's simulation differs from shard 0's at frame 3." )
+		else:
+			self.fail( "The diverged shard wasn't detected." )
+		self.assertEqual( os.listdir( self.directory ), [] )
+	
+	def testFailedShard( self ):
+		self.assertRaises( ns.py.Errors.Error, self._run, 2, "-fail" )
+		self.assertEqual( os.listdir( self.directory ), [] )
+	
+	def testShardsBakeDifferentFrameCounts( self ):
+		paths = []
+		for (name, numFrames) in ( ("a.hash", 3), ("b.hash", 2) ):
+			path = os.path.join( self.directory, name )
+			stream = open( path, "w" )
+			for frame in range( 1, numFrames + 1 ):
+				stream.write( "%d %d\n" % (frame, frame * 7) )
+			stream.close()
+			paths.append( path )
+		driver = ns.py.ShardDriver.ShardDriver( 2, kStandInWorker )
+		self.assertRaises( ns.py.Errors.Error, driver._checkHashes, paths )
+		driver._checkHashes( [ paths[0], paths[0] ] )
+	
+	def testKeyToleranceIsRejected( self ):
+		self.assertRaises( ns.py.Errors.BadArgumentError, self._run, 2, "-bakeType 1 -keyTolerance 0.01 0.1 0.01" )
+		self.assertRaises( ns.py.Errors.BadArgumentError, self._run, 2, "-ktl 0.01 0.1 0.01" )
+		self.assertEqual( os.listdir( self.directory ), [] )
+	
+	def testNeedsAShard( self ):
+		self.assertRaises( ns.py.Errors.BadArgumentError, ns.py.ShardDriver.ShardDriver, 0 )
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,204 @@
+# The MIT License
+#	
+# Copyright (c) 2009 James Piechota
+#	
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.	
+
+import array
+import ctypes
+import math
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "python" ) )
+
+import ns.py.Transform
+numpy = ns.py.Transform.numpy
+
+try:
+	import maya.standalone
+except ImportError, e:
+	maya = None
+
+def _rotation( axis, angle ):
+	'''Maya's rotation about an axis, for row vectors.'''
+	(c, s) = (math.cos( angle ), math.sin( angle ))
+	(j, k) = [ (1, 2), (2, 0), (0, 1) ][axis]
+	matrix = numpy.identity( 3 )
+	matrix[j, j] = c
+	matrix[j, k] = s
+	matrix[k, j] = -s
+	matrix[k, k] = c
+	return matrix
+
+def _compose( translate, rotate, scale, order ):
+	'''Scale, then rotate in order, then translate.'''
+	upper = numpy.diag( scale )
+	for axis in ns.py.Transform.kRotateOrderAxes[order]:
+		upper = numpy.dot( upper, _rotation( axis, rotate[axis] ) )
+	matrix = numpy.identity( 4 )
+	matrix[0:3, 0:3] = upper
+	matrix[3, 0:3] = translate
+	return matrix
+
+@unittest.skipIf( numpy is None, "needs numpy" )
+class DecomposeTest( unittest.TestCase ):
+	
+	def testRoundTrip( self ):
+		generator = random.Random( 7 )
+		expected = []
+		matrices = []
+		orders = []
+		for order in range( 6 ):
+			for i in range( 20 ):
+				translate = [ generator.uniform( -10.0, 10.0 ) for axis in range( 3 ) ]
+				rotate = [ generator.uniform( -3.0, 3.0 ) for axis in range( 3 ) ]
+				# The middle rotation is the one kept within +-90 degrees.
+				#
+				rotate[ns.py.Transform.kRotateOrderAxes[order][1]] = generator.uniform( -1.5, 1.5 )
+				scale = [ generator.uniform( 0.1, 5.0 ) for axis in range( 3 ) ]
+				expected.append( translate + rotate + scale )
+				matrices.append( _compose( translate, rotate, scale, order ) )
+				orders.append( order )
+		(result, valid) = ns.py.Transform.decompose( matrices, orders )
+		self.assertTrue( valid.all() )
+		self.assertTrue( numpy.allclose( result, expected ) )
+	
+	def testUnhandled( self ):
+		sheared = _compose( [0.0, 0.0, 0.0], [0.1, 0.2, 0.3], [1.0, 1.0, 1.0], 0 )
+		sheared[1, 0] += 0.5
+		negative = _compose( [0.0, 0.0, 0.0], [0.1, 0.2, 0.3], [1.0, 1.0, -1.0], 0 )
+		zero = _compose( [0.0, 0.0, 0.0], [0.1, 0.2, 0.3], [1.0, 0.0, 1.0], 0 )
+		gimbal = _compose( [0.0, 0.0, 0.0], [0.1, math.pi / 2.0, 0.3], [1.0, 1.0, 1.0], 0 )
+		plain = _compose( [1.0, 2.0, 3.0], [0.1, 0.2, 0.3], [1.0, 2.0, 3.0], 0 )
+		(result, valid) = ns.py.Transform.decompose( [ sheared, negative, zero, gimbal, plain ], [0] * 5 )
+		self.assertEqual( valid.tolist(), [ False, False, False, False, True ] )
+
+@unittest.skipIf( numpy is None or maya is None, "needs numpy and mayapy" )
+class MayaDecomposeTest( unittest.TestCase ):
+	'''The vectorized decomposition against the MTransformationMatrix one
+	   Instancer.decompose() falls back to.'''
+	
+	@classmethod
+	def setUpClass( cls ):
+		maya.standalone.initialize( name="python" )
+	
+	def testMatchesTransformationMatrix( self ):
+		import maya.OpenMaya as om
+		generator = random.Random( 11 )
+		for order in range( 6 ):
+			for i in range( 20 ):
+				translate = [ generator.uniform( -10.0, 10.0 ) for axis in range( 3 ) ]
+				rotate = [ generator.uniform( -3.0, 3.0 ) for axis in range( 3 ) ]
+				scale = [ generator.uniform( 0.1, 5.0 ) for axis in range( 3 ) ]
+				values = _compose( translate, rotate, scale, order ).ravel().tolist()
+				matrix = om.MMatrix()
+				om.MScriptUtil.createMatrixFromList( values, matrix )
+				transformation = om.MTransformationMatrix( matrix )
+				t = transformation.getTranslation( om.MSpace.kTransform )
+				r = transformation.eulerRotation()
+				r.reorderIt( order )
+				scaleUtil = om.MScriptUtil()
+				scaleUtil.createFromDouble( 0.0, 0.0, 0.0 )
+				scalePtr = scaleUtil.asDoublePtr()
+				transformation.getScale( scalePtr, om.MSpace.kTransform )
+				expected = [ t.x, t.y, t.z, r.x, r.y, r.z ] + [ om.MScriptUtil.getDoubleArrayItem( scalePtr, axis ) for axis in range( 3 ) ]
+				(result, valid) = ns.py.Transform.decompose( [ values ], [ order ] )
+				self.assertTrue( valid[0] )
+				self.assertTrue( numpy.allclose( result[0], expected ), (order, result[0], expected) )
+
+class _Matrix:
+	'''Stands in for an MMatrix: called with (row, column) and this is
+	   the address of its values, or of other memory if misplaced.'''
+	
+	def __init__( self, values, misplaced=False ):
+		self._values = (ctypes.c_double * 16)( *values )
+		self._other = (ctypes.c_double * 16)()
+		self.this = ctypes.addressof( misplaced and self._other or self._values )
+	
+	def __call__( self, row, column ):
+		return self._values[row * 4 + column]
+
+class _MatrixArray:
+	
+	def __init__( self, matrices ):
+		self._matrices = matrices
+	
+	def length( self ):
+		return len( self._matrices )
+	
+	def __getitem__( self, i ):
+		return self._matrices[i]
+
+class MatrixArrayValuesTest( unittest.TestCase ):
+	
+	def setUp( self ):
+		generator = random.Random( 5 )
+		self.values = [ generator.uniform( -10.0, 10.0 ) for i in range( 16 * 20 ) ]
+		ns.py.Transform.setMatrixCopyEnabled( None )
+	
+	def tearDown( self ):
+		ns.py.Transform.setMatrixCopyEnabled( None )
+	
+	def matrices( self, misplaced=False ):
+		return _MatrixArray( [ _Matrix( self.values[i:i+16], misplaced ) for i in range( 0, len( self.values ), 16 ) ] )
+	
+	def testCopied( self ):
+		self.assertEqual( ns.py.Transform.matrixArrayValues( self.matrices() ), array.array( 'd', self.values ) )
+		self.assertTrue( ns.py.Transform._copyMatrices )
+	
+	def testMisplacedValuesAreReadOneByOne( self ):
+		self.assertEqual( ns.py.Transform.matrixArrayValues( self.matrices( True ) ), array.array( 'd', self.values ) )
+		self.assertFalse( ns.py.Transform._copyMatrices )
+		# The check is only made once.
+		#
+		self.assertEqual( ns.py.Transform.matrixArrayValues( self.matrices() ), array.array( 'd', self.values ) )
+		self.assertFalse( ns.py.Transform._copyMatrices )
+	
+	def testWithoutCtypes( self ):
+		module = ns.py.Transform.ctypes
+		ns.py.Transform.ctypes = None
+		try:
+			self.assertEqual( ns.py.Transform.matrixArrayValues( self.matrices() ), array.array( 'd', self.values ) )
+		finally:
+			ns.py.Transform.ctypes = module
+	
+	def testEmpty( self ):
+		self.assertEqual( ns.py.Transform.matrixArrayValues( _MatrixArray( [] ) ), array.array( 'd' ) )
+		self.assertEqual( ns.py.Transform._copyMatrices, None )
+	
+	@unittest.skipIf( maya is None, "needs mayapy" )
+	def testMayaMatrices( self ):
+		maya.standalone.initialize( name="python" )
+		import maya.OpenMaya as om
+		matrices = om.MMatrixArray()
+		for i in range( 0, len( self.values ), 16 ):
+			matrix = om.MMatrix()
+			om.MScriptUtil.createMatrixFromList( self.values[i:i+16], matrix )
+			matrices.append( matrix )
+		self.assertEqual( ns.py.Transform.matrixArrayValues( matrices ), array.array( 'd', self.values ) )
+		# MMatrix keeps its values in its only member, so they can be
+		# copied from memory.
+		#
+		self.assertTrue( ns.py.Transform._copyMatrices )
+
+if __name__ == "__main__":
+	unittest.main()